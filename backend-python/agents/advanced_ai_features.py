@@ -14,6 +14,7 @@ from dataclasses import dataclass
 from sklearn.ensemble import RandomForestRegressor, GradientBoostingRegressor
 from sklearn.cluster import KMeans
 from sklearn.preprocessing import StandardScaler
+from sklearn.base import clone
 from sklearn.metrics import mean_absolute_error, mean_squared_error
 import warnings
 warnings.filterwarnings('ignore')
@@ -245,15 +246,20 @@ class AdvancedAIFeatures:
             # Prepare features for clustering
             features = self._prepare_customer_features(customer_data)
             
+            # Fit unfitted copies per call: concurrent requests must not refit
+            # the shared scaler and model while another request reads them
+            scaler = clone(self.scaler)
+            segmentation_model = clone(self.customer_segmentation_model)
+            
             # Normalize features
-            features_scaled = self.scaler.fit_transform(features)
+            features_scaled = await asyncio.to_thread(scaler.fit_transform, features)
             
-            # Perform clustering
-            cluster_labels = self.customer_segmentation_model.fit_predict(features_scaled)
+            # Perform clustering (CPU-bound, so off the event loop)
+            cluster_labels = await asyncio.to_thread(segmentation_model.fit_predict, features_scaled)
             
             # Analyze clusters
             segments = []
-            for cluster_id in range(self.customer_segmentation_model.n_clusters):
+            for cluster_id in range(segmentation_model.n_clusters):
                 cluster_customers = [customer_data[i] for i, label in enumerate(cluster_labels) if label == cluster_id]
                 
                 if not cluster_customers:
@@ -349,12 +355,9 @@ class AdvancedAIFeatures:
             if not text_data:
                 return {"sentiment": "neutral", "confidence": 0.0, "analysis": "No text data provided"}
             
-            # Analyze sentiment for each text
-            sentiment_results = []
-            for text in text_data:
-                if text.strip():
-                    result = self.sentiment_analyzer(text)
-                    sentiment_results.append(result[0])
+            # Analyze all texts in one pipeline call, off the event loop
+            texts = [text for text in text_data if text.strip()]
+            sentiment_results = await asyncio.to_thread(self.sentiment_analyzer, texts) if texts else []
             
             if not sentiment_results:
                 return {"sentiment": "neutral", "confidence": 0.0, "analysis": "No valid text data"}
@@ -4,6 +4,8 @@ Advanced multi-agent system with specialized roles and collaborative workflows
 """
 
 from typing import Dict, List, Any, Optional
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
 from crewai import Agent, Task, Crew, Process
 from crewai.tools import BaseTool
 from crewai.llm import LLM
@@ -13,6 +15,13 @@ import os
 from datetime import datetime, timedelta
 import json
 
+# Crew.kickoff() is synchronous; run it on a bounded pool so it does not
+# block the event loop and crews can progress concurrently
+_CREW_EXECUTOR = ThreadPoolExecutor(
+    max_workers=int(os.getenv("CREW_MAX_WORKERS", "32")),
+    thread_name_prefix="crew"
+)
+
 # Initialize LLMs
 openai_llm = ChatOpenAI(
     model="gpt-4-turbo-preview",
@@ -237,9 +246,17 @@ class GroceryCrewAI:
         """Create prediction tools"""
         return []
     
+    async def _kickoff(self, crew_name: str) -> Any:
+        """Run a private copy of a crew on the executor pool"""
+        # Crews, tasks and agents hold per-run state (task outputs, agent
+        # executors), so concurrent runs each get their own deep copy
+        crew = self.crews[crew_name]
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(_CREW_EXECUTOR, lambda: crew.copy().kickoff())
+    
     async def optimize_inventory(self, store_id: str) -> Dict[str, Any]:
         """Run inventory optimization crew"""
-        result = self.crews["inventory_optimization"].kickoff()
+        result = await self._kickoff("inventory_optimization")
         return {
             "status": "success",
             "crew": "inventory_optimization",
@@ -249,7 +266,7 @@ class GroceryCrewAI:
     
     async def optimize_sales(self, store_id: str) -> Dict[str, Any]:
         """Run sales optimization crew"""
-        result = self.crews["sales_optimization"].kickoff()
+        result = await self._kickoff("sales_optimization")
         return {
             "status": "success",
             "crew": "sales_optimization",
@@ -259,7 +276,7 @@ class GroceryCrewAI:
     
     async def manage_operations(self, store_id: str) -> Dict[str, Any]:
         """Run operations management crew"""
-        result = self.crews["operations_management"].kickoff()
+        result = await self._kickoff("operations_management")
         return {
             "status": "success",
             "crew": "operations_management",
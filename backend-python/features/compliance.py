@@ -5,6 +5,7 @@ Compliance and regulatory features
 from typing import Dict, List, Any, Optional
 from sqlalchemy.orm import Session
 from datetime import datetime, timedelta
+from decimal import Decimal
 import logging
 import json
 
@@ -13,6 +14,9 @@ from .base_service import BaseService
 
 logger = logging.getLogger(__name__)
 
+# Allowed rounding difference when auditing movement costs
+COST_TOLERANCE = Decimal("0.01")
+
 class ComplianceService(BaseService):
     """Service for compliance and regulatory management"""
     
@@ -149,14 +153,14 @@ class ComplianceService(BaseService):
                 })
             
             if movement.total_cost and movement.unit_cost and movement.quantity:
-                expected_total = float(movement.unit_cost) * abs(movement.quantity)
-                actual_total = float(movement.total_cost)
-                if abs(expected_total - actual_total) > 0.01:  # Allow for small rounding differences
+                expected_total = Decimal(movement.unit_cost) * abs(movement.quantity)
+                actual_total = Decimal(movement.total_cost)
+                if (expected_total - actual_total).copy_abs() > COST_TOLERANCE:
                     audit_results['discrepancies'].append({
                         'movement_id': str(movement.id),
                         'issue': 'Cost calculation mismatch',
-                        'expected': expected_total,
-                        'actual': actual_total,
+                        'expected': float(expected_total),
+                        'actual': float(actual_total),
                         'timestamp': movement.created_at.isoformat()
                     })
         
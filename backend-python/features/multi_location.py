@@ -3,8 +3,8 @@ Multi-location support for grocery management system
 """
 
 from typing import Dict, List, Any, Optional
-from sqlalchemy.orm import Session
-from sqlalchemy import and_, or_, desc, func
+from sqlalchemy.orm import Session, undefer_group
+from sqlalchemy import and_, or_, desc, func, select
 from datetime import datetime
 import logging
 
@@ -27,6 +27,12 @@ class MultiLocationService(BaseService):
         """Get location by ID"""
         return self.db.query(Location).filter(Location.id == location_id).first()
     
+    def list_locations_lite(self) -> List[Any]:
+        """Get (id, name) rows for active locations without building ORM instances"""
+        return self.db.execute(
+            select(Location.id, Location.name).where(Location.is_active == True)
+        ).all()
+    
     def create_location(self, location_data: Dict[str, Any]) -> Location:
         """Create a new location"""
         location = Location(**location_data)
@@ -72,7 +78,8 @@ class MultiLocationService(BaseService):
         """Transfer inventory between locations"""
         try:
             # Check if source location has enough stock
-            product = self.db.query(Product).filter(
+            # Descriptive columns are copied to the destination row
+            product = self.db.query(Product).options(undefer_group('details')).filter(
                 and_(
                     Product.id == product_id,
                     Product.location_id == from_location_id
@@ -181,7 +188,7 @@ class MultiLocationService(BaseService):
     
     def get_cross_location_analytics(self) -> Dict[str, Any]:
         """Get analytics across all locations"""
-        locations = self.get_all_locations()
+        locations = self.list_locations_lite()
         analytics = {
             'total_locations': len(locations),
             'location_performance': [],
@@ -0,0 +1,25 @@
+"""
+Gunicorn configuration for the production multi-agent server
+"""
+
+import multiprocessing
+import os
+
+bind = os.getenv("BIND", "0.0.0.0:8000")
+
+# Each worker loads its own copy of the AI components, so allow the
+# worker count to be lowered on memory-constrained hosts
+workers = int(os.getenv("WEB_CONCURRENCY", multiprocessing.cpu_count() * 2 + 1))
+
+# UvicornWorker picks uvloop and httptools automatically when installed
+worker_class = "uvicorn.workers.UvicornWorker"
+worker_connections = 1024
+
+# Agent runs can take a while; don't kill workers mid-analysis
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "300"))
+graceful_timeout = 30
+keepalive = 5
+
+accesslog = "-"
+errorlog = "-"
+loglevel = os.getenv("LOG_LEVEL", "info")
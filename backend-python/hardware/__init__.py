@@ -3,17 +3,25 @@ Hardware integration package
 """
 
 from .barcode_scanner import BarcodeScanner, get_scanner, scan_barcode
-from .receipt_printer import ReceiptPrinter, get_printer, print_receipt
-from .cash_drawer import CashDrawer, get_cash_drawer, open_cash_drawer
+from .receipt_printer import (
+    ReceiptPrinter, PrintQueue, get_printer, get_print_queue,
+    print_receipt, print_receipt_sync, invalidate_default_printer_cache
+)
+from .cash_drawer import CashDrawer, get_cash_drawer, open_cash_drawer, open_cash_drawer_sync
 
 __all__ = [
     "BarcodeScanner",
     "get_scanner", 
     "scan_barcode",
     "ReceiptPrinter",
+    "PrintQueue",
     "get_printer",
+    "get_print_queue",
     "print_receipt",
+    "print_receipt_sync",
+    "invalidate_default_printer_cache",
     "CashDrawer",
     "get_cash_drawer",
-    "open_cash_drawer"
+    "open_cash_drawer",
+    "open_cash_drawer_sync"
 ]
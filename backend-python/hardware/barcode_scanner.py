@@ -5,13 +5,45 @@ Barcode scanner hardware integration
 import cv2
 import numpy as np
 from pyzbar import pyzbar
+from pyzbar.pyzbar import ZBarSymbol
 import logging
 from typing import Optional, List, Dict, Any
 import threading
+import queue
 import time
 
 logger = logging.getLogger(__name__)
 
+# Formats reported to API clients
+SUPPORTED_FORMATS = (
+    'CODE128',
+    'CODE39',
+    'EAN13',
+    'EAN8',
+    'UPC_A',
+    'UPC_E',
+    'QRCODE',
+    'DATAMATRIX',
+    'PDF417',
+    'CODABAR',
+    'I25'
+)
+
+# Symbologies zbar decodes from the formats above (it has no DATAMATRIX or
+# PDF417 decoder); restricting zbar to these skips the detectors for every
+# other format (DataBar, Code 93, ...) on each frame
+_DECODE_SYMBOLS = [
+    ZBarSymbol.EAN13,
+    ZBarSymbol.EAN8,
+    ZBarSymbol.UPCA,
+    ZBarSymbol.UPCE,
+    ZBarSymbol.CODE128,
+    ZBarSymbol.CODE39,
+    ZBarSymbol.QRCODE,
+    ZBarSymbol.CODABAR,
+    ZBarSymbol.I25,
+]
+
 class BarcodeScanner:
     """Hardware barcode scanner integration"""
     
@@ -21,6 +53,9 @@ class BarcodeScanner:
         self.is_scanning = False
         self.scan_callback = None
         self.scan_thread = None
+        self.decode_thread = None
+        # Holds only the freshest frame so decoding never falls behind capture
+        self.frame_queue: queue.Queue = queue.Queue(maxsize=1)
         
     def initialize_camera(self) -> bool:
         """Initialize camera for barcode scanning"""
@@ -54,8 +89,13 @@ class BarcodeScanner:
         
         self.scan_callback = callback
         self.is_scanning = True
-        self.scan_thread = threading.Thread(target=self._scan_loop)
-        self.scan_thread.daemon = True
+        self.scan_thread = threading.Thread(
+            target=self._scan_loop, name="barcode-capture", daemon=True
+        )
+        self.decode_thread = threading.Thread(
+            target=self._decode_loop, name="barcode-decode", daemon=True
+        )
+        self.decode_thread.start()
         self.scan_thread.start()
         
         logger.info("Barcode scanning started")
@@ -66,6 +106,15 @@ class BarcodeScanner:
         self.is_scanning = False
         if self.scan_thread:
             self.scan_thread.join(timeout=1)
+        if self.decode_thread:
+            self.decode_thread.join(timeout=1)
+        
+        # Discard any frame left behind by the capture thread
+        while not self.frame_queue.empty():
+            try:
+                self.frame_queue.get_nowait()
+            except queue.Empty:
+                break
         
         if self.camera:
             self.camera.release()
@@ -74,7 +123,7 @@ class BarcodeScanner:
         logger.info("Barcode scanning stopped")
     
     def _scan_loop(self):
-        """Main scanning loop"""
+        """Capture loop: read frames and hand the freshest one to the decoder"""
         while self.is_scanning and self.camera:
             try:
                 ret, frame = self.camera.read()
@@ -82,11 +131,37 @@ class BarcodeScanner:
                     logger.warning("Failed to read frame from camera")
                     continue
                 
+                # Drop the stale frame if the decoder hasn't picked it up yet
+                try:
+                    self.frame_queue.put_nowait(frame)
+                except queue.Full:
+                    try:
+                        self.frame_queue.get_nowait()
+                    except queue.Empty:
+                        pass
+                    self.frame_queue.put_nowait(frame)
+                
+                # Small delay to prevent excessive CPU usage
+                time.sleep(0.033)  # ~30 FPS
+                
+            except Exception as e:
+                logger.error(f"Error in scan loop: {e}")
+                time.sleep(0.1)
+    
+    def _decode_loop(self):
+        """Decode loop: runs pyzbar on captured frames in parallel with capture"""
+        while self.is_scanning:
+            try:
+                frame = self.frame_queue.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            
+            try:
                 # Convert frame to grayscale for better barcode detection
                 gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
                 
-                # Detect barcodes
-                barcodes = pyzbar.decode(gray)
+                # Detect barcodes (pyzbar releases the GIL while decoding)
+                barcodes = pyzbar.decode(gray, symbols=_DECODE_SYMBOLS)
                 
                 for barcode in barcodes:
                     if not self.is_scanning:
@@ -109,12 +184,8 @@ class BarcodeScanner:
                             'location': {'x': x, 'y': y, 'width': w, 'height': h}
                         })
                 
-                # Small delay to prevent excessive CPU usage
-                time.sleep(0.033)  # ~30 FPS
-                
             except Exception as e:
-                logger.error(f"Error in scan loop: {e}")
-                time.sleep(0.1)
+                logger.error(f"Error in decode loop: {e}")
     
     def scan_single(self) -> Optional[Dict[str, Any]]:
         """Scan a single barcode and return result"""
@@ -128,7 +199,7 @@ class BarcodeScanner:
                 return None
             
             gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-            barcodes = pyzbar.decode(gray)
+            barcodes = pyzbar.decode(gray, symbols=_DECODE_SYMBOLS)
             
             if barcodes:
                 barcode = barcodes[0]
@@ -146,19 +217,7 @@ class BarcodeScanner:
     
     def get_supported_formats(self) -> List[str]:
         """Get list of supported barcode formats"""
-        return [
-            'CODE128',
-            'CODE39',
-            'EAN13',
-            'EAN8',
-            'UPC_A',
-            'UPC_E',
-            'QRCODE',
-            'DATAMATRIX',
-            'PDF417',
-            'CODABAR',
-            'I25'
-        ]
+        return list(SUPPORTED_FORMATS)
     
     def test_scanner(self) -> Dict[str, Any]:
         """Test scanner functionality"""
@@ -2,25 +2,65 @@
 Cash drawer hardware integration
 """
 
+import asyncio
+import json
 import logging
+import os
 import serial
-import time
+import serial_asyncio
+from serial.tools import list_ports
 from typing import Dict, Any, Optional
 import platform
 
 logger = logging.getLogger(__name__)
 
+_IS_WINDOWS = platform.system() == "Windows"
+
+# USB vendor IDs of common ESC/POS printers/drawer interfaces
+# (Epson, Star Micronics, Citizen, Bixolon, Prolific/FTDI serial adapters)
+KNOWN_DRAWER_VIDS = {0x04B8, 0x0519, 0x1D90, 0x1504, 0x067B, 0x0403}
+
+# ESC/POS drawer kick commands, in the order they are tried by test_drawer
+PULSE_COMMANDS = [
+    b'\x1B\x70\x00\x19\xFA',  # ESC p 0 25 250ms
+    b'\x1B\x70\x01\x19\xFA',  # ESC p 1 25 250ms
+    b'\x07',  # Bell character (some drawers respond to this)
+]
+
+# Pulse command as hex (e.g. 1b70011afa); when set, it is the only one sent
+CASH_DRAWER_PULSE = os.getenv("CASH_DRAWER_PULSE")
+
+# Resolved port is cached on disk so later process starts skip enumeration;
+# a detected port is only persisted once the drawer has acknowledged a pulse
+PORT_CACHE_FILE = os.path.join(os.path.dirname(__file__), ".cash_drawer_cache.json")
+
 class CashDrawer:
     """Hardware cash drawer integration"""
     
     def __init__(self, port: str = None, baudrate: int = 9600):
         self.port = port
         self.baudrate = baudrate
-        self.connection = None
+        self.reader: Optional[asyncio.StreamReader] = None
+        self.writer: Optional[asyncio.StreamWriter] = None
         self.is_connected = False
+        # Private loop backing the *_sync shims so the serial transport
+        # stays bound to the same loop across calls
+        self._sync_loop: Optional[asyncio.AbstractEventLoop] = None
+        self._pulse_cmd: bytes = PULSE_COMMANDS[0]
+        self._pulse_verified: bool = False
+        self._unconfirmed_port: Optional[Dict[str, Any]] = None
         
-    def connect(self) -> bool:
+        cached = self._load_port_cache()
+        if CASH_DRAWER_PULSE:
+            self._pulse_cmd = bytes.fromhex(CASH_DRAWER_PULSE)
+            self._pulse_verified = True
+        elif cached and cached.get('pulse_cmd'):
+            self._pulse_cmd = bytes.fromhex(cached['pulse_cmd'])
+            self._pulse_verified = True
+        
+    async def connect(self) -> bool:
         """Connect to cash drawer"""
+        auto_detected = False
         try:
             if not self.port:
                 # Auto-detect port
@@ -28,74 +68,133 @@ class CashDrawer:
                 if not self.port:
                     logger.error("No cash drawer port detected")
                     return False
+                auto_detected = True
             
-            self.connection = serial.Serial(
-                port=self.port,
-                baudrate=self.baudrate,
-                timeout=1
+            self.reader, self.writer = await serial_asyncio.open_serial_connection(
+                url=self.port,
+                baudrate=self.baudrate
             )
             
-            if self.connection.is_open:
-                self.is_connected = True
-                logger.info(f"Connected to cash drawer on {self.port}")
-                return True
-            else:
-                logger.error(f"Failed to open connection to {self.port}")
-                return False
+            self.is_connected = True
+            logger.info(f"Connected to cash drawer on {self.port}")
+            return True
                 
         except Exception as e:
             logger.error(f"Error connecting to cash drawer: {e}")
+            if auto_detected:
+                # Cached port may be stale; re-detect on the next attempt
+                self._clear_port_cache()
+                self._unconfirmed_port = None
+                self.port = None
             return False
     
     def _detect_port(self) -> Optional[str]:
         """Auto-detect cash drawer port"""
         try:
-            if platform.system() == "Windows":
-                # Windows COM ports
-                for i in range(1, 10):
-                    port = f"COM{i}"
-                    try:
-                        test_conn = serial.Serial(port, self.baudrate, timeout=0.1)
-                        test_conn.close()
-                        return port
-                    except:
-                        continue
-            else:
-                # Linux/Mac USB serial ports
-                import glob
-                ports = glob.glob("/dev/ttyUSB*") + glob.glob("/dev/ttyACM*")
-                for port in ports:
-                    try:
-                        test_conn = serial.Serial(port, self.baudrate, timeout=0.1)
-                        test_conn.close()
-                        return port
-                    except:
-                        continue
+            cached = self._load_port_cache()
+            if cached and cached.get('port') and (
+                _IS_WINDOWS or os.path.exists(cached['port'])
+            ):
+                return cached['port']
             
-            return None
+            # Enumerate ports via the OS instead of opening each one
+            ports = list_ports.comports()
+            for port_info in ports:
+                if port_info.vid in KNOWN_DRAWER_VIDS:
+                    self._unconfirmed_port = self._port_identity(port_info)
+                    return port_info.device
+            
+            for port_info in ports:
+                description = (port_info.description or '').lower()
+                if 'pos' in description or 'printer' in description or 'drawer' in description:
+                    self._unconfirmed_port = self._port_identity(port_info)
+                    return port_info.device
+            
+            # No recognisable drawer; fall back to probing candidate ports
+            port = self._probe_ports()
+            if port:
+                self._unconfirmed_port = {'port': port}
+            return port
             
         except Exception as e:
             logger.error(f"Error detecting cash drawer port: {e}")
             return None
     
-    def open_drawer(self) -> bool:
+    def _probe_ports(self) -> Optional[str]:
+        """Probe candidate serial ports by opening each one"""
+        if _IS_WINDOWS:
+            # Windows COM ports
+            candidates = [f"COM{i}" for i in range(1, 10)]
+        else:
+            # Linux/Mac USB serial ports
+            import glob
+            candidates = glob.glob("/dev/ttyUSB*") + glob.glob("/dev/ttyACM*")
+        
+        for port in candidates:
+            try:
+                test_conn = serial.Serial(port, self.baudrate, timeout=0.1)
+                test_conn.close()
+                return port
+            except:
+                continue
+        
+        return None
+    
+    def _load_port_cache(self) -> Optional[Dict[str, Any]]:
+        """Load the cached drawer port from disk"""
+        try:
+            with open(PORT_CACHE_FILE, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+    
+    def _clear_port_cache(self) -> None:
+        """Remove the cached drawer port, keeping the verified pulse command"""
+        cache = self._load_port_cache() or {}
+        for key in ('port', 'vid', 'pid', 'serial_number'):
+            cache.pop(key, None)
+        self._write_cache(cache)
+    
+    @staticmethod
+    def _port_identity(port_info) -> Dict[str, Any]:
+        """Cache entry for a detected drawer port keyed by its USB identity"""
+        return {
+            'port': port_info.device,
+            'vid': port_info.vid,
+            'pid': port_info.pid,
+            'serial_number': port_info.serial_number
+        }
+    
+    def _confirm_port(self) -> None:
+        """Persist the auto-detected port once the drawer has acknowledged it"""
+        if self._unconfirmed_port:
+            self._update_cache(self._unconfirmed_port)
+            self._unconfirmed_port = None
+    
+    def _update_cache(self, values: Dict[str, Any]) -> None:
+        """Merge values into the on-disk drawer cache"""
+        cache = self._load_port_cache() or {}
+        cache.update(values)
+        self._write_cache(cache)
+    
+    def _write_cache(self, cache: Dict[str, Any]) -> None:
+        """Write the drawer cache to disk"""
+        try:
+            with open(PORT_CACHE_FILE, 'w', encoding='utf-8') as f:
+                json.dump(cache, f)
+        except OSError as e:
+            logger.warning(f"Could not write cash drawer port cache: {e}")
+    
+    async def open_drawer(self) -> bool:
         """Open the cash drawer"""
         if not self.is_connected:
-            if not self.connect():
+            if not await self.connect():
                 return False
         
         try:
-            # ESC/POS command to open cash drawer
-            # Different commands for different drawer types
-            commands = [
-                b'\x1B\x70\x00\x19\xFA',  # ESC p 0 25 250ms
-                b'\x1B\x70\x01\x19\xFA',  # ESC p 1 25 250ms
-                b'\x07',  # Bell character (some drawers respond to this)
-            ]
-            
-            for command in commands:
-                self.connection.write(command)
-                time.sleep(0.1)
+            # Single ESC/POS pulse; the OS buffers the write so no sleep is needed
+            self.writer.write(self._pulse_cmd)
+            await self.writer.drain()
             
             logger.info("Cash drawer opened")
             return True
@@ -119,14 +218,22 @@ class CashDrawer:
             logger.error(f"Error closing cash drawer: {e}")
             return False
     
-    def test_drawer(self) -> bool:
+    async def test_drawer(self) -> bool:
         """Test cash drawer functionality"""
         try:
-            if not self.connect():
+            # Close the current transport rather than leaking it on reconnect
+            self.disconnect()
+            if not await self.connect():
                 return False
             
-            # Test open command
-            success = self.open_drawer()
+            # Find which pulse command this drawer acknowledges; an
+            # auto-detected port is persisted only after that acknowledgement.
+            # The probe has already pulsed the drawer, so it is not opened again.
+            if not self._pulse_verified or self._unconfirmed_port:
+                success = await self._probe_pulse_command()
+            else:
+                # Test open command
+                success = await self.open_drawer()
             
             if success:
                 logger.info("Cash drawer test successful")
@@ -139,6 +246,28 @@ class CashDrawer:
             logger.error(f"Cash drawer test error: {e}")
             return False
     
+    async def _probe_pulse_command(self) -> bool:
+        """Send candidate pulse commands until one is acknowledged and remember it"""
+        # A verified or configured command is the only candidate
+        candidates = [self._pulse_cmd] if self._pulse_verified else PULSE_COMMANDS
+        for command in candidates:
+            self.writer.write(command)
+            await self.writer.drain()
+            try:
+                ack = await asyncio.wait_for(self.reader.read(1), timeout=0.1)
+            except asyncio.TimeoutError:
+                continue
+            if ack:
+                self._pulse_cmd = command
+                self._pulse_verified = True
+                self._update_cache({'pulse_cmd': command.hex()})
+                self._confirm_port()
+                logger.info(f"Cash drawer pulse command verified: {command!r}")
+                return True
+        
+        logger.warning(f"No pulse command acknowledged; using {self._pulse_cmd!r}")
+        return False
+    
     def get_status(self) -> Dict[str, Any]:
         """Get cash drawer status"""
         return {
@@ -150,10 +279,26 @@ class CashDrawer:
     
     def disconnect(self):
         """Disconnect from cash drawer"""
-        if self.connection and self.connection.is_open:
-            self.connection.close()
+        if self.writer:
+            self.writer.close()
+            self.reader = None
+            self.writer = None
             self.is_connected = False
             logger.info("Disconnected from cash drawer")
+    
+    def _run_sync(self, coro):
+        """Run a coroutine to completion for synchronous callers"""
+        if self._sync_loop is None:
+            self._sync_loop = asyncio.new_event_loop()
+        return self._sync_loop.run_until_complete(coro)
+    
+    def open_drawer_sync(self) -> bool:
+        """Synchronous wrapper around open_drawer for legacy callers"""
+        return self._run_sync(self.open_drawer())
+    
+    def test_drawer_sync(self) -> bool:
+        """Synchronous wrapper around test_drawer for legacy callers"""
+        return self._run_sync(self.test_drawer())
 
 # Global cash drawer instance
 drawer_instance = None
@@ -165,7 +310,12 @@ def get_cash_drawer() -> CashDrawer:
         drawer_instance = CashDrawer()
     return drawer_instance
 
-def open_cash_drawer() -> bool:
+async def open_cash_drawer() -> bool:
     """Convenience function to open cash drawer"""
     drawer = get_cash_drawer()
-    return drawer.open_drawer()
+    return await drawer.open_drawer()
+
+def open_cash_drawer_sync() -> bool:
+    """Synchronous convenience function to open cash drawer"""
+    drawer = get_cash_drawer()
+    return drawer.open_drawer_sync()
@@ -2,91 +2,166 @@
 Receipt printer hardware integration
 """
 
-import os
+import asyncio
 import logging
+import socket
 from typing import Dict, Any, List, Optional
 from datetime import datetime
-import subprocess
 import platform
 
 logger = logging.getLogger(__name__)
 
+_IS_WINDOWS = platform.system() == "Windows"
+
+if _IS_WINDOWS:
+    import win32print
+
+# JetDirect/RAW port accepted by network ESC/POS printers
+RAW_PRINT_PORT = 9100
+
+# ESC/POS control sequences
+INIT = b'\x1B@'
+CENTER = b'\x1Ba\x01'
+LEFT = b'\x1Ba\x00'
+BOLD_ON = b'\x1B!\x08'
+BOLD_OFF = b'\x1B!\x00'
+DOUBLE_SIZE = b'\x1B!\x38'  # Bold, double height, double width
+CUT = b'\x1DVB\x03'  # Feed 3 lines and cut paper
+DRAWER_KICK = b'\x1B\x70\x00\x19\xFA'  # Pulse the printer's DK connector (pin 2)
+NEWLINE = b'\n'
+SEPARATOR = BOLD_ON + b'--------------------------------\n' + BOLD_OFF
+
+# Footer is identical on every receipt
+RECEIPT_FOOTER = (
+    CENTER
+    + b'Thank you for your business!\n'
+    + b'Please come again\n'
+    + b'\n'
+    + BOLD_ON
+    + b'Return Policy: 30 days with receipt\n'
+    + b'Questions? Call (555) 123-4567\n'
+    + BOLD_OFF
+    + CUT
+)
+
+# Default printer name, looked up once per process
+_default_printer_name: Optional[str] = None
+
+def invalidate_default_printer_cache() -> None:
+    """Forget the cached default printer (e.g. after an admin changes it)"""
+    global _default_printer_name
+    _default_printer_name = None
+
+async def _lookup_default_printer() -> Optional[str]:
+    """Get the system default printer name, cached after the first successful lookup"""
+    global _default_printer_name
+    if _default_printer_name is None:
+        if _IS_WINDOWS:
+            _default_printer_name = win32print.GetDefaultPrinter() or None
+        else:
+            returncode, stdout = await _run_command("lpstat", "-d")
+            if returncode == 0 and 'destination:' in stdout:
+                _default_printer_name = stdout.split(':', 1)[1].strip()
+    return _default_printer_name
+
+def _encode(text: str) -> bytes:
+    """Encode text for the printer's default code page"""
+    return text.encode('cp437', errors='replace')
+
+async def _run_command(*cmd: str, input_bytes: Optional[bytes] = None) -> tuple:
+    """Run a command without blocking the event loop; returns (returncode, stdout)"""
+    proc = await asyncio.create_subprocess_exec(
+        *cmd,
+        stdin=asyncio.subprocess.PIPE if input_bytes is not None else None,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE
+    )
+    stdout, _ = await proc.communicate(input_bytes)
+    return proc.returncode, stdout.decode(errors='replace')
+
 class ReceiptPrinter:
     """Hardware receipt printer integration"""
     
-    def __init__(self, printer_name: str = None, printer_ip: str = None):
+    def __init__(self, printer_name: str = None, printer_ip: str = None,
+                 store_info: Dict[str, Any] = None):
         self.printer_name = printer_name
         self.printer_ip = printer_ip
         self.is_connected = False
+        # Persistent RAW socket to a network printer
+        self._writer: Optional[asyncio.StreamWriter] = None
+        # Rendered store header, reused until the store metadata changes
+        self._header_key: Optional[tuple] = None
+        self._header_bytes: bytes = b''
+        # Private loop backing the *_sync shims
+        self._sync_loop: Optional[asyncio.AbstractEventLoop] = None
         
-    def connect(self) -> bool:
+        if store_info:
+            # Render the store header up front so the first receipt doesn't pay for it
+            self._render_header(store_info)
+        
+    async def connect(self) -> bool:
         """Connect to the receipt printer"""
         try:
             if self.printer_ip:
                 # Network printer
-                return self._connect_network_printer()
+                return await self._connect_network_printer()
             elif self.printer_name:
                 # USB/Serial printer
-                return self._connect_usb_printer()
+                return await self._connect_usb_printer()
             else:
                 # Default printer
-                return self._connect_default_printer()
+                return await self._connect_default_printer()
                 
         except Exception as e:
             logger.error(f"Error connecting to printer: {e}")
             return False
     
-    def _connect_network_printer(self) -> bool:
+    async def _connect_network_printer(self) -> bool:
         """Connect to network printer"""
         try:
-            # Test network connectivity
-            if platform.system() == "Windows":
-                result = subprocess.run(
-                    ["ping", "-n", "1", self.printer_ip],
-                    capture_output=True,
-                    text=True
-                )
-            else:
-                result = subprocess.run(
-                    ["ping", "-c", "1", self.printer_ip],
-                    capture_output=True,
-                    text=True
-                )
-            
-            if result.returncode == 0:
-                self.is_connected = True
-                logger.info(f"Connected to network printer at {self.printer_ip}")
-                return True
-            else:
-                logger.error(f"Failed to ping printer at {self.printer_ip}")
-                return False
+            # A TCP handshake on the RAW port proves the printer is accepting jobs;
+            # the probe connection is kept as the pooled print socket
+            await self._open_socket()
+            self.is_connected = True
+            logger.info(f"Connected to network printer at {self.printer_ip}")
+            return True
                 
         except Exception as e:
-            logger.error(f"Error connecting to network printer: {e}")
+            logger.error(f"Error connecting to network printer at {self.printer_ip}: {e}")
             return False
     
-    def _connect_usb_printer(self) -> bool:
+    async def _open_socket(self) -> None:
+        """Open the persistent RAW connection to the network printer"""
+        _, self._writer = await asyncio.wait_for(
+            asyncio.open_connection(self.printer_ip, RAW_PRINT_PORT),
+            timeout=1
+        )
+        sock = self._writer.get_extra_info('socket')
+        if sock is not None:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+    
+    def _close_socket(self) -> None:
+        """Close the persistent network printer connection"""
+        if self._writer:
+            self._writer.close()
+            self._writer = None
+    
+    async def _connect_usb_printer(self) -> bool:
         """Connect to USB printer"""
         try:
             # Check if printer is available
-            if platform.system() == "Windows":
-                result = subprocess.run(
-                    ["wmic", "printer", "where", f"name='{self.printer_name}'", "get", "name"],
-                    capture_output=True,
-                    text=True
+            if _IS_WINDOWS:
+                printers = win32print.EnumPrinters(
+                    win32print.PRINTER_ENUM_LOCAL | win32print.PRINTER_ENUM_CONNECTIONS
                 )
-                if self.printer_name in result.stdout:
+                if any(printer[2] == self.printer_name for printer in printers):
                     self.is_connected = True
                     logger.info(f"Connected to USB printer: {self.printer_name}")
                     return True
             else:
                 # Linux/Mac - check if printer exists
-                result = subprocess.run(
-                    ["lpstat", "-p", self.printer_name],
-                    capture_output=True,
-                    text=True
-                )
-                if result.returncode == 0:
+                returncode, _ = await _run_command("lpstat", "-p", self.printer_name)
+                if returncode == 0:
                     self.is_connected = True
                     logger.info(f"Connected to USB printer: {self.printer_name}")
                     return True
@@ -98,31 +173,15 @@ class ReceiptPrinter:
             logger.error(f"Error connecting to USB printer: {e}")
             return False
     
-    def _connect_default_printer(self) -> bool:
+    async def _connect_default_printer(self) -> bool:
         """Connect to default system printer"""
         try:
-            if platform.system() == "Windows":
-                result = subprocess.run(
-                    ["wmic", "printer", "where", "default='true'", "get", "name"],
-                    capture_output=True,
-                    text=True
-                )
-                lines = result.stdout.strip().split('\n')
-                if len(lines) > 1:
-                    self.printer_name = lines[1].strip()
-                    self.is_connected = True
-                    logger.info(f"Connected to default printer: {self.printer_name}")
-                    return True
-            else:
-                result = subprocess.run(
-                    ["lpstat", "-d"],
-                    capture_output=True,
-                    text=True
-                )
-                if result.returncode == 0:
-                    self.is_connected = True
-                    logger.info("Connected to default printer")
-                    return True
+            printer_name = await _lookup_default_printer()
+            if printer_name:
+                self.printer_name = printer_name
+                self.is_connected = True
+                logger.info(f"Connected to default printer: {self.printer_name}")
+                return True
             
             logger.error("No default printer found")
             return False
@@ -131,158 +190,166 @@ class ReceiptPrinter:
             logger.error(f"Error connecting to default printer: {e}")
             return False
     
-    def print_receipt(self, receipt_data: Dict[str, Any]) -> bool:
+    async def print_receipt(self, receipt_data: Dict[str, Any]) -> bool:
         """Print a receipt"""
-        if not self.is_connected:
-            if not self.connect():
-                return False
-        
         try:
             # Generate receipt content
             receipt_content = self._generate_receipt_content(receipt_data)
             
             # Print the receipt
-            if self.printer_ip:
-                return self._print_network(receipt_content)
-            else:
-                return self._print_local(receipt_content)
+            return await self.send_payload(receipt_content)
                 
         except Exception as e:
             logger.error(f"Error printing receipt: {e}")
             return False
     
-    def _generate_receipt_content(self, receipt_data: Dict[str, Any]) -> str:
-        """Generate receipt content in ESC/POS format"""
-        content = []
-        
-        # Header
-        content.append("ESC @")  # Initialize printer
-        content.append("ESC a 1")  # Center align
-        content.append("ESC ! 8")  # Double height, double width
-        content.append(f"🛒 {receipt_data.get('store_name', 'GROCERY STORE')}")
-        content.append("ESC ! 0")  # Normal text
-        content.append("ESC a 0")  # Left align
+    async def send_payload(self, payload: bytes) -> bool:
+        """Send raw ESC/POS bytes to the printer"""
+        if not self.is_connected:
+            if not await self.connect():
+                return False
         
-        # Store info
-        content.append(f"{receipt_data.get('store_address', '123 Main Street')}")
-        content.append(f"{receipt_data.get('store_city', 'City, State 12345')}")
-        content.append(f"Phone: {receipt_data.get('store_phone', '(555) 123-4567')}")
-        content.append("")
+        if self.printer_ip:
+            return await self._print_network(payload)
+        else:
+            return await self._print_local(payload)
+    
+    def _generate_receipt_content(self, receipt_data: Dict[str, Any]) -> bytes:
+        """Generate receipt content in ESC/POS format"""
+        content = bytearray(self._render_header(receipt_data))
         
         # Transaction info
-        content.append("ESC a 1")  # Center align
-        content.append(f"Receipt #{receipt_data.get('transaction_number', 'N/A')}")
-        content.append(f"{receipt_data.get('transaction_date', datetime.now().strftime('%Y-%m-%d %H:%M:%S'))}")
-        content.append("ESC a 0")  # Left align
-        content.append("ESC ! 1")  # Bold
-        content.append("--------------------------------")
-        content.append("ESC ! 0")  # Normal text
+        content.extend(CENTER)
+        content.extend(_encode(f"Receipt #{receipt_data.get('transaction_number', 'N/A')}\n"))
+        content.extend(_encode(f"{receipt_data.get('transaction_date', datetime.now().strftime('%Y-%m-%d %H:%M:%S'))}\n"))
+        content.extend(LEFT)
+        content.extend(SEPARATOR)
         
         # Items
         items = receipt_data.get('items', [])
         for item in items:
-            content.append(f"{item.get('name', 'Item')}")
-            content.append(f"  {item.get('quantity', 1)} x ${item.get('unit_price', 0):.2f} = ${item.get('line_total', 0):.2f}")
+            content.extend(_encode(
+                f"{item.get('name', 'Item')}\n"
+                f"  {item.get('quantity', 1)} x ${item.get('unit_price', 0):.2f} = ${item.get('line_total', 0):.2f}\n"
+            ))
         
-        content.append("ESC ! 1")  # Bold
-        content.append("--------------------------------")
-        content.append("ESC ! 0")  # Normal text
+        content.extend(SEPARATOR)
         
         # Totals
-        content.append(f"Subtotal: ${receipt_data.get('subtotal', 0):.2f}")
-        content.append(f"Tax: ${receipt_data.get('tax_amount', 0):.2f}")
+        content.extend(_encode(f"Subtotal: ${receipt_data.get('subtotal', 0):.2f}\n"))
+        content.extend(_encode(f"Tax: ${receipt_data.get('tax_amount', 0):.2f}\n"))
         if receipt_data.get('discount_amount', 0) > 0:
-            content.append(f"Discount: -${receipt_data.get('discount_amount', 0):.2f}")
-        content.append("ESC ! 1")  # Bold
-        content.append(f"TOTAL: ${receipt_data.get('total_amount', 0):.2f}")
-        content.append("ESC ! 0")  # Normal text
+            content.extend(_encode(f"Discount: -${receipt_data.get('discount_amount', 0):.2f}\n"))
+        content.extend(BOLD_ON)
+        content.extend(_encode(f"TOTAL: ${receipt_data.get('total_amount', 0):.2f}\n"))
+        content.extend(BOLD_OFF)
         
         # Payment info
-        content.append(f"Payment: {receipt_data.get('payment_method', 'Cash')}")
-        content.append("")
+        content.extend(_encode(f"Payment: {receipt_data.get('payment_method', 'Cash')}\n"))
+        content.extend(NEWLINE)
         
-        # Footer
-        content.append("ESC a 1")  # Center align
-        content.append("Thank you for your business!")
-        content.append("Please come again")
-        content.append("")
-        content.append("ESC ! 1")  # Bold
-        content.append("Return Policy: 30 days with receipt")
-        content.append("Questions? Call (555) 123-4567")
-        content.append("ESC ! 0")  # Normal text
+        # Footer and paper cut
+        content.extend(RECEIPT_FOOTER)
         
-        # Cut paper
-        content.append("ESC d 3")  # Cut paper (3 lines)
+        # Kick a drawer wired to the printer in the same write as the receipt
+        if receipt_data.get('open_drawer'):
+            content.extend(DRAWER_KICK)
         
-        return "\n".join(content)
+        return bytes(content)
+    
+    def _render_header(self, receipt_data: Dict[str, Any]) -> bytes:
+        """Render the store header, reusing the cached bytes for the same store"""
+        key = (
+            receipt_data.get('store_name', 'GROCERY STORE'),
+            receipt_data.get('store_address', '123 Main Street'),
+            receipt_data.get('store_city', 'City, State 12345'),
+            receipt_data.get('store_phone', '(555) 123-4567')
+        )
+        if key != self._header_key:
+            store_name, store_address, store_city, store_phone = key
+            self._header_bytes = (
+                INIT
+                + CENTER
+                + DOUBLE_SIZE
+                + _encode(f"{store_name}\n")
+                + BOLD_OFF
+                + LEFT
+                + _encode(f"{store_address}\n{store_city}\nPhone: {store_phone}\n\n")
+            )
+            self._header_key = key
+        return self._header_bytes
     
-    def _print_network(self, content: str) -> bool:
-        """Print to network printer"""
+    async def _print_network(self, payload: bytes) -> bool:
+        """Print to network printer over the pooled RAW socket"""
+        for attempt in range(2):
+            try:
+                if self._writer is None:
+                    await self._open_socket()
+                self._writer.write(payload)
+                await self._writer.drain()
+                return True
+            except (BrokenPipeError, ConnectionResetError) as e:
+                # Printer dropped the idle connection; reconnect once
+                logger.warning(f"Network printer connection lost, reconnecting: {e}")
+                self._close_socket()
+            except Exception as e:
+                logger.error(f"Error printing to network printer: {e}")
+                self._close_socket()
+                break
+        
+        # Fall back to the system spooler, but only through a configured CUPS
+        # queue: lpr -H names a CUPS server, not a raw printer, and would send
+        # the job to that server's default queue
         try:
-            # Save content to temporary file
-            temp_file = f"/tmp/receipt_{datetime.now().strftime('%Y%m%d_%H%M%S')}.txt"
-            with open(temp_file, 'w', encoding='utf-8') as f:
-                f.write(content)
-            
-            # Send to network printer
-            if platform.system() == "Windows":
-                result = subprocess.run(
-                    ["net", "use", f"\\\\{self.printer_ip}\\printer"],
-                    capture_output=True,
-                    text=True
-                )
-                if result.returncode == 0:
-                    subprocess.run(
-                        ["copy", temp_file, f"\\\\{self.printer_ip}\\printer"],
-                        capture_output=True
-                    )
-            else:
-                subprocess.run(
-                    ["lpr", "-H", self.printer_ip, temp_file],
-                    capture_output=True
-                )
-            
-            # Clean up
-            os.remove(temp_file)
-            return True
+            if _IS_WINDOWS or not self.printer_name:
+                logger.error(f"Failed to print to network printer at {self.printer_ip}")
+                return False
+            returncode, _ = await _run_command(
+                "lpr", "-P", self.printer_name, "-o", "raw", input_bytes=payload
+            )
+            return returncode == 0
             
         except Exception as e:
             logger.error(f"Error printing to network printer: {e}")
             return False
     
-    def _print_local(self, content: str) -> bool:
+    async def _print_local(self, payload: bytes) -> bool:
         """Print to local printer"""
         try:
-            # Save content to temporary file
-            temp_file = f"/tmp/receipt_{datetime.now().strftime('%Y%m%d_%H%M%S')}.txt"
-            with open(temp_file, 'w', encoding='utf-8') as f:
-                f.write(content)
-            
-            # Print using system print command
-            if platform.system() == "Windows":
-                subprocess.run(
-                    ["notepad", "/p", temp_file],
-                    capture_output=True
-                )
-            else:
-                printer_name = self.printer_name or "default"
-                subprocess.run(
-                    ["lpr", "-P", printer_name, temp_file],
-                    capture_output=True
-                )
+            if _IS_WINDOWS:
+                # RAW job through the spooler API
+                await asyncio.to_thread(self._write_raw_windows, payload)
+                return True
             
-            # Clean up
-            os.remove(temp_file)
-            return True
+            # Pipe bytes to lpr; -o raw stops CUPS filtering out the ESC/POS codes
+            cmd = ["lpr", "-o", "raw"]
+            if self.printer_name:
+                cmd += ["-P", self.printer_name]
+            returncode, _ = await _run_command(*cmd, input_bytes=payload)
+            return returncode == 0
             
         except Exception as e:
             logger.error(f"Error printing to local printer: {e}")
             return False
     
-    def test_printer(self) -> Dict[str, Any]:
+    def _write_raw_windows(self, payload: bytes) -> None:
+        """Submit a RAW job straight to the Windows spooler"""
+        handle = win32print.OpenPrinter(self.printer_name)
+        try:
+            win32print.StartDocPrinter(handle, 1, ("Receipt", None, "RAW"))
+            try:
+                win32print.StartPagePrinter(handle)
+                win32print.WritePrinter(handle, payload)
+                win32print.EndPagePrinter(handle)
+            finally:
+                win32print.EndDocPrinter(handle)
+        finally:
+            win32print.ClosePrinter(handle)
+    
+    async def test_printer(self) -> Dict[str, Any]:
         """Test printer functionality"""
         try:
-            if not self.connect():
+            if not await self.connect():
                 return {
                     'status': 'error',
                     'message': 'Failed to connect to printer'
@@ -305,7 +372,7 @@ class ReceiptPrinter:
                 'payment_method': 'Test'
             }
             
-            if self.print_receipt(test_receipt):
+            if await self.print_receipt(test_receipt):
                 return {
                     'status': 'success',
                     'message': 'Printer test successful',
@@ -324,6 +391,26 @@ class ReceiptPrinter:
                 'message': f'Printer test failed: {str(e)}'
             }
     
+    def disconnect(self):
+        """Disconnect from the receipt printer"""
+        self._close_socket()
+        self.is_connected = False
+        logger.info("Disconnected from receipt printer")
+    
+    def _run_sync(self, coro):
+        """Run a coroutine to completion for synchronous callers"""
+        if self._sync_loop is None:
+            self._sync_loop = asyncio.new_event_loop()
+        return self._sync_loop.run_until_complete(coro)
+    
+    def print_receipt_sync(self, receipt_data: Dict[str, Any]) -> bool:
+        """Synchronous wrapper around print_receipt for legacy callers"""
+        return self._run_sync(self.print_receipt(receipt_data))
+    
+    def test_printer_sync(self) -> Dict[str, Any]:
+        """Synchronous wrapper around test_printer for legacy callers"""
+        return self._run_sync(self.test_printer())
+    
     def get_printer_status(self) -> Dict[str, Any]:
         """Get printer status"""
         return {
@@ -333,8 +420,59 @@ class ReceiptPrinter:
             'status': 'online' if self.is_connected else 'offline'
         }
 
+class PrintQueue:
+    """Coalesces queued print jobs into a single printer write"""
+    
+    def __init__(self, printer: ReceiptPrinter):
+        self.printer = printer
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+    
+    def _ensure_started(self) -> None:
+        """Start the background runner on the current event loop"""
+        if self._task is None or self._task.done():
+            self._queue = asyncio.Queue()
+            self._task = asyncio.create_task(self._runner())
+    
+    async def submit(self, payload: bytes) -> bool:
+        """Queue raw ESC/POS bytes (receipt or drawer pulse) and wait for the flush"""
+        self._ensure_started()
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((payload, future))
+        return await future
+    
+    async def print_receipt(self, receipt_data: Dict[str, Any]) -> bool:
+        """Queue a receipt for printing"""
+        return await self.submit(self.printer._generate_receipt_content(receipt_data))
+    
+    async def _runner(self) -> None:
+        """Drain everything pending and send it in one write"""
+        while True:
+            batch = [await self._queue.get()]
+            while not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+            
+            try:
+                success = await self.printer.send_payload(
+                    b''.join(payload for payload, _ in batch)
+                )
+            except Exception as e:
+                logger.error(f"Error flushing print batch: {e}")
+                success = False
+            
+            for _, future in batch:
+                if not future.done():
+                    future.set_result(success)
+    
+    def close(self) -> None:
+        """Stop the background runner"""
+        if self._task:
+            self._task.cancel()
+            self._task = None
+
 # Global printer instance
 printer_instance = None
+print_queue_instance = None
 
 def get_printer() -> ReceiptPrinter:
     """Get global printer instance"""
@@ -343,7 +481,18 @@ def get_printer() -> ReceiptPrinter:
         printer_instance = ReceiptPrinter()
     return printer_instance
 
-def print_receipt(receipt_data: Dict[str, Any]) -> bool:
-    """Convenience function to print a receipt"""
+def get_print_queue() -> PrintQueue:
+    """Get global print queue bound to the global printer"""
+    global print_queue_instance
+    if print_queue_instance is None:
+        print_queue_instance = PrintQueue(get_printer())
+    return print_queue_instance
+
+async def print_receipt(receipt_data: Dict[str, Any]) -> bool:
+    """Convenience function to print a receipt, batched with concurrent jobs"""
+    return await get_print_queue().print_receipt(receipt_data)
+
+def print_receipt_sync(receipt_data: Dict[str, Any]) -> bool:
+    """Synchronous convenience function to print a receipt"""
     printer = get_printer()
-    return printer.print_receipt(receipt_data)
+    return printer.print_receipt_sync(receipt_data)
@@ -2,13 +2,13 @@
 Database models package
 """
 
-from .database import Base, get_db, create_tables, drop_tables, check_database_connection
+from .database import Base, get_db, get_async_db, create_tables, drop_tables, create_partitions, refresh_inventory_rollup, fold_daily_sales_deltas, check_database_connection
 from .product_models import (
     Category, Supplier, Product, StockMovement, 
-    PurchaseOrder, PurchaseOrderItem, Promotion
+    PurchaseOrder, PurchaseOrderItem, Promotion, PromotionProduct, PromotionCategory
 )
 from .sales_models import (
-    Customer, Staff, SalesTransaction, SaleItem, DailySalesSummary
+    Customer, Staff, SalesTransaction, SaleItem, DailySalesSummary, DailySalesDelta
 )
 from .customer_models import (
     CustomerProfile, LoyaltyProgram, LoyaltyTier, 
@@ -18,14 +18,14 @@ from .customer_models import (
 
 __all__ = [
     # Database
-    "Base", "get_db", "create_tables", "drop_tables", "check_database_connection",
+    "Base", "get_db", "get_async_db", "create_tables", "drop_tables", "create_partitions", "refresh_inventory_rollup", "fold_daily_sales_deltas", "check_database_connection",
     
     # Product models
     "Category", "Supplier", "Product", "StockMovement", 
-    "PurchaseOrder", "PurchaseOrderItem", "Promotion",
+    "PurchaseOrder", "PurchaseOrderItem", "Promotion", "PromotionProduct", "PromotionCategory",
     
     # Sales models
-    "Customer", "Staff", "SalesTransaction", "SaleItem", "DailySalesSummary",
+    "Customer", "Staff", "SalesTransaction", "SaleItem", "DailySalesSummary", "DailySalesDelta",
     
     # Customer models
     "CustomerProfile", "LoyaltyProgram", "LoyaltyTier", 
@@ -2,28 +2,34 @@
 Customer and loyalty related database models
 """
 
-from sqlalchemy import Column, String, Text, Integer, Decimal, Boolean, Date, ForeignKey, JSON
-from sqlalchemy.dialects.postgresql import UUID
-from sqlalchemy.orm import relationship
-from sqlalchemy.sql import func
-import uuid
+from sqlalchemy import Column, String, Text, Integer, BigInteger, Identity, Numeric, Boolean, Date, TIMESTAMP, ForeignKey, JSON, Index
+from sqlalchemy.dialects.postgresql import UUID, ARRAY, JSONB
+from sqlalchemy.orm import relationship, deferred
+from sqlalchemy.sql import func, text
 from .database import Base
 
 class CustomerProfile(Base):
     """Extended customer profile with preferences and behavior data"""
     __tablename__ = "customer_profiles"
+    __mapper_args__ = {"eager_defaults": True}
+    __table_args__ = (
+        # GIN indexes back containment queries (@>, ?, &&) on preference tags
+        Index('ix_profile_pref_gin', 'preferences', postgresql_using='gin'),
+        Index('ix_profile_diet_gin', 'dietary_restrictions', postgresql_using='gin'),
+        Index('ix_profile_fav_cat_gin', 'favorite_categories', postgresql_using='gin'),
+    )
     
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    id = Column(UUID(as_uuid=True), primary_key=True, server_default=text("gen_random_uuid()"))
     customer_id = Column(UUID(as_uuid=True), ForeignKey("customers.id"), unique=True)
-    preferences = Column(JSON)  # Store customer preferences as JSON
+    preferences = deferred(Column(JSONB), group='profile_heavy')  # Store customer preferences as JSONB
     dietary_restrictions = Column(ARRAY(String))  # Array of dietary restrictions
-    favorite_categories = Column(ARRAY(String))  # Array of favorite category IDs
-    communication_preferences = Column(JSON)  # Email, SMS, push notification preferences
+    favorite_categories = Column(ARRAY(UUID(as_uuid=True)))  # Array of favorite category IDs
+    communication_preferences = deferred(Column(JSONB), group='profile_heavy')  # Email, SMS, push notification preferences
     birthday = Column(Date)
     anniversary = Column(Date)
-    notes = Column(Text)
-    created_at = Column(Date, server_default=func.now())
-    updated_at = Column(Date, server_default=func.now(), onupdate=func.now())
+    notes = deferred(Column(Text), group='profile_heavy')
+    created_at = Column(TIMESTAMP(timezone=True), server_default=func.now(), nullable=False)
+    updated_at = Column(TIMESTAMP(timezone=True), server_default=func.now(), onupdate=func.now(), nullable=False, index=True)
     
     # Relationships
     customer = relationship("Customer", back_populates="profile")
@@ -31,17 +37,18 @@ class CustomerProfile(Base):
 class LoyaltyProgram(Base):
     """Loyalty program configuration"""
     __tablename__ = "loyalty_programs"
+    __mapper_args__ = {"eager_defaults": True}
     
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    id = Column(UUID(as_uuid=True), primary_key=True, server_default=text("gen_random_uuid()"))
     name = Column(String(100), nullable=False)
     description = Column(Text)
-    points_per_dollar = Column(Decimal(5, 2), default=1.0)
+    points_per_dollar = Column(Numeric(5, 2, asdecimal=True), default=1.0)
     points_per_visit = Column(Integer, default=0)
     birthday_bonus_points = Column(Integer, default=0)
     minimum_redemption_points = Column(Integer, default=100)
     points_expiry_days = Column(Integer)  # NULL means no expiry
     is_active = Column(Boolean, default=True)
-    created_at = Column(Date, server_default=func.now())
+    created_at = Column(TIMESTAMP(timezone=True), server_default=func.now(), nullable=False)
     
     # Relationships
     tiers = relationship("LoyaltyTier", back_populates="program")
@@ -49,16 +56,17 @@ class LoyaltyProgram(Base):
 class LoyaltyTier(Base):
     """Loyalty program tiers"""
     __tablename__ = "loyalty_tiers"
+    __mapper_args__ = {"eager_defaults": True}
     
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    id = Column(UUID(as_uuid=True), primary_key=True, server_default=text("gen_random_uuid()"))
     program_id = Column(UUID(as_uuid=True), ForeignKey("loyalty_programs.id"))
     tier_name = Column(String(50), nullable=False)
     minimum_points = Column(Integer, default=0)
     maximum_points = Column(Integer)  # NULL means no maximum
-    discount_percentage = Column(Decimal(5, 2), default=0)
+    discount_percentage = Column(Numeric(5, 2, asdecimal=True), default=0)
     special_offers = Column(JSON)  # Special offers for this tier
     is_active = Column(Boolean, default=True)
-    created_at = Column(Date, server_default=func.now())
+    created_at = Column(TIMESTAMP(timezone=True), server_default=func.now(), nullable=False)
     
     # Relationships
     program = relationship("LoyaltyProgram", back_populates="tiers")
@@ -66,19 +74,23 @@ class LoyaltyTier(Base):
 class CustomerLoyaltyStatus(Base):
     """Customer loyalty status and tier information"""
     __tablename__ = "customer_loyalty_status"
+    __mapper_args__ = {"eager_defaults": True}
+    __table_args__ = (
+        Index('ix_cls_prog_tier', 'program_id', 'current_tier_id'),
+    )
     
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    id = Column(UUID(as_uuid=True), primary_key=True, server_default=text("gen_random_uuid()"))
     customer_id = Column(UUID(as_uuid=True), ForeignKey("customers.id"), unique=True)
     program_id = Column(UUID(as_uuid=True), ForeignKey("loyalty_programs.id"))
     current_tier_id = Column(UUID(as_uuid=True), ForeignKey("loyalty_tiers.id"))
     total_points = Column(Integer, default=0)
     available_points = Column(Integer, default=0)
     lifetime_points = Column(Integer, default=0)
-    last_activity_date = Column(Date)
+    last_activity_date = Column(TIMESTAMP(timezone=True))
     tier_achieved_date = Column(Date)
     next_tier_points_needed = Column(Integer)
-    created_at = Column(Date, server_default=func.now())
-    updated_at = Column(Date, server_default=func.now(), onupdate=func.now())
+    created_at = Column(TIMESTAMP(timezone=True), server_default=func.now(), nullable=False)
+    updated_at = Column(TIMESTAMP(timezone=True), server_default=func.now(), onupdate=func.now(), nullable=False, index=True)
     
     # Relationships
     customer = relationship("Customer", back_populates="loyalty_status")
@@ -88,15 +100,24 @@ class CustomerLoyaltyStatus(Base):
 class LoyaltyTransaction(Base):
     """Loyalty points transactions"""
     __tablename__ = "loyalty_transactions"
+    __mapper_args__ = {"eager_defaults": True}
+    __table_args__ = (
+        # BRIN suits the append-only, time-ordered created_at column
+        Index('ix_loytx_created_brin', 'created_at', postgresql_using='brin'),
+        Index('ix_loytx_cust_created', 'customer_id', text('created_at DESC')),
+        # Points-expiry job only looks at rows that can expire
+        Index('ix_loytx_expiry', 'expiry_date', postgresql_where=text('expiry_date IS NOT NULL')),
+    )
     
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    # Append-heavy table: 8-byte identity key keeps the PK index compact
+    id = Column(BigInteger, Identity(always=True), primary_key=True)
     customer_id = Column(UUID(as_uuid=True), ForeignKey("customers.id"))
     transaction_type = Column(String(20))  # earned, redeemed, expired, adjusted
     points = Column(Integer)  # Positive for earned, negative for redeemed
     description = Column(String(200))
     reference_id = Column(UUID(as_uuid=True))  # Links to sales transaction, etc.
     expiry_date = Column(Date)
-    created_at = Column(Date, server_default=func.now())
+    created_at = Column(TIMESTAMP(timezone=True), server_default=func.now(), nullable=False)
     
     # Relationships
     customer = relationship("Customer", back_populates="loyalty_transactions")
@@ -104,8 +125,13 @@ class LoyaltyTransaction(Base):
 class CustomerFeedback(Base):
     """Customer feedback and reviews"""
     __tablename__ = "customer_feedback"
+    __mapper_args__ = {"eager_defaults": True}
+    __table_args__ = (
+        # Product-page rating averages only read public feedback
+        Index('ix_feedback_prod_pub', 'product_id', 'is_public', 'rating', postgresql_where=text('is_public = true')),
+    )
     
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    id = Column(UUID(as_uuid=True), primary_key=True, server_default=text("gen_random_uuid()"))
     customer_id = Column(UUID(as_uuid=True), ForeignKey("customers.id"))
     product_id = Column(UUID(as_uuid=True), ForeignKey("products.id"))
     rating = Column(Integer)  # 1-5 stars
@@ -113,7 +139,7 @@ class CustomerFeedback(Base):
     feedback_type = Column(String(20))  # product, service, store, delivery
     is_public = Column(Boolean, default=True)
     is_verified = Column(Boolean, default=False)
-    created_at = Column(Date, server_default=func.now())
+    created_at = Column(TIMESTAMP(timezone=True), server_default=func.now(), nullable=False)
     
     # Relationships
     customer = relationship("Customer", back_populates="feedback")
@@ -122,16 +148,18 @@ class CustomerFeedback(Base):
 class CustomerCommunication(Base):
     """Customer communication history"""
     __tablename__ = "customer_communications"
+    __mapper_args__ = {"eager_defaults": True}
     
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    # Append-heavy table: 8-byte identity key keeps the PK index compact
+    id = Column(BigInteger, Identity(always=True), primary_key=True)
     customer_id = Column(UUID(as_uuid=True), ForeignKey("customers.id"))
     communication_type = Column(String(20))  # email, sms, push, call
     subject = Column(String(200))
-    message = Column(Text)
+    message = deferred(Column(Text))
     status = Column(String(20))  # sent, delivered, read, failed
-    sent_at = Column(Date, server_default=func.now())
-    delivered_at = Column(Date)
-    read_at = Column(Date)
+    sent_at = Column(TIMESTAMP(timezone=True), server_default=func.now(), nullable=False)
+    delivered_at = Column(TIMESTAMP(timezone=True))
+    read_at = Column(TIMESTAMP(timezone=True))
     
     # Relationships
     customer = relationship("Customer", back_populates="communications")
@@ -141,6 +169,9 @@ from .sales_models import Customer
 
 Customer.profile = relationship("CustomerProfile", back_populates="customer", uselist=False)
 Customer.loyalty_status = relationship("CustomerLoyaltyStatus", back_populates="customer", uselist=False)
+# Unbounded history collections stay lazy: every query that loads a customer
+# (receipts included) would otherwise pull them all. Callers that need them
+# opt in per query with selectinload(Customer.loyalty_transactions) etc.
 Customer.loyalty_transactions = relationship("LoyaltyTransaction", back_populates="customer")
 Customer.feedback = relationship("CustomerFeedback", back_populates="customer")
 Customer.communications = relationship("CustomerCommunication", back_populates="customer")
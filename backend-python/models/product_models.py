@@ -2,23 +2,29 @@
 Product and inventory related database models
 """
 
-from sqlalchemy import Column, String, Text, Integer, Decimal, Boolean, Date, ForeignKey, ARRAY
-from sqlalchemy.dialects.postgresql import UUID
-from sqlalchemy.orm import relationship
-from sqlalchemy.sql import func
-import uuid
+from sqlalchemy import DDL, event
+from sqlalchemy import Column, String, Text, Integer, BigInteger, Sequence, Numeric, Boolean, Date, TIMESTAMP, ForeignKey, Index, Computed, CheckConstraint
+from sqlalchemy.dialects.postgresql import UUID, ENUM
+from sqlalchemy.orm import relationship, deferred
+from sqlalchemy.sql import func, text, table, column, literal_column
 from .database import Base
 
+# Native enum types for fixed vocabularies (4 bytes, integer comparison)
+MovementType = ENUM('purchase', 'sale', 'adjustment', 'return', 'waste',
+                    'transfer_in', 'transfer_out', name='movement_type')
+POStatus = ENUM('pending', 'confirmed', 'delivered', 'cancelled', name='po_status')
+PromotionType = ENUM('percentage', 'fixed_amount', 'bogo', 'bulk_discount', name='promotion_type')
+
 class Category(Base):
     """Product categories with hierarchical structure"""
     __tablename__ = "categories"
     
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    id = Column(UUID(as_uuid=True), primary_key=True, server_default=text("gen_random_uuid()"))
     name = Column(String(100), nullable=False)
-    description = Column(Text)
+    description = deferred(Column(Text), group='details')
     parent_category_id = Column(UUID(as_uuid=True), ForeignKey("categories.id"))
-    is_active = Column(Boolean, default=True)
-    created_at = Column(Date, server_default=func.now())
+    is_active = Column(Boolean, default=True, nullable=False, server_default=text("true"))
+    created_at = Column(TIMESTAMP(timezone=True), server_default=func.now(), nullable=False)
     
     # Relationships
     parent_category = relationship("Category", remote_side=[id], backref="subcategories")
@@ -28,15 +34,15 @@ class Supplier(Base):
     """Supplier information and contact details"""
     __tablename__ = "suppliers"
     
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    id = Column(UUID(as_uuid=True), primary_key=True, server_default=text("gen_random_uuid()"))
     name = Column(String(200), nullable=False)
     contact_person = Column(String(100))
     email = Column(String(100))
     phone = Column(String(20))
-    address = Column(Text)
+    address = deferred(Column(Text), group='details')
     payment_terms = Column(String(50))
-    is_active = Column(Boolean, default=True)
-    created_at = Column(Date, server_default=func.now())
+    is_active = Column(Boolean, default=True, nullable=False, server_default=text("true"))
+    created_at = Column(TIMESTAMP(timezone=True), server_default=func.now(), nullable=False)
     
     # Relationships
     products = relationship("Product", back_populates="supplier")
@@ -45,106 +51,261 @@ class Supplier(Base):
 class Product(Base):
     """Product information and inventory details"""
     __tablename__ = "products"
+    __table_args__ = (
+        # Sized by alert-worthy products rather than the whole catalog
+        Index("ix_products_needs_reorder", "id", "name", "current_stock", "reorder_level",
+              postgresql_where=text("is_active AND is_low")),
+        # Catalog browsing only ever lists active products
+        Index("ix_products_active_category", "category_id", postgresql_where=text("is_active")),
+        Index("ix_products_active_supplier", "supplier_id", postgresql_where=text("is_active")),
+        # Expiry report: in-stock active products, already in expiry order
+        Index("ix_products_expiring", "expiry_date",
+              postgresql_where=text("is_active AND current_stock > 0 AND expiry_date IS NOT NULL")),
+        CheckConstraint("current_stock >= 0", name="ck_stock_nonneg"),
+        CheckConstraint("minimum_stock <= maximum_stock", name="ck_stock_bounds"),
+    )
     
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    id = Column(UUID(as_uuid=True), primary_key=True, server_default=text("gen_random_uuid()"))
     barcode = Column(String(50), unique=True)
     name = Column(String(200), nullable=False)
-    description = Column(Text)
+    description = deferred(Column(Text), group='details')
     category_id = Column(UUID(as_uuid=True), ForeignKey("categories.id"))
     supplier_id = Column(UUID(as_uuid=True), ForeignKey("suppliers.id"))
-    cost_price = Column(Decimal(10, 2))
-    selling_price = Column(Decimal(10, 2))
-    discount_percentage = Column(Decimal(5, 2), default=0)
-    tax_rate = Column(Decimal(5, 2), default=0)
+    cost_price = Column(Numeric(10, 2))
+    selling_price = Column(Numeric(10, 2))
+    discount_percentage = Column(Numeric(5, 2), default=0, nullable=False, server_default=text("0"))
+    tax_rate = Column(Numeric(5, 2), default=0, nullable=False, server_default=text("0"))
     unit_type = Column(String(20))  # kg, pieces, liters
-    minimum_stock = Column(Integer, default=0)
+    minimum_stock = Column(Integer, default=0, nullable=False, server_default=text("0"))
     maximum_stock = Column(Integer)
-    current_stock = Column(Integer, default=0)
-    reorder_level = Column(Integer, default=0)
+    current_stock = Column(Integer, default=0, nullable=False, server_default=text("0"))
+    reorder_level = Column(Integer, default=0, nullable=False, server_default=text("0"))
+    # Stored low-stock flag, kept current by PostgreSQL on every stock change
+    is_low = Column(Boolean, Computed("current_stock <= reorder_level", persisted=True))
     expiry_date = Column(Date)
     batch_number = Column(String(50))
     location = Column(String(50))
-    is_active = Column(Boolean, default=True)
-    created_at = Column(Date, server_default=func.now())
-    updated_at = Column(Date, server_default=func.now(), onupdate=func.now())
+    is_active = Column(Boolean, default=True, nullable=False, server_default=text("true"))
+    created_at = Column(TIMESTAMP(timezone=True), server_default=func.now(), nullable=False)
+    updated_at = Column(TIMESTAMP(timezone=True), server_default=func.now(), onupdate=func.now(), nullable=False)
     
     # Relationships
-    category = relationship("Category", back_populates="products")
-    supplier = relationship("Supplier", back_populates="products")
+    category = relationship("Category", back_populates="products", lazy="joined")
+    supplier = relationship("Supplier", back_populates="products", lazy="joined")
     sale_items = relationship("SaleItem", back_populates="product")
     stock_movements = relationship("StockMovement", back_populates="product")
     purchase_order_items = relationship("PurchaseOrderItem", back_populates="product")
 
+# Text searched by product search; the trigram GIN index below is built on
+# this exact expression so ILIKE '%term%' can use it instead of a full scan.
+# Literals are inlined (not bound) so queries match the indexed expression.
+_EMPTY, _SPACE = literal_column("''"), literal_column("' '")
+PRODUCT_SEARCH_TEXT = (
+    func.coalesce(Product.name, _EMPTY) + _SPACE +
+    func.coalesce(Product.description, _EMPTY) + _SPACE +
+    func.coalesce(Product.barcode, _EMPTY)
+)
+Product.__table__.append_constraint(
+    Index("ix_products_search_trgm", PRODUCT_SEARCH_TEXT.label("search_text"),
+          postgresql_using="gin", postgresql_ops={"search_text": "gin_trgm_ops"})
+)
+
+stock_movement_id_seq = Sequence("stock_movements_id_seq")
+
 class StockMovement(Base):
     """Track all inventory movements"""
     __tablename__ = "stock_movements"
+    __table_args__ = (
+        Index("ix_stockmvt_product_date", "product_id", "created_at"),
+        Index("ix_stockmvt_reference", "reference_id"),
+        # Monthly range partitions keep date-bounded scans to one partition
+        {"postgresql_partition_by": "RANGE (created_at)"},
+    )
     
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    # Append-only ledger: sequential bigint key instead of a random UUID.
+    # A plain sequence is used because identity columns on partitioned
+    # tables need PostgreSQL 17, and the partition key must be in the PK.
+    id = Column(BigInteger, stock_movement_id_seq, server_default=stock_movement_id_seq.next_value(),
+                primary_key=True)
     product_id = Column(UUID(as_uuid=True), ForeignKey("products.id"))
-    movement_type = Column(String(20))  # purchase, sale, adjustment, return, waste
+    movement_type = Column(MovementType)
     quantity = Column(Integer)
-    unit_cost = Column(Decimal(10, 2))
-    total_cost = Column(Decimal(10, 2))
+    unit_cost = Column(Numeric(10, 2))
+    total_cost = Column(Numeric(10, 2))
     reference_id = Column(UUID(as_uuid=True))  # links to purchase_order, sale_transaction, etc.
-    notes = Column(Text)
+    notes = deferred(Column(Text), group='details')
     created_by = Column(UUID(as_uuid=True), ForeignKey("staff.id"))
-    created_at = Column(Date, server_default=func.now())
+    created_at = Column(TIMESTAMP(timezone=True), server_default=func.now(), primary_key=True)
     
     # Relationships
     product = relationship("Product", back_populates="stock_movements")
     staff_member = relationship("Staff", back_populates="stock_movements")
 
+# PO numbers come from a sequence in a column default: no COUNT(*) per
+# order and no duplicate numbers when two orders are created at once
+PO_NUMBER_DDL = DDL("""
+CREATE SEQUENCE IF NOT EXISTS po_number_seq;
+
+CREATE OR REPLACE FUNCTION next_po_number() RETURNS text AS $$
+DECLARE
+    n bigint := nextval('po_number_seq');
+BEGIN
+    RETURN 'PO-' || to_char(now(), 'YYYYMMDD') || '-' || lpad(n::text, greatest(4, length(n::text)), '0');
+END;
+$$ LANGUAGE plpgsql;
+""")
+
+event.listen(
+    Base.metadata,
+    "before_create",
+    PO_NUMBER_DDL.execute_if(dialect="postgresql")
+)
+
 class PurchaseOrder(Base):
     """Purchase orders to suppliers"""
     __tablename__ = "purchase_orders"
+    # Fetch the generated po_number with RETURNING on insert
+    __mapper_args__ = {"eager_defaults": True}
     
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
-    po_number = Column(String(50), unique=True)
+    id = Column(UUID(as_uuid=True), primary_key=True, server_default=text("gen_random_uuid()"))
+    po_number = Column(String(50), unique=True, server_default=text("next_po_number()"))
     supplier_id = Column(UUID(as_uuid=True), ForeignKey("suppliers.id"))
     order_date = Column(Date)
     expected_delivery_date = Column(Date)
     actual_delivery_date = Column(Date)
-    status = Column(String(20))  # pending, confirmed, delivered, cancelled
-    subtotal = Column(Decimal(12, 2))
-    tax_amount = Column(Decimal(10, 2))
-    total_amount = Column(Decimal(12, 2))
+    status = Column(POStatus)
+    subtotal = Column(Numeric(12, 2))
+    tax_amount = Column(Numeric(10, 2))
+    total_amount = Column(Numeric(12, 2))
     created_by = Column(UUID(as_uuid=True), ForeignKey("staff.id"))
-    created_at = Column(Date, server_default=func.now())
+    created_at = Column(TIMESTAMP(timezone=True), server_default=func.now(), nullable=False)
     
     # Relationships
     supplier = relationship("Supplier", back_populates="purchase_orders")
-    items = relationship("PurchaseOrderItem", back_populates="purchase_order")
+    items = relationship("PurchaseOrderItem", back_populates="purchase_order", lazy="selectin")
     created_by_staff = relationship("Staff", back_populates="created_purchase_orders")
 
 class PurchaseOrderItem(Base):
     """Items in purchase orders"""
     __tablename__ = "purchase_order_items"
     
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    id = Column(UUID(as_uuid=True), primary_key=True, server_default=text("gen_random_uuid()"))
     purchase_order_id = Column(UUID(as_uuid=True), ForeignKey("purchase_orders.id"))
     product_id = Column(UUID(as_uuid=True), ForeignKey("products.id"))
     quantity_ordered = Column(Integer)
-    quantity_received = Column(Integer, default=0)
-    unit_cost = Column(Decimal(10, 2))
-    line_total = Column(Decimal(10, 2))
+    quantity_received = Column(Integer, default=0, nullable=False, server_default=text("0"))
+    unit_cost = Column(Numeric(10, 2))
+    line_total = Column(Numeric(10, 2), Computed("quantity_ordered * unit_cost", persisted=True))
     
     # Relationships
     purchase_order = relationship("PurchaseOrder", back_populates="items")
-    product = relationship("Product", back_populates="purchase_order_items")
+    product = relationship("Product", back_populates="purchase_order_items", lazy="joined")
 
 class Promotion(Base):
     """Promotions and discounts"""
     __tablename__ = "promotions"
     
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    id = Column(UUID(as_uuid=True), primary_key=True, server_default=text("gen_random_uuid()"))
     name = Column(String(100))
     description = Column(Text)
-    promotion_type = Column(String(20))  # percentage, fixed_amount, bogo, bulk_discount
-    discount_value = Column(Decimal(10, 2))
-    minimum_purchase_amount = Column(Decimal(10, 2))
+    promotion_type = Column(PromotionType)
+    discount_value = Column(Numeric(10, 2))
+    minimum_purchase_amount = Column(Numeric(10, 2))
     start_date = Column(Date)
     end_date = Column(Date)
-    applicable_categories = Column(ARRAY(String))  # Array of category IDs
-    applicable_products = Column(ARRAY(String))  # Array of product IDs
-    is_active = Column(Boolean, default=True)
-    created_at = Column(Date, server_default=func.now())
+    is_active = Column(Boolean, default=True, nullable=False, server_default=text("true"))
+    created_at = Column(TIMESTAMP(timezone=True), server_default=func.now(), nullable=False)
+    
+    # Relationships
+    products = relationship("Product", secondary="promotion_products")
+    categories = relationship("Category", secondary="promotion_categories")
+
+class PromotionProduct(Base):
+    """Products a promotion applies to"""
+    __tablename__ = "promotion_products"
+    __table_args__ = (
+        # Reverse lookup: promotions for the products in a basket
+        Index("ix_promoprod_product", "product_id", "promotion_id"),
+    )
+    
+    promotion_id = Column(UUID(as_uuid=True), ForeignKey("promotions.id", ondelete="CASCADE"), primary_key=True)
+    product_id = Column(UUID(as_uuid=True), ForeignKey("products.id", ondelete="CASCADE"), primary_key=True)
+
+class PromotionCategory(Base):
+    """Categories a promotion applies to"""
+    __tablename__ = "promotion_categories"
+    __table_args__ = (
+        Index("ix_promocat_category", "category_id", "promotion_id"),
+    )
+    
+    promotion_id = Column(UUID(as_uuid=True), ForeignKey("promotions.id", ondelete="CASCADE"), primary_key=True)
+    category_id = Column(UUID(as_uuid=True), ForeignKey("categories.id", ondelete="CASCADE"), primary_key=True)
+
+# Partition maintenance: ensure_monthly_partitions creates the month
+# partitions of a range-partitioned table ahead of time, and a DEFAULT
+# partition catches rows outside the prepared range so inserts never fail.
+MONTHLY_PARTITIONS_DDL = DDL("""
+CREATE OR REPLACE FUNCTION ensure_monthly_partitions(parent text, months_ahead integer)
+RETURNS void AS $$
+DECLARE
+    month_start date := date_trunc('month', now())::date;
+    part_name text;
+BEGIN
+    EXECUTE format('CREATE TABLE IF NOT EXISTS %%I PARTITION OF %%I DEFAULT',
+                   parent || '_default', parent);
+    FOR i IN 0..months_ahead LOOP
+        part_name := parent || '_' || to_char(month_start, 'YYYY_MM');
+        EXECUTE format('CREATE TABLE IF NOT EXISTS %%I PARTITION OF %%I FOR VALUES FROM (%%L) TO (%%L)',
+                       part_name, parent, month_start, (month_start + interval '1 month')::date);
+        month_start := (month_start + interval '1 month')::date;
+    END LOOP;
+END;
+$$ LANGUAGE plpgsql;
+
+SELECT ensure_monthly_partitions('stock_movements', 3);
+""")
+
+event.listen(
+    Base.metadata,
+    "after_create",
+    MONTHLY_PARTITIONS_DDL.execute_if(dialect="postgresql")
+)
+
+# Dashboard rollup of active products' stock flags and value. The unique
+# index on id lets REFRESH ... CONCURRENTLY run without blocking readers.
+INVENTORY_ROLLUP_DDL = DDL("""
+CREATE MATERIALIZED VIEW IF NOT EXISTS inventory_rollup AS
+SELECT id AS product_id,
+       current_stock,
+       reorder_level,
+       is_low,
+       current_stock <= 0 AS is_out,
+       current_stock * coalesce(cost_price, 0) AS value
+FROM products
+WHERE is_active;
+
+CREATE UNIQUE INDEX IF NOT EXISTS ix_inventory_rollup_product ON inventory_rollup (product_id);
+CREATE INDEX IF NOT EXISTS ix_inventory_rollup_low ON inventory_rollup (is_low) WHERE is_low;
+""")
+
+event.listen(
+    Base.metadata,
+    "after_create",
+    INVENTORY_ROLLUP_DDL.execute_if(dialect="postgresql")
+)
+event.listen(
+    Base.metadata,
+    "before_drop",
+    DDL("DROP MATERIALIZED VIEW IF EXISTS inventory_rollup").execute_if(dialect="postgresql")
+)
+
+# Lightweight handle for querying the view (not part of metadata)
+inventory_rollup = table(
+    "inventory_rollup",
+    column("product_id"),
+    column("current_stock"),
+    column("reorder_level"),
+    column("is_low"),
+    column("is_out"),
+    column("value"),
+)
@@ -2,18 +2,24 @@
 Sales and transaction related database models
 """
 
-from sqlalchemy import Column, String, Text, Integer, Decimal, Boolean, Date, ForeignKey, Time
-from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy import DDL, event
+from sqlalchemy import Column, String, Text, Integer, BigInteger, Identity, Numeric, Boolean, Date, TIMESTAMP, ForeignKey, Time, Index, Computed
+from sqlalchemy.dialects.postgresql import UUID, ENUM
 from sqlalchemy.orm import relationship
-from sqlalchemy.sql import func
-import uuid
+from sqlalchemy.sql import func, text
 from .database import Base
 
+# Native enum types for fixed vocabularies (4 bytes, integer comparison)
+CustomerType = ENUM('regular', 'premium', 'wholesale', name='customer_type')
+StaffRole = ENUM('manager', 'cashier', 'inventory_clerk', 'sales_associate', name='staff_role')
+PaymentMethod = ENUM('cash', 'card', 'mobile', 'loyalty_points', name='payment_method')
+PaymentStatus = ENUM('pending', 'completed', 'failed', 'refunded', 'cancelled', name='payment_status')
+
 class Customer(Base):
     """Customer information and loyalty data"""
     __tablename__ = "customers"
     
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    id = Column(UUID(as_uuid=True), primary_key=True, server_default=text("gen_random_uuid()"))
     customer_code = Column(String(50), unique=True)
     first_name = Column(String(50))
     last_name = Column(String(50))
@@ -22,99 +28,285 @@ class Customer(Base):
     address = Column(Text)
     city = Column(String(50))
     postal_code = Column(String(20))
-    loyalty_points = Column(Integer, default=0)
-    total_purchases = Column(Decimal(12, 2), default=0)
+    loyalty_points = Column(Integer, default=0, nullable=False, server_default=text("0"))
+    total_purchases = Column(Numeric(12, 2), default=0, nullable=False, server_default=text("0"))
     last_purchase_date = Column(Date)
-    customer_type = Column(String(20), default='regular')  # regular, premium, wholesale
-    is_active = Column(Boolean, default=True)
-    created_at = Column(Date, server_default=func.now())
+    customer_type = Column(CustomerType, default='regular')
+    is_active = Column(Boolean, default=True, nullable=False, server_default=text("true"))
+    created_at = Column(TIMESTAMP(timezone=True), server_default=func.now(), nullable=False)
     
     # Relationships
     sales_transactions = relationship("SalesTransaction", back_populates="customer")
 
+# Case-insensitive email lookups (WHERE lower(email) = ...)
+Index("ix_customer_email_lower", func.lower(Customer.email))
+
 class Staff(Base):
     """Staff and employee information"""
     __tablename__ = "staff"
     
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    id = Column(UUID(as_uuid=True), primary_key=True, server_default=text("gen_random_uuid()"))
     employee_id = Column(String(20), unique=True)
     first_name = Column(String(50), nullable=False)
     last_name = Column(String(50), nullable=False)
     email = Column(String(100), unique=True)
     phone = Column(String(20))
-    role = Column(String(20))  # manager, cashier, inventory_clerk, sales_associate
+    role = Column(StaffRole)
     hire_date = Column(Date)
-    salary = Column(Decimal(10, 2))
-    commission_rate = Column(Decimal(5, 2))
+    salary = Column(Numeric(10, 2))
+    commission_rate = Column(Numeric(5, 2))
     shift_start = Column(Time)
     shift_end = Column(Time)
-    is_active = Column(Boolean, default=True)
-    created_at = Column(Date, server_default=func.now())
+    is_active = Column(Boolean, default=True, nullable=False, server_default=text("true"))
+    created_at = Column(TIMESTAMP(timezone=True), server_default=func.now(), nullable=False)
     
     # Relationships
     sales_transactions = relationship("SalesTransaction", back_populates="cashier")
     stock_movements = relationship("StockMovement", back_populates="staff_member")
     created_purchase_orders = relationship("PurchaseOrder", back_populates="created_by_staff")
 
+TXN_NUMBER_DDL = DDL("""
+CREATE SEQUENCE IF NOT EXISTS txn_number_seq;
+
+CREATE OR REPLACE FUNCTION next_txn_number() RETURNS text AS $$
+DECLARE
+    n bigint := nextval('txn_number_seq');
+BEGIN
+    RETURN 'TXN-' || to_char(now(), 'YYYYMMDD') || '-' || lpad(n::text, greatest(6, length(n::text)), '0');
+END;
+$$ LANGUAGE plpgsql;
+""")
+
+event.listen(
+    Base.metadata,
+    "before_create",
+    TXN_NUMBER_DDL.execute_if(dialect="postgresql")
+)
+
 class SalesTransaction(Base):
     """Sales transactions and receipts"""
     __tablename__ = "sales_transactions"
+    # Fetch the generated transaction_number with RETURNING on insert
+    __mapper_args__ = {"eager_defaults": True}
+    __table_args__ = (
+        Index("ix_sales_date_cashier", "transaction_date", "cashier_id"),
+        # Sales listings exclude returns and read newest first (backward scan)
+        Index("ix_sales_date_nonreturn", "transaction_date", postgresql_where=text("NOT is_return")),
+        Index("ix_sales_customer_date", "customer_id", "transaction_date",
+              postgresql_where=text("NOT is_return")),
+    )
     
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
-    transaction_number = Column(String(50), unique=True)
+    # Sequential bigint key keeps inserts append-only in the PK index;
+    # public_id is the opaque identifier exposed outside the database
+    id = Column(BigInteger, Identity(always=False), primary_key=True)
+    public_id = Column(UUID(as_uuid=True), unique=True, nullable=False, server_default=text("gen_random_uuid()"))
+    transaction_number = Column(String(50), unique=True, server_default=text("next_txn_number()"))
     customer_id = Column(UUID(as_uuid=True), ForeignKey("customers.id"))
     cashier_id = Column(UUID(as_uuid=True), ForeignKey("staff.id"))
-    subtotal = Column(Decimal(10, 2))
-    tax_amount = Column(Decimal(10, 2))
-    discount_amount = Column(Decimal(10, 2), default=0)
-    total_amount = Column(Decimal(10, 2))
-    payment_method = Column(String(20))  # cash, card, mobile, loyalty_points
-    payment_status = Column(String(20), default='completed')
-    transaction_date = Column(Date, server_default=func.now())
+    subtotal = Column(Numeric(10, 2))
+    tax_amount = Column(Numeric(10, 2), default=0, nullable=False, server_default=text("0"))
+    discount_amount = Column(Numeric(10, 2), default=0, nullable=False, server_default=text("0"))
+    total_amount = Column(Numeric(10, 2))
+    payment_method = Column(PaymentMethod)
+    payment_status = Column(PaymentStatus, default='completed')
+    transaction_date = Column(TIMESTAMP(timezone=True), server_default=func.now(), nullable=False)
     pos_terminal_id = Column(String(50))
-    receipt_printed = Column(Boolean, default=False)
-    is_return = Column(Boolean, default=False)
-    original_transaction_id = Column(UUID(as_uuid=True), ForeignKey("sales_transactions.id"))
+    receipt_printed = Column(Boolean, default=False, nullable=False, server_default=text("false"))
+    is_return = Column(Boolean, default=False, nullable=False, server_default=text("false"))
+    original_transaction_id = Column(BigInteger, ForeignKey("sales_transactions.id"))
     
     # Relationships
     customer = relationship("Customer", back_populates="sales_transactions")
     cashier = relationship("Staff", back_populates="sales_transactions")
-    items = relationship("SaleItem", back_populates="transaction")
+    items = relationship("SaleItem", back_populates="transaction", lazy="selectin")
     original_transaction = relationship("SalesTransaction", remote_side=[id])
 
+# Day bucket for rollups. date_trunc on timestamptz depends on the session
+# time zone, so it is pinned to UTC to make the expression indexable.
+Index(
+    "ix_sales_txn_date_trunc",
+    func.date_trunc("day", func.timezone("UTC", SalesTransaction.transaction_date))
+)
+
 class SaleItem(Base):
     """Individual items in sales transactions"""
     __tablename__ = "sale_items"
+    __table_args__ = (
+        # PostgreSQL does not index foreign keys automatically; INCLUDE columns
+        # let daily aggregates run as index-only scans
+        Index("ix_saleitem_txn", "transaction_id", postgresql_include=["quantity", "line_total"]),
+        Index("ix_saleitem_product", "product_id", postgresql_include=["quantity", "line_total"]),
+    )
     
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
-    transaction_id = Column(UUID(as_uuid=True), ForeignKey("sales_transactions.id"))
+    id = Column(BigInteger, Identity(always=False), primary_key=True)
+    transaction_id = Column(BigInteger, ForeignKey("sales_transactions.id"))
     product_id = Column(UUID(as_uuid=True), ForeignKey("products.id"))
     quantity = Column(Integer, nullable=False)
-    unit_price = Column(Decimal(10, 2))
-    discount_amount = Column(Decimal(10, 2), default=0)
-    line_total = Column(Decimal(10, 2))
+    unit_price = Column(Numeric(10, 2))
+    discount_amount = Column(Numeric(10, 2), default=0, nullable=False, server_default=text("0"))
+    # Derived in the database so it can never disagree with its inputs;
+    # summed in bulk by analytics
+    line_total = Column(Numeric(10, 2, asdecimal=False),
+                        Computed("quantity * unit_price - discount_amount", persisted=True))
     batch_number = Column(String(50))
     expiry_date = Column(Date)
     
     # Relationships
     transaction = relationship("SalesTransaction", back_populates="items")
-    product = relationship("Product", back_populates="sale_items")
+    product = relationship("Product", back_populates="sale_items", lazy="joined")
 
 class DailySalesSummary(Base):
     """Daily sales analytics and summaries"""
     __tablename__ = "daily_sales_summary"
     
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    id = Column(UUID(as_uuid=True), primary_key=True, server_default=text("gen_random_uuid()"))
     date = Column(Date, unique=True)
     total_transactions = Column(Integer)
-    total_revenue = Column(Decimal(12, 2))
+    total_revenue = Column(Numeric(12, 2, asdecimal=False))
     total_items_sold = Column(Integer)
-    average_transaction_value = Column(Decimal(10, 2))
+    average_transaction_value = Column(Numeric(10, 2))
     top_selling_product_id = Column(UUID(as_uuid=True), ForeignKey("products.id"))
-    cash_sales = Column(Decimal(12, 2))
-    card_sales = Column(Decimal(12, 2))
-    returns_amount = Column(Decimal(12, 2))
-    created_at = Column(Date, server_default=func.now())
+    cash_sales = Column(Numeric(12, 2))
+    card_sales = Column(Numeric(12, 2))
+    returns_amount = Column(Numeric(12, 2))
+    created_at = Column(TIMESTAMP(timezone=True), server_default=func.now(), nullable=False)
     
     # Relationships
     top_selling_product = relationship("Product")
+
+class DailySalesDelta(Base):
+    """Pending changes to daily_sales_summary, appended by sales triggers"""
+    __tablename__ = "daily_sales_deltas"
+    
+    id = Column(BigInteger, Identity(always=False), primary_key=True)
+    date = Column(Date, nullable=False)
+    total_transactions = Column(Integer, nullable=False, server_default=text("0"))
+    total_revenue = Column(Numeric(12, 2), nullable=False, server_default=text("0"))
+    total_items_sold = Column(Integer, nullable=False, server_default=text("0"))
+    cash_sales = Column(Numeric(12, 2), nullable=False, server_default=text("0"))
+    card_sales = Column(Numeric(12, 2), nullable=False, server_default=text("0"))
+    returns_amount = Column(Numeric(12, 2), nullable=False, server_default=text("0"))
+
+# Keep daily_sales_summary current without rescanning a day's transactions.
+# Each insert, update or delete appends its delta to daily_sales_deltas; the
+# append takes no shared lock, so concurrent checkouts never queue on the
+# day's summary row. fold_daily_sales_deltas() (run every minute by the
+# scheduler) moves pending deltas into the summary in one upsert per day.
+# generate_daily_sales_summary remains available to reconcile a day and to
+# fill in the top-selling product, which cannot be maintained incrementally.
+DAILY_SALES_ROLLUP_DDL = DDL("""
+CREATE OR REPLACE FUNCTION daily_sales_apply(
+    txn_date date, txn_is_return boolean, amount numeric, method text, sign integer
+) RETURNS void AS $$
+DECLARE
+    amt numeric := COALESCE(amount, 0);
+BEGIN
+    INSERT INTO daily_sales_deltas (
+        date, total_transactions, total_revenue, cash_sales, card_sales, returns_amount
+    )
+    VALUES (
+        txn_date,
+        CASE WHEN txn_is_return THEN 0 ELSE sign END,
+        CASE WHEN txn_is_return THEN 0 ELSE sign * amt END,
+        CASE WHEN NOT txn_is_return AND method = 'cash' THEN sign * amt ELSE 0 END,
+        CASE WHEN NOT txn_is_return AND method = 'card' THEN sign * amt ELSE 0 END,
+        CASE WHEN txn_is_return THEN sign * abs(amt) ELSE 0 END
+    );
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION daily_sales_rollup_txn() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        PERFORM daily_sales_apply(OLD.transaction_date::date, OLD.is_return,
+                                  OLD.total_amount, OLD.payment_method::text, -1);
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        PERFORM daily_sales_apply(NEW.transaction_date::date, NEW.is_return,
+                                  NEW.total_amount, NEW.payment_method::text, 1);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION daily_sales_apply_items(item_txn bigint, qty integer)
+RETURNS void AS $$
+BEGIN
+    INSERT INTO daily_sales_deltas (date, total_items_sold)
+    SELECT t.transaction_date::date, qty
+    FROM sales_transactions t
+    WHERE t.id = item_txn
+      AND t.is_return = false;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION fold_daily_sales_deltas() RETURNS integer AS $$
+DECLARE
+    folded integer;
+BEGIN
+    WITH moved AS (
+        DELETE FROM daily_sales_deltas RETURNING *
+    ), per_day AS (
+        SELECT date,
+               sum(total_transactions) AS total_transactions,
+               sum(total_revenue) AS total_revenue,
+               sum(total_items_sold) AS total_items_sold,
+               sum(cash_sales) AS cash_sales,
+               sum(card_sales) AS card_sales,
+               sum(returns_amount) AS returns_amount
+        FROM moved
+        GROUP BY date
+    )
+    INSERT INTO daily_sales_summary AS s (
+        id, date, total_transactions, total_revenue, total_items_sold,
+        average_transaction_value, cash_sales, card_sales, returns_amount
+    )
+    SELECT gen_random_uuid(), date, total_transactions, total_revenue, total_items_sold,
+           total_revenue / NULLIF(total_transactions, 0),
+           cash_sales, card_sales, returns_amount
+    FROM per_day
+    ON CONFLICT (date) DO UPDATE SET
+        total_transactions = COALESCE(s.total_transactions, 0) + EXCLUDED.total_transactions,
+        total_revenue = COALESCE(s.total_revenue, 0) + EXCLUDED.total_revenue,
+        total_items_sold = COALESCE(s.total_items_sold, 0) + EXCLUDED.total_items_sold,
+        cash_sales = COALESCE(s.cash_sales, 0) + EXCLUDED.cash_sales,
+        card_sales = COALESCE(s.card_sales, 0) + EXCLUDED.card_sales,
+        returns_amount = COALESCE(s.returns_amount, 0) + EXCLUDED.returns_amount,
+        average_transaction_value =
+            (COALESCE(s.total_revenue, 0) + EXCLUDED.total_revenue)
+            / NULLIF(COALESCE(s.total_transactions, 0) + EXCLUDED.total_transactions, 0);
+    GET DIAGNOSTICS folded = ROW_COUNT;
+    RETURN folded;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION daily_sales_rollup_items() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        PERFORM daily_sales_apply_items(OLD.transaction_id, -COALESCE(OLD.quantity, 0));
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        PERFORM daily_sales_apply_items(NEW.transaction_id, COALESCE(NEW.quantity, 0));
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_daily_sales_rollup_txn ON sales_transactions;
+CREATE TRIGGER trg_daily_sales_rollup_txn
+    AFTER INSERT OR UPDATE OF transaction_date, is_return, total_amount, payment_method OR DELETE
+    ON sales_transactions
+    FOR EACH ROW EXECUTE FUNCTION daily_sales_rollup_txn();
+
+DROP TRIGGER IF EXISTS trg_daily_sales_rollup_items ON sale_items;
+CREATE TRIGGER trg_daily_sales_rollup_items
+    AFTER INSERT OR UPDATE OF quantity, transaction_id OR DELETE
+    ON sale_items
+    FOR EACH ROW EXECUTE FUNCTION daily_sales_rollup_items();
+""")
+
+event.listen(
+    Base.metadata,
+    "after_create",
+    DAILY_SALES_ROLLUP_DDL.execute_if(dialect="postgresql")
+)
@@ -6,20 +6,33 @@ Integrates CrewAI, LangGraph, and Phidata/MemGPT for advanced AI capabilities
 import asyncio
 import os
 import json
+import time
 from typing import Dict, List, Any, Optional
+from uuid import UUID
 from datetime import datetime
+from functools import lru_cache
 import uvicorn
-from fastapi import FastAPI, HTTPException, BackgroundTasks
+from fastapi import FastAPI, HTTPException, BackgroundTasks, Depends, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
-from pydantic import BaseModel
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import ORJSONResponse, Response
+from pydantic import BaseModel, ConfigDict, ValidationError
+import orjson
+import msgspec
+from redis import asyncio as redis_asyncio
 import logging
 
+try:
+    import uvloop
+except ImportError:  # uvloop is not available on Windows
+    uvloop = None
+
 # Import our AI components
 from agents.crew_agents import GroceryCrewAI
 from agents.langgraph_workflows import GroceryLangGraphWorkflows
 from agents.phidata_memory import GroceryMemoryManager
 from agents.advanced_ai_features import AdvancedAIFeatures
+from services.product_loader import ProductLoader, get_product_loader
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -29,24 +42,137 @@ logger = logging.getLogger(__name__)
 app = FastAPI(
     title="Grocery Shop Management System - AI Multi-Agent Server",
     description="Advanced AI-powered grocery management with CrewAI, LangGraph, and Phidata integration",
-    version="1.0.0"
+    version="1.0.0",
+    default_response_class=ORJSONResponse
 )
 
-# Add CORS middleware
+# Registered before CORSMiddleware so it runs inside it: the 500 responses get
+# CORS headers and browsers at FRONTEND_ORIGINS can read the error. (Handlers
+# for Exception run in ServerErrorMiddleware, outside every added middleware.)
+@app.middleware("http")
+async def unhandled_exception_middleware(request: Request, call_next):
+    """Turn any error escaping an endpoint into a 500 response"""
+    try:
+        return await call_next(request)
+    except Exception as exc:
+        logger.error("Error handling %s %s: %s", request.method, request.url.path, exc, exc_info=True)
+        return ORJSONResponse({"detail": str(exc)}, status_code=500)
+
+# Add CORS middleware; browsers cache preflight results for max_age seconds
+FRONTEND_ORIGINS = [
+    origin.strip()
+    for origin in os.getenv("FRONTEND_ORIGINS", "http://localhost:3000").split(",")
+    if origin.strip()
+]
 app.add_middleware(
     CORSMiddleware,
-    allow_origins=["*"],  # Configure appropriately for production
+    allow_origins=FRONTEND_ORIGINS,
     allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
+    allow_methods=["GET", "POST"],
+    allow_headers=["Authorization", "Content-Type"],
+    max_age=86400,
 )
 
+# Compress large analysis payloads; small responses like /health go out as is
+app.add_middleware(GZipMiddleware, minimum_size=1024, compresslevel=5)
+
 # Initialize AI components
 crew_ai = None
 langgraph_workflows = None
 memory_manager = None
 advanced_ai_features = None
 
+@lru_cache(maxsize=1)
+def _iso_for_second(second: int) -> str:
+    """Format a whole-second epoch timestamp as local ISO 8601"""
+    return datetime.fromtimestamp(second).isoformat()
+
+def now_iso() -> str:
+    """Current time for response payloads, formatted at most once per second"""
+    return _iso_for_second(int(time.time()))
+
+# Fixed-shape responses are encoded straight from typed structs with one
+# reusable encoder, skipping FastAPI's per-request jsonable_encoder walk.
+class RootStatus(msgspec.Struct):
+    message: str
+    version: str
+    status: str
+    ai_components: Dict[str, str]
+    timestamp: str
+
+class HealthStatus(msgspec.Struct):
+    status: str
+    timestamp: str
+    components: Dict[str, bool]
+
+class AnalysisStarted(msgspec.Struct):
+    message: str
+    store_id: str
+    timestamp: str
+
+_STRUCT_ENCODER = msgspec.json.Encoder()
+
+def struct_response(payload: msgspec.Struct) -> Response:
+    """Serialize a response struct with the shared precompiled encoder"""
+    return Response(content=_STRUCT_ENCODER.encode(payload), media_type="application/json")
+
+# Response cache for read-only AI endpoints: key -> (expires_at, result).
+# Endpoints that mutate state (order fulfillment, memory writes) must not use it.
+RESPONSE_CACHE_TTL = int(os.getenv("AI_RESPONSE_CACHE_TTL", "300"))
+RESPONSE_CACHE_MAXSIZE = 1024
+_response_cache: Dict[tuple, tuple] = {}
+
+# Computations currently running, so identical concurrent requests share one
+_INFLIGHT: Dict[tuple, asyncio.Future] = {}
+
+async def single_flight(key: tuple, compute):
+    """Run compute() once per key at a time; concurrent callers await the same result"""
+    future = _INFLIGHT.get(key)
+    if future is None:
+        future = asyncio.ensure_future(compute())
+        _INFLIGHT[key] = future
+        future.add_done_callback(lambda _: _INFLIGHT.pop(key, None))
+    # A caller going away must not cancel the work the others are waiting on
+    return await asyncio.shield(future)
+
+async def cached_response(endpoint: str, payload: Dict[str, Any], compute):
+    """Return a cached result for a read-only endpoint, computing it on a miss"""
+    key = (endpoint, orjson.dumps(payload, option=orjson.OPT_SORT_KEYS))
+    entry = _response_cache.get(key)
+    if entry and entry[0] > time.monotonic():
+        return entry[1]
+    
+    result = await single_flight(key, compute)
+    if _response_cache.get(key) is not entry:
+        # Another waiter on the same computation already stored it
+        return result
+    if len(_response_cache) >= RESPONSE_CACHE_MAXSIZE:
+        # Evict the oldest entry (dicts keep insertion order)
+        _response_cache.pop(next(iter(_response_cache)))
+    _response_cache[key] = (time.monotonic() + RESPONSE_CACHE_TTL, result)
+    return result
+
+# Composed complete-analysis results per store, stored as encoded JSON in
+# Redis: the POST that runs an analysis and the GET that reads it are usually
+# served by different gunicorn workers
+ANALYSIS_CACHE_TTL = int(os.getenv("AI_ANALYSIS_CACHE_TTL", "300"))
+analysis_store = redis_asyncio.from_url(os.getenv("REDIS_URL", "redis://localhost:6379"))
+
+def _analysis_key(store_id: str) -> str:
+    """Redis key holding a store's latest complete analysis"""
+    return f"complete_analysis:{store_id}"
+
+# Strong references to fire-and-forget tasks; the event loop only keeps weak
+# ones, so an untracked task can be garbage collected before it finishes.
+_PENDING: set[asyncio.Task] = set()
+
+def spawn(coro) -> asyncio.Task:
+    """Run a coroutine in the background without awaiting it"""
+    task = asyncio.create_task(coro)
+    _PENDING.add(task)
+    task.add_done_callback(_PENDING.discard)
+    return task
+
 # Pydantic models for API
 class OrderRequest(BaseModel):
     order_id: str
@@ -90,11 +216,28 @@ class ChurnPredictionRequest(BaseModel):
     customer_id: str
     include_strategies: bool = True
 
+class ProductLookupRequest(BaseModel):
+    product_ids: List[UUID]
+
+class InteractionData(BaseModel):
+    model_config = ConfigDict(extra="allow")  # interaction-specific fields are kept
+    type: str = "general"
+    message: str = ""
+
+class RecommendationContext(BaseModel):
+    model_config = ConfigDict(extra="allow")  # free-form shopping context
+    store_id: Optional[str] = None
+    category: Optional[str] = None
+
 @app.on_event("startup")
 async def startup_event():
     """Initialize AI components on startup"""
     global crew_ai, langgraph_workflows, memory_manager, advanced_ai_features
     
+    # Let coroutines that finish without suspending skip the scheduler (3.12+)
+    if hasattr(asyncio, "eager_task_factory"):
+        asyncio.get_running_loop().set_task_factory(asyncio.eager_task_factory)
+    
     try:
         logger.info("Initializing AI components...")
         
@@ -117,388 +260,406 @@ async def startup_event():
         logger.info("🚀 All AI components initialized successfully!")
         
     except Exception as e:
-        logger.error(f"❌ Error initializing AI components: {e}")
+        logger.error("❌ Error initializing AI components: %s", e)
         raise
 
-@app.get("/")
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Let in-flight background writes finish before the worker exits"""
+    if _PENDING:
+        await asyncio.gather(*_PENDING, return_exceptions=True)
+
+@app.get("/", response_model=None)
 async def root():
     """Root endpoint"""
-    return {
-        "message": "Grocery Shop Management System - AI Multi-Agent Server",
-        "version": "1.0.0",
-        "status": "operational",
-        "ai_components": {
+    return struct_response(RootStatus(
+        message="Grocery Shop Management System - AI Multi-Agent Server",
+        version="1.0.0",
+        status="operational",
+        ai_components={
             "crew_ai": "active",
             "langgraph_workflows": "active",
             "phidata_memory": "active",
             "advanced_ai_features": "active"
         },
-        "timestamp": datetime.now().isoformat()
-    }
+        timestamp=now_iso()
+    ))
 
-@app.get("/health")
+@app.get("/health", response_model=None)
 async def health_check():
     """Health check endpoint"""
-    return {
-        "status": "healthy",
-        "timestamp": datetime.now().isoformat(),
-        "components": {
+    return struct_response(HealthStatus(
+        status="healthy",
+        timestamp=now_iso(),
+        components={
             "crew_ai": crew_ai is not None,
             "langgraph_workflows": langgraph_workflows is not None,
             "memory_manager": memory_manager is not None,
             "advanced_ai_features": advanced_ai_features is not None
         }
-    }
+    ))
+
+# Catalog Endpoints
+@app.post("/products/lookup")
+async def lookup_products(request: ProductLookupRequest,
+                          loader: ProductLoader = Depends(get_product_loader)):
+    """Resolve the products behind a cart or receipt in one batched query"""
+    products = await asyncio.gather(*(loader.load(product_id) for product_id in request.product_ids))
+    return [
+        {
+            "id": str(product.id),
+            "barcode": product.barcode,
+            "name": product.name,
+            "selling_price": product.selling_price,
+            "discount_percentage": product.discount_percentage,
+            "tax_rate": product.tax_rate,
+            "unit_type": product.unit_type
+        } if product else None
+        for product in products
+    ]
 
 # CrewAI Endpoints
 @app.post("/crew/optimize-inventory")
 async def optimize_inventory_crew(request: InventoryOptimizationRequest):
     """Run inventory optimization using CrewAI"""
-    try:
-        result = await crew_ai.optimize_inventory(request.store_id)
-        return JSONResponse(content=result)
-    except Exception as e:
-        logger.error(f"Error in inventory optimization: {e}")
-        raise HTTPException(status_code=500, detail=str(e))
+    return await cached_response(
+        "optimize_inventory", request.model_dump(),
+        lambda: crew_ai.optimize_inventory(request.store_id)
+    )
 
 @app.post("/crew/optimize-sales")
 async def optimize_sales_crew(request: InventoryOptimizationRequest):
     """Run sales optimization using CrewAI"""
-    try:
-        result = await crew_ai.optimize_sales(request.store_id)
-        return JSONResponse(content=result)
-    except Exception as e:
-        logger.error(f"Error in sales optimization: {e}")
-        raise HTTPException(status_code=500, detail=str(e))
+    return await crew_ai.optimize_sales(request.store_id)
 
 @app.post("/crew/manage-operations")
 async def manage_operations_crew(request: InventoryOptimizationRequest):
     """Run operations management using CrewAI"""
-    try:
-        result = await crew_ai.manage_operations(request.store_id)
-        return JSONResponse(content=result)
-    except Exception as e:
-        logger.error(f"Error in operations management: {e}")
-        raise HTTPException(status_code=500, detail=str(e))
+    return await crew_ai.manage_operations(request.store_id)
 
 # LangGraph Workflow Endpoints
 @app.post("/workflow/order-fulfillment")
 async def execute_order_fulfillment(request: OrderRequest):
     """Execute order fulfillment workflow using LangGraph"""
-    try:
-        order_data = {
-            "order_id": request.order_id,
-            "customer_id": request.customer_id,
-            "items": request.items,
-            "payment_method": request.payment_method,
-            "total_amount": request.total_amount
-        }
-        
-        result = await langgraph_workflows.execute_order_fulfillment(order_data)
-        return JSONResponse(content=result)
-    except Exception as e:
-        logger.error(f"Error in order fulfillment: {e}")
-        raise HTTPException(status_code=500, detail=str(e))
+    order_data = {
+        "order_id": request.order_id,
+        "customer_id": request.customer_id,
+        "items": request.items,
+        "payment_method": request.payment_method,
+        "total_amount": request.total_amount
+    }
+    
+    return await langgraph_workflows.execute_order_fulfillment(order_data)
 
 @app.post("/workflow/inventory-optimization")
 async def execute_inventory_optimization_workflow(request: InventoryOptimizationRequest):
     """Execute inventory optimization workflow using LangGraph"""
-    try:
-        result = await langgraph_workflows.execute_inventory_optimization(request.store_id)
-        return JSONResponse(content=result)
-    except Exception as e:
-        logger.error(f"Error in inventory optimization workflow: {e}")
-        raise HTTPException(status_code=500, detail=str(e))
+    return await langgraph_workflows.execute_inventory_optimization(request.store_id)
 
 @app.post("/workflow/customer-service")
 async def execute_customer_service_workflow(request: CustomerServiceRequest):
     """Execute customer service workflow using LangGraph"""
-    try:
-        customer_data = {
-            "customer_id": request.customer_id,
-            "inquiry": request.inquiry,
-            "inquiry_type": request.inquiry_type
-        }
-        
-        result = await langgraph_workflows.execute_customer_service(customer_data)
-        return JSONResponse(content=result)
-    except Exception as e:
-        logger.error(f"Error in customer service workflow: {e}")
-        raise HTTPException(status_code=500, detail=str(e))
+    customer_data = {
+        "customer_id": request.customer_id,
+        "inquiry": request.inquiry,
+        "inquiry_type": request.inquiry_type
+    }
+    
+    return await langgraph_workflows.execute_customer_service(customer_data)
 
 # Phidata Memory Endpoints
 @app.post("/memory/store-customer-interaction")
-async def store_customer_interaction(customer_id: str, interaction_data: Dict[str, Any]):
+async def store_customer_interaction(customer_id: str, interaction_data: InteractionData):
     """Store customer interaction in memory"""
-    try:
-        result = await memory_manager.store_customer_interaction(customer_id, interaction_data)
-        return JSONResponse(content={"success": result})
-    except Exception as e:
-        logger.error(f"Error storing customer interaction: {e}")
-        raise HTTPException(status_code=500, detail=str(e))
+    result = await memory_manager.store_customer_interaction(customer_id, interaction_data.model_dump())
+    return {"success": result}
 
 @app.get("/memory/customer-context/{customer_id}")
 async def get_customer_context(customer_id: str):
     """Get customer context from memory"""
-    try:
-        result = await memory_manager.get_customer_context(customer_id)
-        return JSONResponse(content=result)
-    except Exception as e:
-        logger.error(f"Error getting customer context: {e}")
-        raise HTTPException(status_code=500, detail=str(e))
+    return await memory_manager.get_customer_context(customer_id)
 
 @app.post("/memory/product-recommendations")
-async def get_product_recommendations(customer_id: str, context: Dict[str, Any]):
+async def get_product_recommendations(customer_id: str, context: RecommendationContext):
     """Get AI-powered product recommendations"""
-    try:
-        result = await memory_manager.get_product_recommendations(customer_id, context)
-        return JSONResponse(content=result)
-    except Exception as e:
-        logger.error(f"Error getting product recommendations: {e}")
-        raise HTTPException(status_code=500, detail=str(e))
+    return await memory_manager.get_product_recommendations(
+        customer_id, context.model_dump(exclude_none=True)
+    )
 
 @app.get("/memory/sales-analysis")
 async def analyze_sales_patterns(time_period: str = "30d"):
     """Analyze sales patterns using AI"""
-    try:
-        result = await memory_manager.analyze_sales_patterns(time_period)
-        return JSONResponse(content=result)
-    except Exception as e:
-        logger.error(f"Error analyzing sales patterns: {e}")
-        raise HTTPException(status_code=500, detail=str(e))
+    return await cached_response(
+        "sales_analysis", {"time_period": time_period},
+        lambda: memory_manager.analyze_sales_patterns(time_period)
+    )
 
 # Advanced AI Features Endpoints
-@app.post("/ai/predict-demand")
+@app.post("/ai/predict-demand", response_model=None)
 async def predict_demand(request: DemandPredictionRequest):
     """Predict product demand using AI"""
-    try:
-        result = await advanced_ai_features.predict_demand_with_ai(
+    result = await cached_response(
+        "predict_demand", request.model_dump(),
+        lambda: advanced_ai_features.predict_demand_with_ai(
             request.product_id, 
             request.days_ahead
         )
-        return JSONResponse(content=result.__dict__)
-    except Exception as e:
-        logger.error(f"Error predicting demand: {e}")
-        raise HTTPException(status_code=500, detail=str(e))
+    )
+    # Dataclass results are serialized natively by orjson
+    return ORJSONResponse(result)
 
 @app.post("/ai/optimize-pricing")
 async def optimize_pricing(request: PricingOptimizationRequest):
     """Optimize product pricing using AI"""
-    try:
-        result = await advanced_ai_features.optimize_pricing_with_ai(
+    return await cached_response(
+        "optimize_pricing", request.model_dump(),
+        lambda: advanced_ai_features.optimize_pricing_with_ai(
             request.product_id,
             request.current_price
         )
-        return JSONResponse(content=result)
-    except Exception as e:
-        logger.error(f"Error optimizing pricing: {e}")
-        raise HTTPException(status_code=500, detail=str(e))
+    )
 
-@app.post("/ai/segment-customers")
+@app.post("/ai/segment-customers", response_model=None)
 async def segment_customers(request: CustomerSegmentationRequest):
     """Segment customers using AI"""
-    try:
-        result = await advanced_ai_features.segment_customers_with_ai(request.store_id)
-        return JSONResponse(content=[segment.__dict__ for segment in result])
-    except Exception as e:
-        logger.error(f"Error segmenting customers: {e}")
-        raise HTTPException(status_code=500, detail=str(e))
+    result = await cached_response(
+        "segment_customers", request.model_dump(),
+        lambda: advanced_ai_features.segment_customers_with_ai(request.store_id)
+    )
+    return ORJSONResponse(result)
 
-@app.post("/ai/generate-recommendations")
+@app.post("/ai/generate-recommendations", response_model=None)
 async def generate_recommendations(request: RecommendationRequest):
     """Generate intelligent business recommendations"""
-    try:
-        result = await advanced_ai_features.generate_intelligent_recommendations(request.context)
-        return JSONResponse(content=[rec.__dict__ for rec in result])
-    except Exception as e:
-        logger.error(f"Error generating recommendations: {e}")
-        raise HTTPException(status_code=500, detail=str(e))
+    result = await advanced_ai_features.generate_intelligent_recommendations(request.context)
+    return ORJSONResponse(result)
 
 @app.post("/ai/analyze-sentiment")
 async def analyze_sentiment(request: SentimentAnalysisRequest):
     """Analyze customer sentiment using AI"""
-    try:
-        result = await advanced_ai_features.analyze_customer_sentiment(
-            request.customer_id,
-            request.text_data
-        )
-        return JSONResponse(content=result)
-    except Exception as e:
-        logger.error(f"Error analyzing sentiment: {e}")
-        raise HTTPException(status_code=500, detail=str(e))
+    return await advanced_ai_features.analyze_customer_sentiment(
+        request.customer_id,
+        request.text_data
+    )
 
 @app.post("/ai/predict-churn")
 async def predict_churn(request: ChurnPredictionRequest):
     """Predict customer churn risk using AI"""
-    try:
-        result = await advanced_ai_features.predict_churn_risk(request.customer_id)
-        return JSONResponse(content=result)
-    except Exception as e:
-        logger.error(f"Error predicting churn: {e}")
-        raise HTTPException(status_code=500, detail=str(e))
+    return await advanced_ai_features.predict_churn_risk(request.customer_id)
 
 # Combined AI Operations
-@app.post("/ai/complete-business-analysis")
+@app.post("/ai/complete-business-analysis", response_model=None)
 async def complete_business_analysis(store_id: str, background_tasks: BackgroundTasks):
     """Run complete business analysis using all AI components"""
-    try:
-        # Run analysis in background
-        background_tasks.add_task(run_complete_analysis, store_id)
-        
-        return JSONResponse(content={
-            "message": "Complete business analysis started",
-            "store_id": store_id,
-            "timestamp": datetime.now().isoformat()
-        })
-    except Exception as e:
-        logger.error(f"Error starting business analysis: {e}")
-        raise HTTPException(status_code=500, detail=str(e))
+    # Run analysis in background
+    background_tasks.add_task(run_complete_analysis, store_id)
+    
+    return struct_response(AnalysisStarted(
+        message="Complete business analysis started",
+        store_id=store_id,
+        timestamp=now_iso()
+    ))
+
+@app.get("/ai/complete-business-analysis/{store_id}", response_model=None)
+async def get_complete_business_analysis(store_id: str):
+    """Get the latest complete business analysis for a store"""
+    payload = await analysis_store.get(_analysis_key(store_id))
+    if payload is None:
+        raise HTTPException(status_code=404, detail=f"No recent analysis for store {store_id}")
+    
+    # Stored already encoded, so it is sent without a decode/encode round trip
+    return Response(content=payload, media_type="application/json")
 
 async def run_complete_analysis(store_id: str):
     """Run complete business analysis using all AI components"""
     try:
-        logger.info(f"Starting complete business analysis for store {store_id}")
-        
-        # 1. Run CrewAI optimization
-        inventory_result = await crew_ai.optimize_inventory(store_id)
-        sales_result = await crew_ai.optimize_sales(store_id)
-        operations_result = await crew_ai.manage_operations(store_id)
-        
-        # 2. Run LangGraph workflows
-        inventory_workflow = await langgraph_workflows.execute_inventory_optimization(store_id)
-        
-        # 3. Run advanced AI features
-        customer_segments = await advanced_ai_features.segment_customers_with_ai(store_id)
-        recommendations = await advanced_ai_features.generate_intelligent_recommendations({
-            "store_id": store_id,
-            "analysis_type": "complete"
-        })
+        logger.info("Starting complete business analysis for store %s", store_id)
         
-        # 4. Analyze sales patterns
-        sales_analysis = await memory_manager.analyze_sales_patterns("30d")
-        
-        # Store results in memory
-        analysis_result = {
-            "store_id": store_id,
-            "crew_ai_results": {
-                "inventory": inventory_result,
-                "sales": sales_result,
-                "operations": operations_result
-            },
-            "workflow_results": {
-                "inventory_optimization": inventory_workflow
-            },
-            "ai_features_results": {
-                "customer_segments": [segment.__dict__ for segment in customer_segments],
-                "recommendations": [rec.__dict__ for rec in recommendations]
-            },
-            "sales_analysis": sales_analysis,
-            "timestamp": datetime.now().isoformat()
-        }
+        # Repeat runs for a store within the TTL reuse the composed result
+        cached = await analysis_store.get(_analysis_key(store_id))
+        cache_hit = cached is not None
+        if cache_hit:
+            analysis_result = orjson.loads(cached)
+        else:
+            analysis_result = await single_flight(
+                ("complete_analysis", store_id),
+                lambda: _compose_complete_analysis(store_id)
+            )
+            await analysis_store.set(
+                _analysis_key(store_id), orjson.dumps(analysis_result), ex=ANALYSIS_CACHE_TTL
+            )
         
-        await memory_manager.store_customer_interaction(
+        # Store results in memory without holding up the job
+        spawn(memory_manager.store_customer_interaction(
             "system",
             {
                 "type": "complete_business_analysis",
+                "cache_hit": cache_hit,
                 "data": analysis_result
             }
-        )
+        ))
         
-        logger.info(f"Complete business analysis completed for store {store_id}")
+        logger.info("Complete business analysis completed for store %s (cache_hit=%s)", store_id, cache_hit)
         
     except Exception as e:
-        logger.error(f"Error in complete business analysis: {e}")
+        logger.error("Error in complete business analysis: %s", e)
+
+def _plain_crew_result(outcome: Dict[str, Any]) -> Dict[str, Any]:
+    """Replace a crew's CrewOutput (a pydantic model) with a plain dict orjson can encode"""
+    result = outcome.get("result")
+    if hasattr(result, "model_dump"):
+        return {**outcome, "result": result.model_dump()}
+    return outcome
+
+async def _compose_complete_analysis(store_id: str) -> Dict[str, Any]:
+    """Run every analysis step for a store and compose the combined result"""
+    # The analyses are independent, so run them concurrently
+    async with asyncio.TaskGroup() as tg:
+        # 1. Run CrewAI optimization
+        inventory_task = tg.create_task(crew_ai.optimize_inventory(store_id))
+        sales_task = tg.create_task(crew_ai.optimize_sales(store_id))
+        operations_task = tg.create_task(crew_ai.manage_operations(store_id))
+        
+        # 2. Run LangGraph workflows
+        inventory_workflow_task = tg.create_task(
+            langgraph_workflows.execute_inventory_optimization(store_id)
+        )
+        
+        # 3. Run advanced AI features
+        segments_task = tg.create_task(advanced_ai_features.segment_customers_with_ai(store_id))
+        recommendations_task = tg.create_task(
+            advanced_ai_features.generate_intelligent_recommendations({
+                "store_id": store_id,
+                "analysis_type": "complete"
+            })
+        )
+        
+        # 4. Analyze sales patterns
+        sales_analysis_task = tg.create_task(memory_manager.analyze_sales_patterns("30d"))
+    
+    return {
+        "store_id": store_id,
+        "crew_ai_results": {
+            "inventory": _plain_crew_result(inventory_task.result()),
+            "sales": _plain_crew_result(sales_task.result()),
+            "operations": _plain_crew_result(operations_task.result())
+        },
+        "workflow_results": {
+            "inventory_optimization": inventory_workflow_task.result()
+        },
+        "ai_features_results": {
+            "customer_segments": [segment.__dict__ for segment in segments_task.result()],
+            "recommendations": [rec.__dict__ for rec in recommendations_task.result()]
+        },
+        "sales_analysis": sales_analysis_task.result(),
+        "timestamp": datetime.now().isoformat()
+    }
 
 # MCP Server Integration
+
+# Static MCP tool catalog, serialized once at import
+MCP_TOOLS = [
+    {
+        "name": "optimize_inventory",
+        "description": "Optimize inventory using CrewAI agents",
+        "parameters": ["store_id"]
+    },
+    {
+        "name": "predict_demand",
+        "description": "Predict product demand using AI",
+        "parameters": ["product_id", "days_ahead"]
+    },
+    {
+        "name": "optimize_pricing",
+        "description": "Optimize product pricing using AI",
+        "parameters": ["product_id", "current_price"]
+    },
+    {
+        "name": "segment_customers",
+        "description": "Segment customers using AI",
+        "parameters": ["store_id"]
+    },
+    {
+        "name": "generate_recommendations",
+        "description": "Generate intelligent business recommendations",
+        "parameters": ["context"]
+    },
+    {
+        "name": "analyze_sentiment",
+        "description": "Analyze customer sentiment",
+        "parameters": ["customer_id", "text_data"]
+    },
+    {
+        "name": "predict_churn",
+        "description": "Predict customer churn risk",
+        "parameters": ["customer_id"]
+    }
+]
+_MCP_TOOLS_BYTES = orjson.dumps({"tools": MCP_TOOLS})
+
 @app.post("/mcp/tools")
 async def get_available_tools():
     """Get available MCP tools"""
-    return JSONResponse(content={
-        "tools": [
-            {
-                "name": "optimize_inventory",
-                "description": "Optimize inventory using CrewAI agents",
-                "parameters": ["store_id"]
-            },
-            {
-                "name": "predict_demand",
-                "description": "Predict product demand using AI",
-                "parameters": ["product_id", "days_ahead"]
-            },
-            {
-                "name": "optimize_pricing",
-                "description": "Optimize product pricing using AI",
-                "parameters": ["product_id", "current_price"]
-            },
-            {
-                "name": "segment_customers",
-                "description": "Segment customers using AI",
-                "parameters": ["store_id"]
-            },
-            {
-                "name": "generate_recommendations",
-                "description": "Generate intelligent business recommendations",
-                "parameters": ["context"]
-            },
-            {
-                "name": "analyze_sentiment",
-                "description": "Analyze customer sentiment",
-                "parameters": ["customer_id", "text_data"]
-            },
-            {
-                "name": "predict_churn",
-                "description": "Predict customer churn risk",
-                "parameters": ["customer_id"]
-            }
-        ]
-    })
+    return Response(content=_MCP_TOOLS_BYTES, media_type="application/json")
+
+# Tool name -> (parameters model, handler). The lambdas look up the
+# component globals at call time, after startup_event has initialized them.
+_MCP_HANDLERS = {
+    "optimize_inventory": (
+        InventoryOptimizationRequest,
+        lambda p: crew_ai.optimize_inventory(p.store_id)
+    ),
+    "predict_demand": (
+        DemandPredictionRequest,
+        lambda p: advanced_ai_features.predict_demand_with_ai(p.product_id, p.days_ahead)
+    ),
+    "optimize_pricing": (
+        PricingOptimizationRequest,
+        lambda p: advanced_ai_features.optimize_pricing_with_ai(p.product_id, p.current_price)
+    ),
+    "segment_customers": (
+        CustomerSegmentationRequest,
+        lambda p: advanced_ai_features.segment_customers_with_ai(p.store_id)
+    ),
+    "generate_recommendations": (
+        RecommendationRequest,
+        lambda p: advanced_ai_features.generate_intelligent_recommendations(p.context)
+    ),
+    "analyze_sentiment": (
+        SentimentAnalysisRequest,
+        lambda p: advanced_ai_features.analyze_customer_sentiment(p.customer_id, p.text_data)
+    ),
+    "predict_churn": (
+        ChurnPredictionRequest,
+        lambda p: advanced_ai_features.predict_churn_risk(p.customer_id)
+    ),
+}
 
 @app.post("/mcp/execute")
-async def execute_mcp_tool(tool_name: str, parameters: Dict[str, Any]):
+async def execute_mcp_tool(tool_name: str, request: Request):
     """Execute MCP tool"""
+    entry = _MCP_HANDLERS.get(tool_name)
+    if entry is None:
+        raise HTTPException(status_code=400, detail=f"Unknown tool: {tool_name}")
+    params_model, handler = entry
+    
+    # Validate the raw body against the tool's schema in a single pass
     try:
-        if tool_name == "optimize_inventory":
-            result = await crew_ai.optimize_inventory(parameters["store_id"])
-        elif tool_name == "predict_demand":
-            result = await advanced_ai_features.predict_demand_with_ai(
-                parameters["product_id"], 
-                parameters.get("days_ahead", 30)
-            )
-        elif tool_name == "optimize_pricing":
-            result = await advanced_ai_features.optimize_pricing_with_ai(
-                parameters["product_id"],
-                parameters["current_price"]
-            )
-        elif tool_name == "segment_customers":
-            result = await advanced_ai_features.segment_customers_with_ai(
-                parameters["store_id"]
-            )
-        elif tool_name == "generate_recommendations":
-            result = await advanced_ai_features.generate_intelligent_recommendations(
-                parameters["context"]
-            )
-        elif tool_name == "analyze_sentiment":
-            result = await advanced_ai_features.analyze_customer_sentiment(
-                parameters["customer_id"],
-                parameters["text_data"]
-            )
-        elif tool_name == "predict_churn":
-            result = await advanced_ai_features.predict_churn_risk(
-                parameters["customer_id"]
-            )
-        else:
-            raise HTTPException(status_code=400, detail=f"Unknown tool: {tool_name}")
-        
-        return JSONResponse(content=result)
-    except Exception as e:
-        logger.error(f"Error executing MCP tool {tool_name}: {e}")
-        raise HTTPException(status_code=500, detail=str(e))
+        parameters = params_model.model_validate_json(await request.body())
+    except ValidationError as e:
+        raise HTTPException(status_code=422, detail=e.errors(include_url=False, include_context=False))
+    
+    return await handler(parameters)
 
 if __name__ == "__main__":
+    # Development entrypoint (auto-reload, single process). Production runs
+    # multiple workers via: gunicorn multi_agent_server:app -c gunicorn.conf.py
     uvicorn.run(
         "multi_agent_server:app",
         host="0.0.0.0",
         port=8000,
         reload=True,
+        loop="uvloop" if uvloop else "asyncio",
+        http="httptools",
         log_level="info"
     )
@@ -7,11 +7,14 @@ from .inventory_service import InventoryService
 from .sales_service import SalesService
 from .payment_service import PaymentService
 from .notification_service import NotificationService
+from .product_loader import ProductLoader, get_product_loader
 
 __all__ = [
     "BaseService",
     "InventoryService", 
     "SalesService",
     "PaymentService",
-    "NotificationService"
+    "NotificationService",
+    "ProductLoader",
+    "get_product_loader"
 ]
@@ -2,6 +2,7 @@
 Base service class with common functionality
 """
 
+from contextlib import nullcontext
 from typing import Any, Dict, List, Optional
 from sqlalchemy.orm import Session
 from sqlalchemy.exc import SQLAlchemyError
@@ -25,6 +26,12 @@ class BaseService:
             self.db.rollback()
             return False
     
+    def write_scope(self, commit: bool):
+        """Savepoint for a write batched into the caller's transaction (commit=False)"""
+        # Leaving the block releases the savepoint; an exception rolls back
+        # only this write, never the caller's earlier work
+        return nullcontext() if commit else self.db.begin_nested()
+    
     def rollback(self) -> None:
         """Rollback database transaction"""
         self.db.rollback()
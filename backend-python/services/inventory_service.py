@@ -2,17 +2,111 @@
 Inventory management service
 """
 
-from typing import Dict, List, Any, Optional
+from typing import Dict, Iterator, List, Any, Optional
 from sqlalchemy.orm import Session
-from sqlalchemy import and_, or_, desc, func
+from sqlalchemy import Integer, and_, or_, bindparam, case, cast, column, desc, func, insert, select, update, union, values, event, inspect
+from sqlalchemy.engine import Row
 from datetime import datetime, timedelta
+from decimal import Decimal
 import logging
+import os
+import time
 
-from models import Product, StockMovement, Category, Supplier, PurchaseOrder, PurchaseOrderItem
+from models import Product, StockMovement, Category, Supplier, PurchaseOrder, PurchaseOrderItem, Promotion, PromotionProduct, PromotionCategory
+from models.database import SessionLocal
+from models.product_models import inventory_rollup, PRODUCT_SEARCH_TEXT
 from .base_service import BaseService
 
 logger = logging.getLogger(__name__)
 
+# Catalog fields served from the barcode cache. Stock levels are left out on
+# purpose: they change on every sale and would invalidate the cache constantly.
+CATALOG_FIELDS = (
+    "id", "barcode", "name", "category_id", "selling_price",
+    "discount_percentage", "tax_rate", "unit_type", "is_active"
+)
+
+# The cache is per worker process: mapper events below only clear it in the
+# process that made the ORM write, and Core/SQL writes bypass them entirely.
+# Other workers therefore serve a changed price or tax rate for at most
+# BARCODE_CACHE_TTL seconds. Misses are never cached, so a product created
+# elsewhere is found on the next scan.
+BARCODE_CACHE_TTL = int(os.getenv("BARCODE_CACHE_TTL", "30"))
+BARCODE_CACHE_SIZE = 100_000
+_barcode_cache: Dict[str, tuple] = {}
+
+def lookup_product_by_barcode(barcode: str) -> Optional[Row]:
+    """Read-through cache of catalog fields by barcode"""
+    entry = _barcode_cache.get(barcode)
+    if entry and entry[0] > time.monotonic():
+        return entry[1]
+    
+    db = SessionLocal()
+    try:
+        row = db.execute(
+            select(*(getattr(Product, field) for field in CATALOG_FIELDS)).where(Product.barcode == barcode)
+        ).first()
+    finally:
+        db.close()
+    
+    if row is not None:
+        if len(_barcode_cache) >= BARCODE_CACHE_SIZE:
+            _barcode_cache.clear()
+        _barcode_cache[barcode] = (time.monotonic() + BARCODE_CACHE_TTL, row)
+    return row
+
+def clear_barcode_cache() -> None:
+    """Drop every cached catalog row in this process"""
+    _barcode_cache.clear()
+
+def _invalidate_barcode_cache(mapper, connection, target):
+    """Drop cached catalog rows when products are added or removed"""
+    clear_barcode_cache()
+
+def _invalidate_barcode_cache_on_update(mapper, connection, target):
+    """Drop cached catalog rows when a cached field of a product changes"""
+    state = inspect(target)
+    if any(state.attrs[field].history.has_changes() for field in CATALOG_FIELDS):
+        clear_barcode_cache()
+
+event.listen(Product, "after_insert", _invalidate_barcode_cache)
+event.listen(Product, "after_delete", _invalidate_barcode_cache)
+event.listen(Product, "after_update", _invalidate_barcode_cache_on_update)
+
+def queue_inventory_rollup_refresh() -> None:
+    """Hand a rollup refresh to the background workers instead of blocking the caller"""
+    try:
+        # Imported here so loading the service doesn't set up the Celery app
+        from workers.celery_worker import refresh_inventory_rollup_task
+        
+        refresh_inventory_rollup_task.delay()
+    except Exception as e:
+        # Broker unavailable: the scheduled refresh picks the change up
+        logger.error(f"Error queueing inventory rollup refresh: {e}")
+
+# Near-static reference lists (categories, suppliers): key -> (expires_at, rows).
+# Rows are kept detached and merged into the caller's session without a query.
+REFERENCE_CACHE_TTL = int(os.getenv("REFERENCE_CACHE_TTL", "60"))
+_reference_cache: Dict[str, tuple] = {}
+
+# Tax applied to purchase order subtotals
+PO_TAX_RATE = Decimal("0.10")
+
+# Hot read statements, built once. Values arrive as bound parameters, so every
+# call reuses the same statement and its entry in the compiled-SQL cache.
+_ACTIVE_PRODUCTS_PAGE = (
+    select(Product).where(Product.is_active == True)
+    .offset(bindparam("skip")).limit(bindparam("limit"))
+)
+_PRODUCT_BY_ID = select(Product).where(Product.id == bindparam("product_id"))
+_PRODUCT_BY_BARCODE = select(Product).where(Product.barcode == bindparam("barcode"))
+_LOW_STOCK_PRODUCTS = select(Product).where(
+    Product.is_active == True, Product.is_low == True
+)
+_OUT_OF_STOCK_PRODUCTS = select(Product).where(
+    Product.is_active == True, Product.current_stock <= 0
+)
+
 class InventoryService(BaseService):
     """Service for inventory management operations"""
     
@@ -21,33 +115,62 @@ class InventoryService(BaseService):
     
     def get_all_products(self, skip: int = 0, limit: int = 100) -> List[Product]:
         """Get all products with pagination"""
-        return self.db.query(Product).filter(Product.is_active == True).offset(skip).limit(limit).all()
+        return self.db.execute(_ACTIVE_PRODUCTS_PAGE, {"skip": skip, "limit": limit}).scalars().all()
+    
+    def iter_products(self, batch_size: int = 500) -> Iterator[Product]:
+        """Stream every active product in server-side batches (exports, bulk jobs)"""
+        yield from self.db.execute(
+            select(Product).where(Product.is_active == True).order_by(Product.id)
+            .execution_options(yield_per=batch_size)
+        ).scalars()
     
     def get_product_by_id(self, product_id: str) -> Optional[Product]:
         """Get product by ID"""
-        return self.db.query(Product).filter(Product.id == product_id).first()
+        return self.db.execute(_PRODUCT_BY_ID, {"product_id": product_id}).scalars().first()
     
     def get_product_by_barcode(self, barcode: str) -> Optional[Product]:
         """Get product by barcode"""
-        return self.db.query(Product).filter(Product.barcode == barcode).first()
+        return self.db.execute(_PRODUCT_BY_BARCODE, {"barcode": barcode}).scalars().first()
+    
+    def lookup_barcode(self, barcode: str) -> Optional[Row]:
+        """Get cached catalog fields for a scanned barcode (no stock levels)"""
+        return lookup_product_by_barcode(barcode)
+    
+    def _save(self, obj: Any, commit: bool) -> None:
+        """Commit and reload, or only flush when the caller batches several writes"""
+        if commit:
+            self.db.commit()
+            self.db.refresh(obj)
+        else:
+            self.db.flush()
     
-    def create_product(self, product_data: Dict[str, Any]) -> Product:
-        """Create a new product"""
+    def create_product(self, product_data: Dict[str, Any], commit: bool = True) -> Product:
+        """Create a new product (commit=False leaves the transaction open)"""
         product = Product(**product_data)
         self.db.add(product)
-        self.db.commit()
-        self.db.refresh(product)
+        self._save(product, commit)
         return product
     
-    def update_product(self, product_id: str, product_data: Dict[str, Any]) -> Optional[Product]:
-        """Update product information"""
+    def bulk_create_products(self, rows: List[Dict[str, Any]]) -> int:
+        """Insert many products in batched multi-row INSERTs (catalog import/seed)"""
+        if not rows:
+            return 0
+        self.db.execute(insert(Product), rows)
+        self.db.commit()
+        # Bulk INSERTs bypass mapper events, so invalidate explicitly
+        clear_barcode_cache()
+        queue_inventory_rollup_refresh()
+        return len(rows)
+    
+    def update_product(self, product_id: str, product_data: Dict[str, Any],
+                       commit: bool = True) -> Optional[Product]:
+        """Update product information (commit=False leaves the transaction open)"""
         product = self.get_product_by_id(product_id)
         if product:
             for key, value in product_data.items():
                 setattr(product, key, value)
             product.updated_at = datetime.now()
-            self.db.commit()
-            self.db.refresh(product)
+            self._save(product, commit)
         return product
     
     def delete_product(self, product_id: str) -> bool:
@@ -61,64 +184,74 @@ class InventoryService(BaseService):
     
     def get_low_stock_products(self) -> List[Product]:
         """Get products with stock below reorder level"""
-        return self.db.query(Product).filter(
-            and_(
-                Product.is_active == True,
-                Product.current_stock <= Product.reorder_level
-            )
-        ).all()
+        return self.db.execute(_LOW_STOCK_PRODUCTS).scalars().all()
     
     def get_out_of_stock_products(self) -> List[Product]:
         """Get products that are out of stock"""
-        return self.db.query(Product).filter(
-            and_(
-                Product.is_active == True,
-                Product.current_stock <= 0
-            )
-        ).all()
+        return self.db.execute(_OUT_OF_STOCK_PRODUCTS).scalars().all()
     
     def update_stock(self, product_id: str, quantity: int, movement_type: str, 
-                    reference_id: str = None, notes: str = None, created_by: str = None) -> bool:
-        """Update product stock and create movement record"""
+                    reference_id: str = None, notes: str = None, created_by: str = None,
+                    commit: bool = True) -> bool:
+        """Update product stock and create movement record (commit=False leaves the transaction open)"""
         try:
-            product = self.get_product_by_id(product_id)
-            if not product:
-                return False
-            
-            # Calculate new stock level
+            # Calculate stock change
             if movement_type in ['purchase', 'adjustment', 'return']:
-                new_stock = product.current_stock + quantity
+                delta = quantity
             elif movement_type in ['sale', 'waste']:
-                new_stock = product.current_stock - quantity
+                delta = -quantity
             else:
                 return False
             
-            # Update product stock
-            product.current_stock = max(0, new_stock)
+            with self.write_scope(commit):
+                # Apply the change in the database: one round trip, and concurrent
+                # updates can't overwrite each other's stock level
+                product = self.db.execute(
+                    update(Product)
+                    .where(Product.id == product_id)
+                    .values(current_stock=func.greatest(0, Product.current_stock + delta))
+                    .returning(Product.current_stock, Product.cost_price)
+                ).first()
+                if not product:
+                    return False
+                
+                # Create stock movement record
+                movement = StockMovement(
+                    product_id=product_id,
+                    movement_type=movement_type,
+                    quantity=quantity,
+                    unit_cost=product.cost_price,
+                    total_cost=product.cost_price * quantity if product.cost_price else 0,
+                    reference_id=reference_id,
+                    notes=notes,
+                    created_by=created_by
+                )
+                self.db.add(movement)
             
-            # Create stock movement record
-            movement = StockMovement(
-                product_id=product_id,
-                movement_type=movement_type,
-                quantity=quantity,
-                unit_cost=product.cost_price,
-                total_cost=product.cost_price * quantity if product.cost_price else 0,
-                reference_id=reference_id,
-                notes=notes,
-                created_by=created_by
-            )
-            
-            self.db.add(movement)
-            self.db.commit()
+            if commit:
+                self.db.commit()
             
             logger.info(f"Stock updated for product {product_id}: {movement_type} {quantity} units")
             return True
             
         except Exception as e:
             logger.error(f"Error updating stock: {e}")
-            self.db.rollback()
+            # A batched write has already undone its own savepoint
+            if commit:
+                self.db.rollback()
             return False
     
+    def bulk_record_stock_movements(self, rows: List[Dict[str, Any]]) -> List[int]:
+        """Insert many stock movement rows at once and return their IDs"""
+        if not rows:
+            return []
+        result = self.db.execute(
+            insert(StockMovement).returning(StockMovement.id), rows
+        )
+        movement_ids = list(result.scalars())
+        self.db.commit()
+        return movement_ids
+    
     def get_stock_movements(self, product_id: str = None, 
                           movement_type: str = None, 
                           start_date: datetime = None, 
@@ -140,13 +273,16 @@ class InventoryService(BaseService):
     
     def get_inventory_summary(self) -> Dict[str, Any]:
         """Get inventory summary statistics"""
-        total_products = self.db.query(Product).filter(Product.is_active == True).count()
-        low_stock_count = len(self.get_low_stock_products())
-        out_of_stock_count = len(self.get_out_of_stock_products())
-        
-        total_value = self.db.query(
-            func.sum(Product.current_stock * Product.cost_price)
-        ).filter(Product.is_active == True).scalar() or 0
+        # Read from the narrow rollup view rather than the products table;
+        # figures are as fresh as the last rollup refresh (at most five minutes)
+        total_products, low_stock_count, out_of_stock_count, total_value = self.db.execute(
+            select(
+                func.count(),
+                func.coalesce(func.sum(case((inventory_rollup.c.is_low, 1), else_=0)), 0),
+                func.coalesce(func.sum(case((inventory_rollup.c.is_out, 1), else_=0)), 0),
+                func.coalesce(func.sum(inventory_rollup.c.value), 0)
+            ).select_from(inventory_rollup)
+        ).one()
         
         return {
             "total_products": total_products,
@@ -175,21 +311,44 @@ class InventoryService(BaseService):
         ).all()
     
     def search_products(self, search_term: str) -> List[Product]:
-        """Search products by name or barcode"""
+        """Search products by name, description or barcode"""
         return self.db.query(Product).filter(
             and_(
                 Product.is_active == True,
-                or_(
-                    Product.name.ilike(f"%{search_term}%"),
-                    Product.barcode.ilike(f"%{search_term}%"),
-                    Product.description.ilike(f"%{search_term}%")
-                )
+                PRODUCT_SEARCH_TEXT.ilike(f"%{search_term}%")
+            )
+        ).all()
+    
+    def get_applicable_promotions(self, product_id: str) -> List[Promotion]:
+        """Get active promotions targeting a product or its category"""
+        return self.get_basket_promotions([product_id])
+    
+    def get_basket_promotions(self, product_ids: List[str]) -> List[Promotion]:
+        """Get active promotions for all products in a basket in one query"""
+        if not product_ids:
+            return []
+        
+        today = datetime.now().date()
+        by_product = select(PromotionProduct.promotion_id).where(
+            PromotionProduct.product_id.in_(product_ids)
+        )
+        by_category = select(PromotionCategory.promotion_id).join(
+            Product, Product.category_id == PromotionCategory.category_id
+        ).where(Product.id.in_(product_ids))
+        
+        return self.db.query(Promotion).filter(
+            and_(
+                Promotion.is_active == True,
+                or_(Promotion.start_date.is_(None), Promotion.start_date <= today),
+                or_(Promotion.end_date.is_(None), Promotion.end_date >= today),
+                Promotion.id.in_(union(by_product, by_category))
             )
         ).all()
     
     def get_expiring_products(self, days_ahead: int = 30) -> List[Product]:
         """Get products expiring within specified days"""
-        expiry_date = datetime.now().date() + timedelta(days=days_ahead)
+        # date + integer stays a date, so the bound matches ix_products_expiring
+        expiry_date = func.current_date() + days_ahead
         return self.db.query(Product).filter(
             and_(
                 Product.is_active == True,
@@ -202,41 +361,45 @@ class InventoryService(BaseService):
     def create_purchase_order(self, supplier_id: str, items: List[Dict[str, Any]], 
                             created_by: str) -> PurchaseOrder:
         """Create a purchase order"""
-        # Generate PO number
-        po_count = self.db.query(PurchaseOrder).count() + 1
-        po_number = f"PO-{datetime.now().strftime('%Y%m%d')}-{po_count:04d}"
-        
-        # Calculate totals
-        subtotal = sum(item['quantity'] * item['unit_cost'] for item in items)
-        tax_amount = subtotal * 0.1  # 10% tax
-        total_amount = subtotal + tax_amount
-        
         # Create purchase order
+        # po_number is assigned by the database (next_po_number())
         po = PurchaseOrder(
-            po_number=po_number,
             supplier_id=supplier_id,
             order_date=datetime.now().date(),
             expected_delivery_date=datetime.now().date() + timedelta(days=7),
             status='pending',
-            subtotal=subtotal,
-            tax_amount=tax_amount,
-            total_amount=total_amount,
             created_by=created_by
         )
         
         self.db.add(po)
         self.db.flush()  # Get the ID
         
-        # Create purchase order items
-        for item in items:
-            poi = PurchaseOrderItem(
-                purchase_order_id=po.id,
-                product_id=item['product_id'],
-                quantity_ordered=item['quantity'],
-                unit_cost=item['unit_cost'],
-                line_total=item['quantity'] * item['unit_cost']
+        # Create purchase order items in one executemany
+        if items:
+            self.db.execute(insert(PurchaseOrderItem), [
+                {
+                    "purchase_order_id": po.id,
+                    "product_id": item['product_id'],
+                    "quantity_ordered": item['quantity'],
+                    "unit_cost": item['unit_cost']
+                }
+                for item in items
+            ])
+        
+        # Totals from the stored (generated) line totals, in one UPDATE
+        subtotal = select(
+            func.coalesce(func.sum(PurchaseOrderItem.line_total), 0)
+        ).where(PurchaseOrderItem.purchase_order_id == po.id).scalar_subquery()
+        self.db.execute(
+            update(PurchaseOrder)
+            .where(PurchaseOrder.id == po.id)
+            .values(
+                subtotal=subtotal,
+                tax_amount=subtotal * PO_TAX_RATE,
+                total_amount=subtotal * (1 + PO_TAX_RATE)
             )
-            self.db.add(poi)
+            .execution_options(synchronize_session=False)
+        )
         
         self.db.commit()
         self.db.refresh(po)
@@ -249,32 +412,64 @@ class InventoryService(BaseService):
             if not po:
                 return False
             
-            for item in received_items:
-                # Update purchase order item
-                poi = self.db.query(PurchaseOrderItem).filter(
-                    and_(
-                        PurchaseOrderItem.purchase_order_id == po_id,
-                        PurchaseOrderItem.product_id == item['product_id']
-                    )
-                ).first()
-                
-                if poi:
-                    poi.quantity_received = item['quantity_received']
-                    
-                    # Update product stock
-                    self.update_stock(
-                        product_id=item['product_id'],
-                        quantity=item['quantity_received'],
-                        movement_type='purchase',
-                        reference_id=po_id,
-                        notes=f"Received from PO {po.po_number}"
+            # PO items come with the order (selectin)
+            pois = {str(poi.product_id): poi for poi in po.items}
+            received = [item for item in received_items if str(item['product_id']) in pois]
+            
+            # Add every received quantity in one UPDATE ... FROM (VALUES ...):
+            # the database applies it to the current stock, so checkout
+            # decrements committed meanwhile are never overwritten
+            quantities: Dict[str, int] = {}
+            for item in received:
+                key = str(item['product_id'])
+                quantities[key] = quantities.get(key, 0) + item['quantity_received']
+            cost_prices = {}
+            if quantities:
+                received_rows = values(
+                    column("product_id", Product.id.type), column("quantity", Integer), name="received"
+                ).data([(pois[key].product_id, quantity) for key, quantity in quantities.items()])
+                cost_prices = {
+                    str(row.id): row.cost_price
+                    for row in self.db.execute(
+                        update(Product)
+                        # VALUES literals arrive untyped; compare as UUID
+                        .where(Product.id == cast(received_rows.c.product_id, Product.id.type))
+                        .values(current_stock=func.greatest(
+                            0, Product.current_stock + received_rows.c.quantity
+                        ))
+                        .returning(Product.id, Product.cost_price)
+                        .execution_options(synchronize_session=False)
                     )
+                }
+            
+            movements = []
+            for item in received:
+                key = str(item['product_id'])
+                if key not in cost_prices:
+                    continue
+                quantity = item['quantity_received']
+                cost_price = cost_prices[key]
+                pois[key].quantity_received = quantity
+                movements.append({
+                    "product_id": pois[key].product_id,
+                    "movement_type": 'purchase',
+                    "quantity": quantity,
+                    "unit_cost": cost_price,
+                    "total_cost": cost_price * quantity if cost_price else 0,
+                    "reference_id": po.id,
+                    "notes": f"Received from PO {po.po_number}"
+                })
+            
+            if movements:
+                self.db.execute(insert(StockMovement), movements)
             
             # Update PO status
             po.status = 'delivered'
             po.actual_delivery_date = datetime.now().date()
             
             self.db.commit()
+            logger.info(f"Received PO {po.po_number}: {len(movements)} lines stocked")
+            queue_inventory_rollup_refresh()
             return True
             
         except Exception as e:
@@ -282,26 +477,37 @@ class InventoryService(BaseService):
             self.db.rollback()
             return False
     
+    def _cached_reference(self, key: str, model) -> List[Any]:
+        """Get the active rows of a reference table through the TTL cache"""
+        entry = _reference_cache.get(key)
+        if not entry or entry[0] <= time.monotonic():
+            rows = self.db.query(model).filter(model.is_active == True).all()
+            for row in rows:
+                self.db.expunge(row)
+            entry = (time.monotonic() + REFERENCE_CACHE_TTL, rows)
+            _reference_cache[key] = entry
+        return [self.db.merge(row, load=False) for row in entry[1]]
+    
     def get_categories(self) -> List[Category]:
         """Get all categories"""
-        return self.db.query(Category).filter(Category.is_active == True).all()
+        return self._cached_reference("categories", Category)
     
-    def create_category(self, category_data: Dict[str, Any]) -> Category:
-        """Create a new category"""
+    def create_category(self, category_data: Dict[str, Any], commit: bool = True) -> Category:
+        """Create a new category (commit=False leaves the transaction open)"""
         category = Category(**category_data)
         self.db.add(category)
-        self.db.commit()
-        self.db.refresh(category)
+        self._save(category, commit)
+        _reference_cache.pop("categories", None)
         return category
     
     def get_suppliers(self) -> List[Supplier]:
         """Get all suppliers"""
-        return self.db.query(Supplier).filter(Supplier.is_active == True).all()
+        return self._cached_reference("suppliers", Supplier)
     
-    def create_supplier(self, supplier_data: Dict[str, Any]) -> Supplier:
-        """Create a new supplier"""
+    def create_supplier(self, supplier_data: Dict[str, Any], commit: bool = True) -> Supplier:
+        """Create a new supplier (commit=False leaves the transaction open)"""
         supplier = Supplier(**supplier_data)
         self.db.add(supplier)
-        self.db.commit()
-        self.db.refresh(supplier)
+        self._save(supplier, commit)
+        _reference_cache.pop("suppliers", None)
         return supplier
@@ -2,21 +2,79 @@
 Notification service for email, SMS, and push notifications
 """
 
-from typing import Dict, List, Any, Optional
+from typing import Dict, Iterator, List, Any, Optional
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
 from sqlalchemy.orm import Session
 import smtplib
 import os
+import re
+import html
 import logging
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 from datetime import datetime
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import json
 
 from .base_service import BaseService
 
 logger = logging.getLogger(__name__)
 
+# Recipients per background task: each task reuses one SMTP connection, and
+# several tasks let workers deliver a large list in parallel
+EMAIL_BATCH_SIZE = int(os.getenv("EMAIL_BATCH_SIZE", "50"))
+
+# SMTP connections used in parallel within one send_emails call
+EMAIL_SEND_CONCURRENCY = int(os.getenv("EMAIL_SEND_CONCURRENCY", "4"))
+
+def _build_http_session() -> requests.Session:
+    """HTTP session with a keep-alive pool for SMS/push gateway calls"""
+    session = requests.Session()
+    # POST is not in Retry's default allowed methods, so only failed
+    # connections are retried and a message is never sent twice
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=32,
+                          max_retries=Retry(total=3, backoff_factor=0.2))
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+# Shared by all service instances so connections survive across requests
+_HTTP_SESSION = _build_http_session()
+
+# Placeholders filled in promotional content, matched in a single pass
+PROMO_PLACEHOLDER_PATTERN = re.compile(r"\{(customer_name|discount_code)\}")
+
+# Static notification templates, shared rather than rebuilt per call
+NOTIFICATION_TEMPLATES = {
+    'email_templates': {
+        'order_confirmation': {
+            'subject': 'Order Confirmation - {transaction_number}',
+            'body': 'Thank you for your purchase! Your order has been confirmed.'
+        },
+        'low_stock_alert': {
+            'subject': 'Low Stock Alert: {product_name}',
+            'body': 'Product {product_name} is running low on stock.'
+        },
+        'promotional': {
+            'subject': 'Special Offer - {promotion_name}',
+            'body': 'Check out our latest promotion!'
+        }
+    },
+    'sms_templates': {
+        'delivery_notification': 'Your order {order_number} will be delivered on {delivery_date}.',
+        'order_ready': 'Your order {order_number} is ready for pickup.',
+        'promotional': 'Special offer: {promotion_text}'
+    },
+    'push_templates': {
+        'order_update': 'Your order {order_number} status has been updated.',
+        'promotional': 'New promotion available: {promotion_name}',
+        'low_stock': 'Some items in your cart are running low on stock.'
+    }
+}
+
 class NotificationService(BaseService):
     """Service for sending notifications via email, SMS, and push"""
     
@@ -28,6 +86,38 @@ class NotificationService(BaseService):
         self.email_password = os.getenv("EMAIL_PASSWORD")
         self.email_from_name = os.getenv("EMAIL_FROM_NAME", "Grocery Management System")
         self.email_from_address = os.getenv("EMAIL_FROM_ADDRESS")
+        self.sms_api_url = os.getenv("SMS_API_URL")
+        self.sms_api_key = os.getenv("SMS_API_KEY")
+        self.push_api_url = os.getenv("PUSH_API_URL")
+        self.push_api_key = os.getenv("PUSH_API_KEY")
+        self.http = _HTTP_SESSION
+    
+    @contextmanager
+    def _smtp_session(self) -> Iterator[smtplib.SMTP]:
+        """Open one authenticated SMTP connection for a batch of messages"""
+        server = smtplib.SMTP(self.smtp_server, self.smtp_port)
+        try:
+            server.starttls()
+            server.login(self.email_username, self.email_password)
+            yield server
+        finally:
+            try:
+                server.quit()
+            except smtplib.SMTPException:
+                server.close()
+    
+    def _build_mime(self, to_email: str, subject: str, body: str, is_html: bool) -> MIMEMultipart:
+        """Build an email message; bulk sends reuse it and swap the To header"""
+        msg = MIMEMultipart('alternative')
+        msg['From'] = f"{self.email_from_name} <{self.email_from_address}>"
+        msg['To'] = to_email
+        msg['Subject'] = subject
+        msg.attach(MIMEText(body, 'html' if is_html else 'plain'))
+        return msg
+    
+    def _build_message(self, to_email: str, subject: str, body: str, is_html: bool) -> str:
+        """Render an email message for sending"""
+        return self._build_mime(to_email, subject, body, is_html).as_string()
     
     def send_email(self, to_email: str, subject: str, body: str, 
                    is_html: bool = False) -> Dict[str, Any]:
@@ -39,25 +129,9 @@ class NotificationService(BaseService):
                     'error': 'Email configuration not set'
                 }
             
-            # Create message
-            msg = MIMEMultipart('alternative')
-            msg['From'] = f"{self.email_from_name} <{self.email_from_address}>"
-            msg['To'] = to_email
-            msg['Subject'] = subject
-            
-            # Add body
-            if is_html:
-                msg.attach(MIMEText(body, 'html'))
-            else:
-                msg.attach(MIMEText(body, 'plain'))
-            
-            # Send email
-            server = smtplib.SMTP(self.smtp_server, self.smtp_port)
-            server.starttls()
-            server.login(self.email_username, self.email_password)
-            text = msg.as_string()
-            server.sendmail(self.email_from_address, to_email, text)
-            server.quit()
+            with self._smtp_session() as server:
+                server.sendmail(self.email_from_address, to_email,
+                                self._build_message(to_email, subject, body, is_html))
             
             logger.info(f"Email sent successfully to {to_email}")
             return {
@@ -75,6 +149,85 @@ class NotificationService(BaseService):
                 'error_message': str(e)
             }
     
+    def send_emails(self, to_emails: List[str], subject: str, body: str, 
+                    is_html: bool = False) -> List[Dict[str, Any]]:
+        """Send the same email to many recipients over a few parallel SMTP connections"""
+        if not to_emails:
+            return []
+        if not self.email_username or not self.email_password:
+            return [{'email': email, 'success': False} for email in to_emails]
+        
+        # Interleaved slices, one per connection; delivery is network-bound
+        workers = max(1, min(EMAIL_SEND_CONCURRENCY, len(to_emails) // 10))
+        if workers == 1:
+            results = self._send_over_session(to_emails, subject, body, is_html)
+        else:
+            slices = [to_emails[i::workers] for i in range(workers)]
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                sliced_results = list(pool.map(
+                    lambda chunk: self._send_over_session(chunk, subject, body, is_html), slices
+                ))
+            # Restore the caller's recipient order
+            results = [None] * len(to_emails)
+            for offset, chunk_results in enumerate(sliced_results):
+                results[offset::workers] = chunk_results
+        
+        logger.info(f"Batch email sent to {sum(r['success'] for r in results)}/{len(to_emails)} recipients")
+        return results
+    
+    def _send_over_session(self, to_emails: List[str], subject: str, body: str, 
+                           is_html: bool) -> List[Dict[str, Any]]:
+        """Send one email per recipient over a single SMTP connection"""
+        results = []
+        # One message per connection; only the To header changes per recipient
+        msg = self._build_mime(to_emails[0], subject, body, is_html)
+        try:
+            with self._smtp_session() as server:
+                for email in to_emails:
+                    try:
+                        msg.replace_header('To', email)
+                        server.sendmail(self.email_from_address, email, msg.as_string())
+                        results.append({'email': email, 'success': True})
+                    except (smtplib.SMTPRecipientsRefused, smtplib.SMTPDataError) as e:
+                        logger.error(f"Error sending email to {email}: {e}")
+                        results.append({'email': email, 'success': False})
+        except Exception as e:
+            logger.error(f"Error sending batch email: {e}")
+        
+        # Recipients not reached before a connection failure count as failed
+        results.extend({'email': email, 'success': False} for email in to_emails[len(results):])
+        return results
+    
+    def queue_emails(self, to_emails: List[str], subject: str, body: str, 
+                     is_html: bool = False) -> Dict[str, Any]:
+        """Hand emails to the background workers and return without waiting for delivery"""
+        task_ids = []
+        queued = 0
+        try:
+            from workers.celery_worker import send_emails_task
+            
+            for i in range(0, len(to_emails), EMAIL_BATCH_SIZE):
+                batch = to_emails[i:i + EMAIL_BATCH_SIZE]
+                task_ids.append(send_emails_task.delay(batch, subject, body, is_html).id)
+                queued += len(batch)
+            logger.info(f"Queued email '{subject}' for {len(to_emails)} recipients in {len(task_ids)} tasks")
+            return {
+                'success': True,
+                'queued': queued,
+                'task_ids': task_ids
+            }
+        except Exception as e:
+            # Broker unavailable: deliver the batches not yet queued inline rather
+            # than drop them; queued batches are left to the workers
+            logger.error(f"Error queueing email, sending {len(to_emails) - queued} inline: {e}")
+            results = self.send_emails(to_emails[queued:], subject, body, is_html)
+            return {
+                'success': bool(queued) or any(r['success'] for r in results),
+                'queued': queued,
+                'task_ids': task_ids,
+                'results': results
+            }
+    
     def send_sms(self, phone_number: str, message: str) -> Dict[str, Any]:
         """Send SMS notification (placeholder for SMS service integration)"""
         try:
@@ -84,7 +237,15 @@ class NotificationService(BaseService):
             # - Vonage
             # - Local SMS gateways
             
-            # For now, simulate successful SMS sending
+            # Post to the configured gateway; otherwise simulate sending
+            if self.sms_api_url:
+                response = self.http.post(
+                    self.sms_api_url,
+                    json={'to': phone_number, 'message': message},
+                    headers={'Authorization': f"Bearer {self.sms_api_key}"},
+                    timeout=10
+                )
+                response.raise_for_status()
             logger.info(f"SMS sent to {phone_number}: {message}")
             return {
                 'success': True,
@@ -111,7 +272,15 @@ class NotificationService(BaseService):
             # - OneSignal
             # - Pusher
             
-            # For now, simulate successful push notification
+            # Post to the configured gateway; otherwise simulate sending
+            if self.push_api_url:
+                response = self.http.post(
+                    self.push_api_url,
+                    json={'user_id': user_id, 'title': title, 'body': body, 'data': data or {}},
+                    headers={'Authorization': f"Bearer {self.push_api_key}"},
+                    timeout=10
+                )
+                response.raise_for_status()
             logger.info(f"Push notification sent to user {user_id}: {title}")
             return {
                 'success': True,
@@ -144,19 +313,9 @@ class NotificationService(BaseService):
         Generated by Grocery Management System
         """
         
-        results = []
-        for email in staff_emails:
-            result = self.send_email(email, subject, body)
-            results.append({
-                'email': email,
-                'success': result['success']
-            })
-        
-        return {
-            'success': any(r['success'] for r in results),
-            'results': results,
-            'product_name': product_name
-        }
+        result = self.queue_emails(staff_emails, subject, body)
+        result['product_name'] = product_name
+        return result
     
     def send_order_confirmation(self, customer_email: str, transaction_number: str, 
                               total_amount: float, items: List[Dict[str, Any]]) -> Dict[str, Any]:
@@ -164,9 +323,8 @@ class NotificationService(BaseService):
         subject = f"Order Confirmation - {transaction_number}"
         
         # Create HTML email body
-        items_html = ""
-        for item in items:
-            items_html += f"""
+        items_html = "".join(
+            f"""
             <tr>
                 <td>{item['name']}</td>
                 <td>{item['quantity']}</td>
@@ -174,6 +332,8 @@ class NotificationService(BaseService):
                 <td>${item['line_total']:.2f}</td>
             </tr>
             """
+            for item in items
+        )
         
         body = f"""
         <html>
@@ -202,35 +362,24 @@ class NotificationService(BaseService):
         </html>
         """
         
-        return self.send_email(customer_email, subject, body, is_html=True)
+        return self.queue_emails([customer_email], subject, body, is_html=True)
     
     def send_promotional_email(self, customer_emails: List[str], subject: str, 
                              content: str, promotion_data: Dict[str, Any] = None) -> Dict[str, Any]:
         """Send promotional email to multiple customers"""
-        results = []
-        for email in customer_emails:
-            # Personalize content
-            personalized_content = content
-            if promotion_data:
-                personalized_content = personalized_content.replace(
-                    '{customer_name}', promotion_data.get('customer_name', 'Valued Customer')
-                )
-                personalized_content = personalized_content.replace(
-                    '{discount_code}', promotion_data.get('discount_code', '')
-                )
-            
-            result = self.send_email(email, subject, personalized_content, is_html=True)
-            results.append({
-                'email': email,
-                'success': result['success']
-            })
+        # Personalize content (the same promotion data applies to every recipient);
+        # one scan of the body, values escaped since the email is HTML
+        personalized_content = content
+        if promotion_data:
+            values = {
+                'customer_name': html.escape(promotion_data.get('customer_name', 'Valued Customer')),
+                'discount_code': html.escape(promotion_data.get('discount_code', ''))
+            }
+            personalized_content = PROMO_PLACEHOLDER_PATTERN.sub(
+                lambda match: values[match.group(1)], content
+            )
         
-        return {
-            'success': any(r['success'] for r in results),
-            'total_sent': len([r for r in results if r['success']]),
-            'total_failed': len([r for r in results if not r['success']]),
-            'results': results
-        }
+        return self.queue_emails(customer_emails, subject, personalized_content, is_html=True)
     
     def send_delivery_notification(self, customer_phone: str, delivery_date: str, 
                                  order_number: str) -> Dict[str, Any]:
@@ -258,19 +407,9 @@ class NotificationService(BaseService):
         Grocery Management System
         """
         
-        results = []
-        for email in admin_emails:
-            result = self.send_email(email, subject, body)
-            results.append({
-                'email': email,
-                'success': result['success']
-            })
-        
-        return {
-            'success': any(r['success'] for r in results),
-            'alert_type': alert_type,
-            'results': results
-        }
+        result = self.queue_emails(admin_emails, subject, body)
+        result['alert_type'] = alert_type
+        return result
     
     def send_customer_feedback_request(self, customer_email: str, customer_name: str, 
                                      transaction_number: str) -> Dict[str, Any]:
@@ -306,33 +445,8 @@ class NotificationService(BaseService):
         </html>
         """
         
-        return self.send_email(customer_email, subject, body, is_html=True)
+        return self.queue_emails([customer_email], subject, body, is_html=True)
     
     def get_notification_templates(self) -> Dict[str, Any]:
         """Get available notification templates"""
-        return {
-            'email_templates': {
-                'order_confirmation': {
-                    'subject': 'Order Confirmation - {transaction_number}',
-                    'body': 'Thank you for your purchase! Your order has been confirmed.'
-                },
-                'low_stock_alert': {
-                    'subject': 'Low Stock Alert: {product_name}',
-                    'body': 'Product {product_name} is running low on stock.'
-                },
-                'promotional': {
-                    'subject': 'Special Offer - {promotion_name}',
-                    'body': 'Check out our latest promotion!'
-                }
-            },
-            'sms_templates': {
-                'delivery_notification': 'Your order {order_number} will be delivered on {delivery_date}.',
-                'order_ready': 'Your order {order_number} is ready for pickup.',
-                'promotional': 'Special offer: {promotion_text}'
-            },
-            'push_templates': {
-                'order_update': 'Your order {order_number} status has been updated.',
-                'promotional': 'New promotion available: {promotion_name}',
-                'low_stock': 'Some items in your cart are running low on stock.'
-            }
-        }
+        return NOTIFICATION_TEMPLATES
@@ -2,20 +2,252 @@
 Payment processing service
 """
 
-from typing import Dict, List, Any, Optional
+from typing import Callable, Dict, Any, Mapping, Optional, Sequence
+from collections import OrderedDict
+from types import MappingProxyType
 from sqlalchemy.orm import Session
+from concurrent.futures import Future, ThreadPoolExecutor
+from prometheus_client import Counter, Gauge
 import stripe
+import requests
+from requests.adapters import HTTPAdapter
 import os
+import time
+import json
+import asyncio
+import threading
+import hashlib
 import logging
-from datetime import datetime
+from decimal import Decimal, ROUND_HALF_UP
 
 from .base_service import BaseService
 
 logger = logging.getLogger(__name__)
 
+def _to_cents(amount: Any) -> int:
+    """Convert a money amount to integer cents, rounding half up"""
+    return int(Decimal(str(amount)).scaleb(2).quantize(Decimal(1), rounding=ROUND_HALF_UP))
+
+def _apply_rate(cents: int, rate: Any) -> int:
+    """Apply a fractional rate to an amount in cents, rounding half up"""
+    return int((cents * Decimal(str(rate))).quantize(Decimal(1), rounding=ROUND_HALF_UP))
+
 # Configure Stripe
 stripe.api_key = os.getenv("STRIPE_SECRET_KEY")
 
+def _build_stripe_http_client() -> stripe.http_client.RequestsClient:
+    """Stripe HTTP client on a keep-alive pool shared by all calls"""
+    session = requests.Session()
+    # Retries are left to the SDK, which resends with the same idempotency key
+    session.mount("https://", HTTPAdapter(pool_connections=20, pool_maxsize=100))
+    return stripe.http_client.RequestsClient(session=session)
+
+stripe.default_http_client = _build_stripe_http_client()
+stripe.max_network_retries = 2
+
+# Async Stripe calls share a small worker pool with a bounded backlog so a
+# burst of payments queues up (FIFO) instead of triggering 429s; callers
+# past the backlog limit are turned away immediately
+STRIPE_CONCURRENCY = int(os.getenv("STRIPE_CONCURRENCY", "5"))
+STRIPE_QUEUE_LIMIT = int(os.getenv("STRIPE_QUEUE_LIMIT", "100"))
+STRIPE_CALL_TIMEOUT = float(os.getenv("STRIPE_CALL_TIMEOUT", "60"))
+_stripe_executor = ThreadPoolExecutor(max_workers=STRIPE_CONCURRENCY, thread_name_prefix="stripe")
+# Calls queued or running on the pool. Released only when the pool's future
+# finishes (or is cancelled before starting), never when a caller gives up,
+# so a slow Stripe cannot push more work into the pool than the bound allows.
+_stripe_pending = 0
+_stripe_lock = threading.Lock()
+
+STRIPE_QUEUE_DEPTH = Gauge("stripe_queue_depth", "Stripe calls waiting for a worker")
+STRIPE_IN_FLIGHT = Gauge("stripe_in_flight", "Stripe calls in progress")
+STRIPE_REJECTED = Counter("stripe_rejected_total", "Stripe calls rejected because the queue was full")
+
+def _run_stripe_call(job: Dict[str, Any], call: Callable[..., Dict[str, Any]], args: tuple,
+                     kwargs: Dict[str, Any]) -> Dict[str, Any]:
+    """Run one queued Stripe call on a pool worker"""
+    with _stripe_lock:
+        job['started'] = True
+        STRIPE_QUEUE_DEPTH.dec()
+    with STRIPE_IN_FLIGHT.track_inprogress():
+        return call(*args, **kwargs)
+
+def _release_stripe_call(job: Dict[str, Any], future: Future) -> None:
+    """Free a queue slot once the pool is done with a call"""
+    global _stripe_pending
+    with _stripe_lock:
+        _stripe_pending -= 1
+        if not job['started']:
+            # Cancelled while still queued: _run_stripe_call never ran
+            STRIPE_QUEUE_DEPTH.dec()
+
+async def _submit_stripe_call(call: Callable[..., Dict[str, Any]], *args, **kwargs) -> Dict[str, Any]:
+    """Queue a Stripe call on the bounded pool and await its result"""
+    global _stripe_pending
+    with _stripe_lock:
+        if _stripe_pending >= STRIPE_CONCURRENCY + STRIPE_QUEUE_LIMIT:
+            STRIPE_REJECTED.inc()
+            return {
+                'success': False,
+                'error': 'Payment service busy',
+                'status_code': 503
+            }
+        _stripe_pending += 1
+        STRIPE_QUEUE_DEPTH.inc()
+    
+    job = {'started': False}
+    future = _stripe_executor.submit(_run_stripe_call, job, call, args, kwargs)
+    future.add_done_callback(lambda done: _release_stripe_call(job, done))
+    try:
+        # On timeout the wrapper cancels the pool future, which only takes
+        # effect if the call has not started yet
+        return await asyncio.wait_for(asyncio.wrap_future(future), STRIPE_CALL_TIMEOUT)
+    except asyncio.TimeoutError:
+        logger.error(f"Stripe call timed out after {STRIPE_CALL_TIMEOUT}s")
+        return {
+            'success': False,
+            'error': 'Payment service timeout',
+            # A call that had already started may still complete at Stripe;
+            # retry with the same idempotency key to learn its outcome
+            'outcome_unknown': job['started'],
+            'status_code': 504
+        }
+
+# Succeeded is a terminal PaymentIntent status, so confirmations of paid
+# intents are served from memory: payment_intent_id -> (expires_at, result).
+# Entries share one TTL and are kept in insertion order, so expired entries
+# are swept from the front on insert and the oldest go first past the cap.
+PAYMENT_CACHE_TTL = int(os.getenv("PAYMENT_CACHE_TTL", "3600"))
+PAYMENT_CACHE_SIZE = int(os.getenv("PAYMENT_CACHE_SIZE", "10000"))
+_succeeded_payments: "OrderedDict[str, tuple]" = OrderedDict()
+_succeeded_lock = threading.Lock()
+
+def _cache_succeeded(intent: Any) -> Dict[str, Any]:
+    """Record a succeeded PaymentIntent and return its confirmation result"""
+    result = {
+        'success': True,
+        'payment_intent_id': intent.id,
+        'status': intent.status,
+        'amount': intent.amount / 100,
+        'currency': intent.currency
+    }
+    now = time.monotonic()
+    with _succeeded_lock:
+        while _succeeded_payments:
+            oldest = next(iter(_succeeded_payments.values()))
+            if oldest[0] > now and len(_succeeded_payments) < PAYMENT_CACHE_SIZE:
+                break
+            _succeeded_payments.popitem(last=False)
+        _succeeded_payments.pop(intent.id, None)
+        _succeeded_payments[intent.id] = (now + PAYMENT_CACHE_TTL, result)
+    return dict(result)
+
+# Signed webhook deliveries fill the confirmation cache ahead of any poll;
+# Stripe redelivers events, so handled event ids are remembered for a day.
+# Kept in insertion order with one TTL, so expired ids are popped from the
+# front; the lock makes check-and-record atomic across threadpool calls.
+STRIPE_WEBHOOK_SECRET = os.getenv("STRIPE_WEBHOOK_SECRET")
+WEBHOOK_EVENT_TTL = 86400
+_handled_events: "OrderedDict[str, float]" = OrderedDict()
+_handled_lock = threading.Lock()
+
+def _first_delivery(event_id: str) -> bool:
+    """Record a webhook event id; False if it was already handled"""
+    now = time.monotonic()
+    with _handled_lock:
+        while _handled_events and next(iter(_handled_events.values())) <= now:
+            _handled_events.popitem(last=False)
+        if event_id in _handled_events:
+            return False
+        _handled_events[event_id] = now + WEBHOOK_EVENT_TTL
+        return True
+
+# Idempotency-Key replay store: key -> (expires_at, request_hash, result).
+# A retried request with the same key and parameters gets the original result;
+# the same key with different parameters is rejected. Kept in insertion order
+# with one TTL, so expired keys are popped from the front on each insert.
+IDEMPOTENCY_TTL = int(os.getenv("IDEMPOTENCY_TTL", "86400"))
+_idempotent_results: "OrderedDict[str, tuple]" = OrderedDict()
+_idempotent_lock = threading.Lock()
+
+def _request_hash(params: Dict[str, Any]) -> str:
+    """SHA-256 of the canonical JSON form of request parameters"""
+    return hashlib.sha256(json.dumps(params, sort_keys=True, default=str).encode()).hexdigest()
+
+def _replay(idempotency_key: str, request_hash: str) -> Optional[Dict[str, Any]]:
+    """Stored result for a repeated idempotency key, or None for a new request"""
+    entry = _idempotent_results.get(idempotency_key)
+    if not entry or entry[0] <= time.monotonic():
+        return None
+    if entry[1] != request_hash:
+        return {
+            'success': False,
+            'error': 'Idempotency key reused with different parameters',
+            'status_code': 422
+        }
+    return dict(entry[2])
+
+def _remember(idempotency_key: str, request_hash: str, result: Dict[str, Any]) -> None:
+    """Store a successful result and sweep expired keys"""
+    now = time.monotonic()
+    with _idempotent_lock:
+        while _idempotent_results and next(iter(_idempotent_results.values()))[0] <= now:
+            _idempotent_results.popitem(last=False)
+        _idempotent_results.pop(idempotency_key, None)
+        _idempotent_results[idempotency_key] = (now + IDEMPOTENCY_TTL, request_hash, result)
+
+# Card payment failures by Stripe error class: (log label, user-facing error).
+# Looked up along the exception's MRO so subclasses map to their parent's entry.
+STRIPE_ERRORS = {
+    stripe.error.CardError: ("Card error", "Card was declined"),
+    stripe.error.RateLimitError: ("Rate limit error", "Too many requests"),
+    stripe.error.InvalidRequestError: ("Invalid request error", "Invalid request"),
+    stripe.error.AuthenticationError: ("Authentication error", "Authentication failed"),
+    stripe.error.APIConnectionError: ("API connection error", "Network error"),
+    stripe.error.StripeError: ("Stripe error", "Payment processing error"),
+}
+
+def _stripe_error_result(e: stripe.error.StripeError) -> Dict[str, Any]:
+    """Log a Stripe error and build the failed payment result for it"""
+    label, error = next(STRIPE_ERRORS[cls] for cls in type(e).__mro__ if cls in STRIPE_ERRORS)
+    logger.error(f"{label}: {e}")
+    result = {
+        'success': False,
+        'error': error,
+        'error_message': str(e)
+    }
+    if isinstance(e, stripe.error.CardError):
+        result['error_code'] = e.code
+    return result
+
+# Static payment method catalog, built once and shared by every call. It is
+# read-only (a tuple of mapping views); a router that needs mutable dicts copies.
+PAYMENT_METHODS = (
+    MappingProxyType({
+        'id': 'cash',
+        'name': 'Cash',
+        'description': 'Pay with cash',
+        'enabled': True
+    }),
+    MappingProxyType({
+        'id': 'card',
+        'name': 'Credit/Debit Card',
+        'description': 'Pay with card',
+        'enabled': True
+    }),
+    MappingProxyType({
+        'id': 'mobile',
+        'name': 'Mobile Payment',
+        'description': 'Pay with mobile wallet',
+        'enabled': True
+    }),
+    MappingProxyType({
+        'id': 'loyalty_points',
+        'name': 'Loyalty Points',
+        'description': 'Pay with loyalty points',
+        'enabled': True
+    }),
+)
+
 class PaymentService(BaseService):
     """Service for payment processing operations"""
     
@@ -23,21 +255,35 @@ class PaymentService(BaseService):
         super().__init__(db)
     
     def process_card_payment(self, amount: float, currency: str = 'usd', 
-                           customer_email: str = None, description: str = None) -> Dict[str, Any]:
+                           customer_email: str = None, description: str = None,
+                           idempotency_key: str = None, order_id: str = None) -> Dict[str, Any]:
         """Process card payment using Stripe"""
+        # A retried checkout for the same order reuses its key by default
+        if not idempotency_key and order_id:
+            idempotency_key = f"card-payment-{order_id}"
+        if idempotency_key:
+            request_hash = _request_hash({
+                'amount': amount, 'currency': currency,
+                'customer_email': customer_email, 'description': description
+            })
+            replayed = _replay(idempotency_key, request_hash)
+            if replayed:
+                return replayed
+        
         try:
-            # Create payment intent
+            # Create payment intent; Stripe also dedupes on the idempotency key
             intent = stripe.PaymentIntent.create(
-                amount=int(amount * 100),  # Convert to cents
+                amount=_to_cents(amount),
                 currency=currency,
                 automatic_payment_methods={'enabled': True},
                 metadata={
                     'customer_email': customer_email or '',
                     'description': description or 'Grocery Store Purchase'
-                }
+                },
+                idempotency_key=idempotency_key
             )
             
-            return {
+            result = {
                 'success': True,
                 'payment_intent_id': intent.id,
                 'client_secret': intent.client_secret,
@@ -45,50 +291,12 @@ class PaymentService(BaseService):
                 'amount': amount,
                 'currency': currency
             }
+            if idempotency_key:
+                _remember(idempotency_key, request_hash, result)
+            return result
             
-        except stripe.error.CardError as e:
-            logger.error(f"Card error: {e}")
-            return {
-                'success': False,
-                'error': 'Card was declined',
-                'error_code': e.code,
-                'error_message': str(e)
-            }
-        except stripe.error.RateLimitError as e:
-            logger.error(f"Rate limit error: {e}")
-            return {
-                'success': False,
-                'error': 'Too many requests',
-                'error_message': str(e)
-            }
-        except stripe.error.InvalidRequestError as e:
-            logger.error(f"Invalid request error: {e}")
-            return {
-                'success': False,
-                'error': 'Invalid request',
-                'error_message': str(e)
-            }
-        except stripe.error.AuthenticationError as e:
-            logger.error(f"Authentication error: {e}")
-            return {
-                'success': False,
-                'error': 'Authentication failed',
-                'error_message': str(e)
-            }
-        except stripe.error.APIConnectionError as e:
-            logger.error(f"API connection error: {e}")
-            return {
-                'success': False,
-                'error': 'Network error',
-                'error_message': str(e)
-            }
         except stripe.error.StripeError as e:
-            logger.error(f"Stripe error: {e}")
-            return {
-                'success': False,
-                'error': 'Payment processing error',
-                'error_message': str(e)
-            }
+            return _stripe_error_result(e)
         except Exception as e:
             logger.error(f"Unexpected error: {e}")
             return {
@@ -99,17 +307,15 @@ class PaymentService(BaseService):
     
     def confirm_payment(self, payment_intent_id: str) -> Dict[str, Any]:
         """Confirm a payment intent"""
+        entry = _succeeded_payments.get(payment_intent_id)
+        if entry and entry[0] > time.monotonic():
+            return dict(entry[1])
+        
         try:
             intent = stripe.PaymentIntent.retrieve(payment_intent_id)
             
             if intent.status == 'succeeded':
-                return {
-                    'success': True,
-                    'payment_intent_id': intent.id,
-                    'status': intent.status,
-                    'amount': intent.amount / 100,
-                    'currency': intent.currency
-                }
+                return _cache_succeeded(intent)
             else:
                 return {
                     'success': False,
@@ -132,9 +338,44 @@ class PaymentService(BaseService):
                 'error_message': str(e)
             }
     
+    def handle_webhook(self, payload: bytes, sig_header: str) -> Dict[str, Any]:
+        """Verify a Stripe webhook delivery and record succeeded payment intents"""
+        try:
+            event = stripe.Webhook.construct_event(payload, sig_header, STRIPE_WEBHOOK_SECRET)
+        except (ValueError, stripe.error.SignatureVerificationError) as e:
+            logger.error(f"Rejected Stripe webhook: {e}")
+            return {
+                'success': False,
+                'error': 'Invalid webhook signature',
+                'status_code': 400
+            }
+        
+        if not _first_delivery(event.id):
+            return {'success': True, 'event_id': event.id, 'duplicate': True}
+        
+        if event.type == 'payment_intent.succeeded':
+            _cache_succeeded(event.data.object)
+        
+        return {'success': True, 'event_id': event.id, 'duplicate': False}
+    
     def refund_payment(self, payment_intent_id: str, amount: float = None, 
-                      reason: str = 'requested_by_customer') -> Dict[str, Any]:
+                      reason: str = 'requested_by_customer',
+                      idempotency_key: str = None, transaction_id: str = None) -> Dict[str, Any]:
         """Refund a payment"""
+        # A retried return for the same transaction reuses its key by default;
+        # a full refund can only happen once per intent, so it is keyed by it
+        if not idempotency_key and transaction_id:
+            idempotency_key = f"refund-{transaction_id}"
+        elif not idempotency_key and amount is None:
+            idempotency_key = f"refund-{payment_intent_id}-full"
+        if idempotency_key:
+            request_hash = _request_hash({
+                'payment_intent_id': payment_intent_id, 'amount': amount, 'reason': reason
+            })
+            replayed = _replay(idempotency_key, request_hash)
+            if replayed:
+                return replayed
+        
         try:
             refund_data = {
                 'payment_intent': payment_intent_id,
@@ -142,17 +383,20 @@ class PaymentService(BaseService):
             }
             
             if amount:
-                refund_data['amount'] = int(amount * 100)  # Convert to cents
+                refund_data['amount'] = _to_cents(amount)
             
-            refund = stripe.Refund.create(**refund_data)
+            refund = stripe.Refund.create(**refund_data, idempotency_key=idempotency_key)
             
-            return {
+            result = {
                 'success': True,
                 'refund_id': refund.id,
                 'amount': refund.amount / 100,
                 'status': refund.status,
                 'reason': refund.reason
             }
+            if idempotency_key:
+                _remember(idempotency_key, request_hash, result)
+            return result
             
         except stripe.error.StripeError as e:
             logger.error(f"Stripe error processing refund: {e}")
@@ -169,35 +413,43 @@ class PaymentService(BaseService):
                 'error_message': str(e)
             }
     
-    def process_cash_payment(self, amount: float, received_amount: float) -> Dict[str, Any]:
+    # Async entry points for event-loop callers: the blocking Stripe round trip
+    # runs on the bounded Stripe pool so the loop keeps serving other requests
+    async def process_card_payment_async(self, *args, **kwargs) -> Dict[str, Any]:
+        """Process card payment without blocking the event loop"""
+        return await _submit_stripe_call(self.process_card_payment, *args, **kwargs)
+    
+    async def confirm_payment_async(self, payment_intent_id: str) -> Dict[str, Any]:
+        """Confirm a payment intent without blocking the event loop"""
+        return await _submit_stripe_call(self.confirm_payment, payment_intent_id)
+    
+    async def refund_payment_async(self, *args, **kwargs) -> Dict[str, Any]:
+        """Refund a payment without blocking the event loop"""
+        return await _submit_stripe_call(self.refund_payment, *args, **kwargs)
+    
+    @staticmethod
+    def process_cash_payment(amount: float, received_amount: float) -> Dict[str, Any]:
         """Process cash payment"""
-        try:
-            if received_amount < amount:
-                return {
-                    'success': False,
-                    'error': 'Insufficient cash received',
-                    'required_amount': amount,
-                    'received_amount': received_amount,
-                    'shortage': amount - received_amount
-                }
-            
-            change = received_amount - amount
-            
-            return {
-                'success': True,
-                'payment_method': 'cash',
-                'amount': amount,
-                'received_amount': received_amount,
-                'change': change
-            }
-            
-        except Exception as e:
-            logger.error(f"Error processing cash payment: {e}")
+        amount_cents = _to_cents(amount)
+        received_cents = _to_cents(received_amount)
+        if received_cents < amount_cents:
             return {
                 'success': False,
-                'error': 'Cash payment processing failed',
-                'error_message': str(e)
+                'error': 'Insufficient cash received',
+                'required_amount': amount,
+                'received_amount': received_amount,
+                'shortage': (amount_cents - received_cents) / 100
             }
+        
+        change = (received_cents - amount_cents) / 100
+        
+        return {
+            'success': True,
+            'payment_method': 'cash',
+            'amount': amount,
+            'received_amount': received_amount,
+            'change': change
+        }
     
     def process_mobile_payment(self, payment_method: str, amount: float, 
                              phone_number: str = None) -> Dict[str, Any]:
@@ -214,7 +466,7 @@ class PaymentService(BaseService):
                 'success': True,
                 'payment_method': payment_method,
                 'amount': amount,
-                'transaction_id': f"MOBILE_{datetime.now().strftime('%Y%m%d%H%M%S')}",
+                'transaction_id': f"MOBILE_{time.strftime('%Y%m%d%H%M%S')}",
                 'phone_number': phone_number
             }
             
@@ -226,66 +478,34 @@ class PaymentService(BaseService):
                 'error_message': str(e)
             }
     
-    def process_loyalty_points_payment(self, points_used: int, points_available: int, 
-                                     points_value: float = 0.01) -> Dict[str, Any]:
+    @staticmethod
+    def process_loyalty_points_payment(points_used: int, points_available: int, 
+                                       points_value: float = 0.01) -> Dict[str, Any]:
         """Process loyalty points payment"""
-        try:
-            if points_used > points_available:
-                return {
-                    'success': False,
-                    'error': 'Insufficient loyalty points',
-                    'points_available': points_available,
-                    'points_requested': points_used
-                }
-            
-            points_value_amount = points_used * points_value
-            
-            return {
-                'success': True,
-                'payment_method': 'loyalty_points',
-                'points_used': points_used,
-                'points_value': points_value_amount,
-                'remaining_points': points_available - points_used
-            }
-            
-        except Exception as e:
-            logger.error(f"Error processing loyalty points payment: {e}")
+        if points_used > points_available:
             return {
                 'success': False,
-                'error': 'Loyalty points payment processing failed',
-                'error_message': str(e)
+                'error': 'Insufficient loyalty points',
+                'points_available': points_available,
+                'points_requested': points_used
             }
+        
+        points_value_amount = points_used * points_value
+        
+        return {
+            'success': True,
+            'payment_method': 'loyalty_points',
+            'points_used': points_used,
+            'points_value': points_value_amount,
+            'remaining_points': points_available - points_used
+        }
     
-    def get_payment_methods(self) -> List[Dict[str, Any]]:
+    def get_payment_methods(self) -> Sequence[Mapping[str, Any]]:
         """Get available payment methods"""
-        return [
-            {
-                'id': 'cash',
-                'name': 'Cash',
-                'description': 'Pay with cash',
-                'enabled': True
-            },
-            {
-                'id': 'card',
-                'name': 'Credit/Debit Card',
-                'description': 'Pay with card',
-                'enabled': True
-            },
-            {
-                'id': 'mobile',
-                'name': 'Mobile Payment',
-                'description': 'Pay with mobile wallet',
-                'enabled': True
-            },
-            {
-                'id': 'loyalty_points',
-                'name': 'Loyalty Points',
-                'description': 'Pay with loyalty points',
-                'enabled': True
-            }
-        ]
+        return PAYMENT_METHODS
     
-    def validate_payment_amount(self, amount: float) -> Dict[str, Any]:
+    @staticmethod
+    def validate_payment_amount(amount: float) -> Dict[str, Any]:
         """Validate payment amount"""
         if amount <= 0:
             return {
@@ -304,53 +524,38 @@ class PaymentService(BaseService):
             'amount': amount
         }
     
-    def calculate_tax(self, subtotal: float, tax_rate: float = 0.1) -> Dict[str, Any]:
+    @staticmethod
+    def calculate_tax(subtotal: float, tax_rate: float = 0.1) -> Dict[str, Any]:
         """Calculate tax amount"""
-        try:
-            tax_amount = subtotal * tax_rate
-            total_amount = subtotal + tax_amount
-            
-            return {
-                'subtotal': subtotal,
-                'tax_rate': tax_rate,
-                'tax_amount': tax_amount,
-                'total_amount': total_amount
-            }
-            
-        except Exception as e:
-            logger.error(f"Error calculating tax: {e}")
-            return {
-                'error': 'Tax calculation failed',
-                'error_message': str(e)
-            }
+        subtotal_cents = _to_cents(subtotal)
+        tax_cents = _apply_rate(subtotal_cents, tax_rate)
+        
+        return {
+            'subtotal': subtotal,
+            'tax_rate': tax_rate,
+            'tax_amount': tax_cents / 100,
+            'total_amount': (subtotal_cents + tax_cents) / 100
+        }
     
-    def calculate_discount(self, subtotal: float, discount_type: str, 
-                          discount_value: float) -> Dict[str, Any]:
+    @staticmethod
+    def calculate_discount(subtotal: float, discount_type: str, 
+                           discount_value: float) -> Dict[str, Any]:
         """Calculate discount amount"""
-        try:
-            if discount_type == 'percentage':
-                discount_amount = subtotal * (discount_value / 100)
-            elif discount_type == 'fixed':
-                discount_amount = min(discount_value, subtotal)  # Can't discount more than subtotal
-            else:
-                return {
-                    'error': 'Invalid discount type',
-                    'valid_types': ['percentage', 'fixed']
-                }
-            
-            discounted_amount = subtotal - discount_amount
-            
+        subtotal_cents = _to_cents(subtotal)
+        if discount_type == 'percentage':
+            discount_cents = _apply_rate(subtotal_cents, Decimal(str(discount_value)) / 100)
+        elif discount_type == 'fixed':
+            discount_cents = min(_to_cents(discount_value), subtotal_cents)  # Can't discount more than subtotal
+        else:
             return {
-                'subtotal': subtotal,
-                'discount_type': discount_type,
-                'discount_value': discount_value,
-                'discount_amount': discount_amount,
-                'discounted_amount': discounted_amount
-            }
-            
-        except Exception as e:
-            logger.error(f"Error calculating discount: {e}")
-            return {
-                'error': 'Discount calculation failed',
-                'error_message': str(e)
+                'error': 'Invalid discount type',
+                'valid_types': ['percentage', 'fixed']
             }
+        
+        return {
+            'subtotal': subtotal,
+            'discount_type': discount_type,
+            'discount_value': discount_value,
+            'discount_amount': discount_cents / 100,
+            'discounted_amount': (subtotal_cents - discount_cents) / 100
+        }
@@ -0,0 +1,89 @@
+"""
+Request-scoped batching loader for products
+"""
+
+from typing import Any, AsyncIterator, Dict, List, Optional
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select
+import asyncio
+import logging
+import uuid
+
+from models import Product
+from models.database import AsyncSessionLocal
+
+logger = logging.getLogger(__name__)
+
+class ProductLoader:
+    """Coalesce product lookups made in the same event loop tick into one query"""
+    
+    def __init__(self, db: AsyncSession):
+        self.db = db
+        self._cache: Dict[uuid.UUID, asyncio.Future] = {}
+        self._pending: Dict[uuid.UUID, asyncio.Future] = {}
+        self._dispatch_scheduled = False
+        # An AsyncSession runs one statement at a time, so batches take turns
+        self._session_lock = asyncio.Lock()
+        # Strong references to running batches (the loop only keeps weak ones)
+        self._batches: set[asyncio.Task] = set()
+    
+    def load(self, product_id: Any) -> asyncio.Future:
+        """Get a product by ID, batched with other loads in this tick"""
+        # Services pass string IDs; the identity map and results are keyed by UUID
+        product_id = uuid.UUID(str(product_id))
+        if product_id in self._cache:
+            return self._cache[product_id]
+        
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._cache[product_id] = future
+        self._pending[product_id] = future
+        
+        if not self._dispatch_scheduled:
+            self._dispatch_scheduled = True
+            loop.call_soon(self._start_batch)
+        return future
+    
+    async def load_many(self, product_ids: List[Any]) -> List[Optional[Product]]:
+        """Get several products by ID in a single batch"""
+        return list(await asyncio.gather(*(self.load(product_id) for product_id in product_ids)))
+    
+    def prime(self, product: Product) -> None:
+        """Seed the loader with an already loaded product"""
+        product_id = uuid.UUID(str(product.id))
+        if product_id not in self._cache:
+            future = asyncio.get_running_loop().create_future()
+            future.set_result(product)
+            self._cache[product_id] = future
+    
+    def _start_batch(self) -> None:
+        """Hand every key requested since the last dispatch to one batch query"""
+        pending, self._pending = self._pending, {}
+        self._dispatch_scheduled = False
+        
+        batch = asyncio.get_running_loop().create_task(self._dispatch(pending))
+        self._batches.add(batch)
+        batch.add_done_callback(self._batches.discard)
+    
+    async def _dispatch(self, pending: Dict[uuid.UUID, asyncio.Future]) -> None:
+        """Run one IN query for a batch of keys without blocking the event loop"""
+        try:
+            async with self._session_lock:
+                result = await self.db.execute(
+                    select(Product).where(Product.id.in_(list(pending)))
+                )
+            by_id = {product.id: product for product in result.scalars()}
+            for product_id, future in pending.items():
+                if not future.done():
+                    future.set_result(by_id.get(product_id))
+        except Exception as e:
+            logger.error(f"Error batch loading products: {e}")
+            for product_id, future in pending.items():
+                self._cache.pop(product_id, None)
+                if not future.done():
+                    future.set_exception(e)
+
+async def get_product_loader() -> AsyncIterator[ProductLoader]:
+    """Dependency providing one product loader per request"""
+    async with AsyncSessionLocal() as db:
+        yield ProductLoader(db)
@@ -2,33 +2,61 @@
 Sales and transaction management service
 """
 
-from typing import Dict, List, Any, Optional
-from sqlalchemy.orm import Session
-from sqlalchemy import and_, or_, desc, func
-from datetime import datetime, timedelta
+from typing import Dict, Iterator, List, Any, Optional
+from sqlalchemy.orm import Session, selectinload, joinedload, raiseload
+from sqlalchemy import and_, or_, desc, func, case, insert, select, cast, String, text
+from datetime import datetime, timedelta, date as date_type
+import os
+import time
 import uuid
 import logging
 
-from models import SalesTransaction, SaleItem, Customer, Staff, Product, DailySalesSummary
+from models import SalesTransaction, SaleItem, Customer, Staff, Product, DailySalesSummary, DailySalesDelta
 from .base_service import BaseService
 
 logger = logging.getLogger(__name__)
 
+# Everything a receipt needs; any other relationship access raises instead
+# of silently issuing a lazy load
+RECEIPT_LOAD_OPTIONS = (
+    selectinload(SalesTransaction.items).joinedload(SaleItem.product),
+    joinedload(SalesTransaction.customer),
+    joinedload(SalesTransaction.cashier),
+    raiseload("*"),
+)
+
+# Dashboard polls of a day's summary: date -> (expires_at, row). Rows are kept
+# detached and merged into the caller's session without a query. The table
+# trails sales by up to a minute (the delta fold interval), so a hit is at most
+# that plus SUMMARY_CACHE_TTL seconds behind.
+SUMMARY_CACHE_TTL = int(os.getenv("SUMMARY_CACHE_TTL", "60"))
+_summary_cache: Dict[date_type, tuple] = {}
+
+# Sales history reads item columns only, so the per-item product join is skipped
+HISTORY_LOAD_OPTIONS = (
+    selectinload(SalesTransaction.items).raiseload("*"),
+    raiseload("*"),
+)
+
 class SalesService(BaseService):
     """Service for sales and transaction operations"""
     
     def __init__(self, db: Session):
         super().__init__(db)
     
-    def create_transaction(self, transaction_data: Dict[str, Any]) -> SalesTransaction:
-        """Create a new sales transaction"""
-        # Generate transaction number
-        transaction_count = self.db.query(SalesTransaction).count() + 1
-        transaction_number = f"TXN-{datetime.now().strftime('%Y%m%d')}-{transaction_count:06d}"
-        
-        # Create transaction
+    def _save(self, obj: Any, commit: bool) -> None:
+        """Commit and reload, or only flush when the caller batches several writes"""
+        if commit:
+            self.db.commit()
+            self.db.refresh(obj)
+        else:
+            self.db.flush()
+    
+    def create_transaction(self, transaction_data: Dict[str, Any],
+                           commit: bool = True) -> SalesTransaction:
+        """Create a new sales transaction (commit=False leaves the transaction open)"""
+        # transaction_number is assigned by the database sequence
         transaction = SalesTransaction(
-            transaction_number=transaction_number,
             customer_id=transaction_data.get('customer_id'),
             cashier_id=transaction_data.get('cashier_id'),
             subtotal=transaction_data.get('subtotal', 0),
@@ -45,37 +73,42 @@ class SalesService(BaseService):
         self.db.add(transaction)
         self.db.flush()  # Get the ID
         
-        # Create sale items
-        for item_data in transaction_data.get('items', []):
-            sale_item = SaleItem(
-                transaction_id=transaction.id,
-                product_id=item_data['product_id'],
-                quantity=item_data['quantity'],
-                unit_price=item_data['unit_price'],
-                discount_amount=item_data.get('discount_amount', 0),
-                line_total=item_data['line_total'],
-                batch_number=item_data.get('batch_number'),
-                expiry_date=item_data.get('expiry_date')
-            )
-            self.db.add(sale_item)
+        # Create sale items in one executemany
+        items = transaction_data.get('items', [])
+        if items:
+            self.db.execute(insert(SaleItem), [
+                {
+                    "transaction_id": transaction.id,
+                    "product_id": item_data['product_id'],
+                    "quantity": item_data['quantity'],
+                    "unit_price": item_data['unit_price'],
+                    "discount_amount": item_data.get('discount_amount', 0),
+                    "batch_number": item_data.get('batch_number'),
+                    "expiry_date": item_data.get('expiry_date')
+                }
+                for item_data in items
+            ])
         
-        self.db.commit()
-        self.db.refresh(transaction)
+        self._save(transaction, commit)
         return transaction
     
     def get_transaction_by_id(self, transaction_id: str) -> Optional[SalesTransaction]:
         """Get transaction by ID"""
-        return self.db.query(SalesTransaction).filter(SalesTransaction.id == transaction_id).first()
+        return self.db.query(SalesTransaction).options(*RECEIPT_LOAD_OPTIONS).filter(
+            SalesTransaction.id == transaction_id
+        ).first()
     
     def get_transaction_by_number(self, transaction_number: str) -> Optional[SalesTransaction]:
         """Get transaction by transaction number"""
-        return self.db.query(SalesTransaction).filter(
+        return self.db.query(SalesTransaction).options(*RECEIPT_LOAD_OPTIONS).filter(
             SalesTransaction.transaction_number == transaction_number
         ).first()
     
     def get_transaction_items(self, transaction_id: str) -> List[SaleItem]:
         """Get items for a transaction"""
-        return self.db.query(SaleItem).filter(SaleItem.transaction_id == transaction_id).all()
+        return self.db.query(SaleItem).options(
+            joinedload(SaleItem.product), raiseload("*")
+        ).filter(SaleItem.transaction_id == transaction_id).all()
     
     def update_transaction_status(self, transaction_id: str, status: str) -> bool:
         """Update transaction payment status"""
@@ -87,8 +120,8 @@ class SalesService(BaseService):
         return False
     
     def process_return(self, original_transaction_id: str, return_items: List[Dict[str, Any]], 
-                     cashier_id: str) -> Optional[SalesTransaction]:
-        """Process a return transaction"""
+                     cashier_id: str, commit: bool = True) -> Optional[SalesTransaction]:
+        """Process a return transaction (commit=False leaves the transaction open)"""
         try:
             original_transaction = self.get_transaction_by_id(original_transaction_id)
             if not original_transaction:
@@ -99,52 +132,55 @@ class SalesService(BaseService):
             return_tax = return_subtotal * 0.1  # 10% tax
             return_total = return_subtotal + return_tax
             
-            # Create return transaction
-            return_transaction = SalesTransaction(
-                transaction_number=f"RET-{original_transaction.transaction_number}",
-                customer_id=original_transaction.customer_id,
-                cashier_id=cashier_id,
-                subtotal=-return_subtotal,  # Negative for return
-                tax_amount=-return_tax,
-                discount_amount=0,
-                total_amount=-return_total,
-                payment_method=original_transaction.payment_method,
-                payment_status='completed',
-                pos_terminal_id=original_transaction.pos_terminal_id,
-                is_return=True,
-                original_transaction_id=original_transaction_id
-            )
-            
-            self.db.add(return_transaction)
-            self.db.flush()
-            
-            # Create return items
-            for item_data in return_items:
-                return_item = SaleItem(
-                    transaction_id=return_transaction.id,
-                    product_id=item_data['product_id'],
-                    quantity=-item_data['quantity'],  # Negative for return
-                    unit_price=item_data['unit_price'],
+            with self.write_scope(commit):
+                # Create return transaction
+                return_transaction = SalesTransaction(
+                    transaction_number=f"RET-{original_transaction.transaction_number}",
+                    customer_id=original_transaction.customer_id,
+                    cashier_id=cashier_id,
+                    subtotal=-return_subtotal,  # Negative for return
+                    tax_amount=-return_tax,
                     discount_amount=0,
-                    line_total=-item_data['line_total'],
-                    batch_number=item_data.get('batch_number'),
-                    expiry_date=item_data.get('expiry_date')
+                    total_amount=-return_total,
+                    payment_method=original_transaction.payment_method,
+                    payment_status='completed',
+                    pos_terminal_id=original_transaction.pos_terminal_id,
+                    is_return=True,
+                    original_transaction_id=original_transaction_id
                 )
-                self.db.add(return_item)
+                
+                self.db.add(return_transaction)
+                self.db.flush()
+                
+                # Create return items in one executemany
+                if return_items:
+                    self.db.execute(insert(SaleItem), [
+                        {
+                            "transaction_id": return_transaction.id,
+                            "product_id": item_data['product_id'],
+                            "quantity": -item_data['quantity'],  # Negative for return
+                            "unit_price": item_data['unit_price'],
+                            "discount_amount": 0,
+                            "batch_number": item_data.get('batch_number'),
+                            "expiry_date": item_data.get('expiry_date')
+                        }
+                        for item_data in return_items
+                    ])
             
-            self.db.commit()
-            self.db.refresh(return_transaction)
+            self._save(return_transaction, commit)
             return return_transaction
             
         except Exception as e:
             logger.error(f"Error processing return: {e}")
-            self.db.rollback()
+            # A batched write has already undone its own savepoint
+            if commit:
+                self.db.rollback()
             return None
     
     def get_transactions_by_date_range(self, start_date: datetime, end_date: datetime, 
                                      skip: int = 0, limit: int = 100) -> List[SalesTransaction]:
         """Get transactions within date range"""
-        return self.db.query(SalesTransaction).filter(
+        return self.db.query(SalesTransaction).options(raiseload("*")).filter(
             and_(
                 SalesTransaction.transaction_date >= start_date,
                 SalesTransaction.transaction_date <= end_date,
@@ -153,9 +189,11 @@ class SalesService(BaseService):
         ).order_by(desc(SalesTransaction.transaction_date)).offset(skip).limit(limit).all()
     
     def get_transactions_by_customer(self, customer_id: str, 
-                                   skip: int = 0, limit: int = 100) -> List[SalesTransaction]:
-        """Get transactions for a specific customer"""
-        return self.db.query(SalesTransaction).filter(
+                                   skip: int = 0, limit: int = 100,
+                                   with_items: bool = False) -> List[SalesTransaction]:
+        """Get transactions for a specific customer (with_items loads their items in one query)"""
+        options = HISTORY_LOAD_OPTIONS if with_items else (raiseload("*"),)
+        return self.db.query(SalesTransaction).options(*options).filter(
             and_(
                 SalesTransaction.customer_id == customer_id,
                 SalesTransaction.is_return == False
@@ -164,44 +202,108 @@ class SalesService(BaseService):
     
     def get_daily_sales_summary(self, date: datetime) -> Optional[DailySalesSummary]:
         """Get daily sales summary for a specific date"""
-        return self.db.query(DailySalesSummary).filter(
-            DailySalesSummary.date == date.date()
-        ).first()
+        entry = _summary_cache.get(date.date())
+        if not entry or entry[0] <= time.monotonic():
+            summary = self.db.query(DailySalesSummary).filter(
+                DailySalesSummary.date == date.date()
+            ).first()
+            if not summary:
+                return None
+            self.db.expunge(summary)
+            entry = (time.monotonic() + SUMMARY_CACHE_TTL, summary)
+            _summary_cache[date.date()] = entry
+        return self.db.merge(entry[1], load=False)
+    
+    def _sales_in_range(self, start_date: datetime, end_date: datetime):
+        """Filter for non-return transactions within a date range"""
+        return and_(
+            SalesTransaction.transaction_date.between(start_date, end_date),
+            SalesTransaction.is_return == False
+        )
+    
+    def _product_sales_query(self, start_date: datetime, end_date: datetime):
+        """Per-product quantity and revenue totals for a date range"""
+        return self.db.query(
+            SaleItem.product_id,
+            func.sum(SaleItem.quantity).label('quantity'),
+            func.sum(SaleItem.line_total).label('revenue')
+        ).join(SalesTransaction, SaleItem.transaction_id == SalesTransaction.id).filter(
+            self._sales_in_range(start_date, end_date)
+        ).group_by(SaleItem.product_id)
+    
+    def refresh_top_selling_product(self, date: datetime) -> bool:
+        """Fill in the top-selling product on the trigger-maintained summary row"""
+        try:
+            start_datetime = datetime.combine(date.date(), datetime.min.time())
+            end_datetime = datetime.combine(date.date(), datetime.max.time())
+            
+            top_product = self._product_sales_query(start_datetime, end_datetime).order_by(
+                desc(func.sum(SaleItem.quantity))
+            ).limit(1).first()
+            self.db.query(DailySalesSummary).filter(
+                DailySalesSummary.date == date.date()
+            ).update(
+                {DailySalesSummary.top_selling_product_id: top_product.product_id if top_product else None},
+                synchronize_session=False
+            )
+            self.db.commit()
+            _summary_cache.pop(date.date(), None)
+            return True
+        except Exception as e:
+            logger.error(f"Error refreshing top-selling product: {e}")
+            self.db.rollback()
+            return False
     
     def generate_daily_sales_summary(self, date: datetime) -> DailySalesSummary:
-        """Generate daily sales summary for a specific date"""
-        # Get transactions for the date
+        """Recompute a day's summary from raw transactions (reconciliation)"""
         start_datetime = datetime.combine(date.date(), datetime.min.time())
         end_datetime = datetime.combine(date.date(), datetime.max.time())
+        in_range = self._sales_in_range(start_datetime, end_datetime)
         
-        transactions = self.get_transactions_by_date_range(start_datetime, end_datetime)
+        # The recompute already counts every committed sale and return, so the
+        # day's pending deltas are discarded. Blocking delta appends until commit
+        # keeps sales from landing in both (waits for in-flight checkouts).
+        if self.db.get_bind().dialect.name == "postgresql":
+            self.db.execute(text("LOCK TABLE daily_sales_deltas IN SHARE ROW EXCLUSIVE MODE"))
+        self.db.query(DailySalesDelta).filter(
+            DailySalesDelta.date == date.date()
+        ).delete(synchronize_session=False)
         
-        # Calculate summary statistics
-        total_transactions = len(transactions)
-        total_revenue = sum(t.total_amount for t in transactions)
-        total_items_sold = sum(
-            sum(item.quantity for item in self.get_transaction_items(t.id)) 
-            for t in transactions
-        )
+        # Transaction counts, revenue and payment breakdown in one pass
+        totals = self.db.query(
+            func.count(SalesTransaction.id),
+            func.coalesce(func.sum(SalesTransaction.total_amount), 0),
+            func.coalesce(func.sum(case(
+                (SalesTransaction.payment_method == 'cash', SalesTransaction.total_amount), else_=0
+            )), 0),
+            func.coalesce(func.sum(case(
+                (SalesTransaction.payment_method == 'card', SalesTransaction.total_amount), else_=0
+            )), 0)
+        ).filter(in_range).one()
+        total_transactions, total_revenue, cash_sales, card_sales = totals
         average_transaction_value = total_revenue / total_transactions if total_transactions > 0 else 0
         
-        # Calculate payment method breakdown
-        cash_sales = sum(t.total_amount for t in transactions if t.payment_method == 'cash')
-        card_sales = sum(t.total_amount for t in transactions if t.payment_method == 'card')
+        # Returns are excluded above; the triggers record them as positive amounts
+        returns_amount = self.db.query(
+            func.coalesce(func.sum(func.abs(SalesTransaction.total_amount)), 0)
+        ).filter(
+            SalesTransaction.transaction_date.between(start_datetime, end_datetime),
+            SalesTransaction.is_return == True
+        ).scalar()
         
-        # Get top selling product
-        product_sales = {}
-        for transaction in transactions:
-            for item in self.get_transaction_items(transaction.id):
-                if item.product_id in product_sales:
-                    product_sales[item.product_id] += item.quantity
-                else:
-                    product_sales[item.product_id] = item.quantity
+        total_items_sold = self.db.query(
+            func.coalesce(func.sum(SaleItem.quantity), 0)
+        ).join(SalesTransaction, SaleItem.transaction_id == SalesTransaction.id).filter(in_range).scalar()
         
-        top_selling_product_id = max(product_sales.items(), key=lambda x: x[1])[0] if product_sales else None
+        top_product = self._product_sales_query(start_datetime, end_datetime).order_by(
+            desc(func.sum(SaleItem.quantity))
+        ).limit(1).first()
+        top_selling_product_id = top_product.product_id if top_product else None
         
-        # Create or update summary
-        summary = self.get_daily_sales_summary(date)
+        # Create or update summary (read past the cache, which is invalidated below)
+        summary = self.db.query(DailySalesSummary).filter(
+            DailySalesSummary.date == date.date()
+        ).first()
         if summary:
             summary.total_transactions = total_transactions
             summary.total_revenue = total_revenue
@@ -210,6 +312,7 @@ class SalesService(BaseService):
             summary.top_selling_product_id = top_selling_product_id
             summary.cash_sales = cash_sales
             summary.card_sales = card_sales
+            summary.returns_amount = returns_amount
         else:
             summary = DailySalesSummary(
                 date=date.date(),
@@ -219,46 +322,36 @@ class SalesService(BaseService):
                 average_transaction_value=average_transaction_value,
                 top_selling_product_id=top_selling_product_id,
                 cash_sales=cash_sales,
-                card_sales=card_sales
+                card_sales=card_sales,
+                returns_amount=returns_amount
             )
             self.db.add(summary)
         
         self.db.commit()
         self.db.refresh(summary)
+        _summary_cache.pop(date.date(), None)
         return summary
     
     def get_sales_analytics(self, start_date: datetime, end_date: datetime) -> Dict[str, Any]:
         """Get sales analytics for date range"""
-        transactions = self.get_transactions_by_date_range(start_date, end_date)
+        # Payment method breakdown; totals are derived from it
+        # payment_method is a native enum; 'unknown' is not one of its labels
+        method = func.coalesce(cast(SalesTransaction.payment_method, String), 'unknown')
+        method_rows = self.db.query(
+            method, func.count(SalesTransaction.id), func.sum(SalesTransaction.total_amount)
+        ).filter(self._sales_in_range(start_date, end_date)).group_by(method).all()
         
-        # Calculate metrics
-        total_revenue = sum(t.total_amount for t in transactions)
-        total_transactions = len(transactions)
+        payment_methods = {name: amount for name, _, amount in method_rows}
+        total_revenue = sum(payment_methods.values())
+        total_transactions = sum(count for _, count, _ in method_rows)
         average_transaction_value = total_revenue / total_transactions if total_transactions > 0 else 0
         
-        # Payment method breakdown
-        payment_methods = {}
-        for transaction in transactions:
-            method = transaction.payment_method or 'unknown'
-            if method in payment_methods:
-                payment_methods[method] += transaction.total_amount
-            else:
-                payment_methods[method] = transaction.total_amount
-        
         # Top products
-        product_sales = {}
-        for transaction in transactions:
-            for item in self.get_transaction_items(transaction.id):
-                if item.product_id in product_sales:
-                    product_sales[item.product_id]['quantity'] += item.quantity
-                    product_sales[item.product_id]['revenue'] += item.line_total
-                else:
-                    product_sales[item.product_id] = {
-                        'quantity': item.quantity,
-                        'revenue': item.line_total
-                    }
-        
-        top_products = sorted(product_sales.items(), key=lambda x: x[1]['revenue'], reverse=True)[:10]
+        revenue = func.sum(SaleItem.line_total)
+        top_products = [
+            (row.product_id, {'quantity': row.quantity, 'revenue': row.revenue})
+            for row in self._product_sales_query(start_date, end_date).order_by(desc(revenue)).limit(10)
+        ]
         
         return {
             'total_revenue': float(total_revenue),
@@ -272,30 +365,41 @@ class SalesService(BaseService):
             }
         }
     
+    @staticmethod
+    def _history_entry(transaction: SalesTransaction) -> Dict[str, Any]:
+        """Sales history record for one transaction and its items"""
+        return {
+            'transaction': {
+                'id': str(transaction.id),
+                'transaction_number': transaction.transaction_number,
+                'date': transaction.transaction_date.isoformat(),
+                'total_amount': float(transaction.total_amount),
+                'payment_method': transaction.payment_method
+            },
+            'items': [
+                {
+                    'product_id': str(item.product_id),
+                    'quantity': item.quantity,
+                    'unit_price': float(item.unit_price),
+                    'line_total': float(item.line_total)
+                }
+                for item in transaction.items
+            ]
+        }
+    
     def get_customer_sales_history(self, customer_id: str, limit: int = 50) -> List[Dict[str, Any]]:
         """Get customer sales history with product details"""
-        transactions = self.get_transactions_by_customer(customer_id, limit=limit)
-        
-        history = []
+        transactions = self.get_transactions_by_customer(customer_id, limit=limit, with_items=True)
+        return [self._history_entry(transaction) for transaction in transactions]
+    
+    def iter_customer_sales_history(self, customer_id: str, batch_size: int = 200) -> Iterator[Dict[str, Any]]:
+        """Stream a customer's full sales history in server-side batches (exports)"""
+        transactions = self.db.execute(
+            select(SalesTransaction).options(*HISTORY_LOAD_OPTIONS).where(
+                SalesTransaction.customer_id == customer_id,
+                SalesTransaction.is_return == False
+            ).order_by(desc(SalesTransaction.transaction_date))
+            .execution_options(yield_per=batch_size)
+        ).scalars()
         for transaction in transactions:
-            items = self.get_transaction_items(transaction.id)
-            history.append({
-                'transaction': {
-                    'id': str(transaction.id),
-                    'transaction_number': transaction.transaction_number,
-                    'date': transaction.transaction_date.isoformat(),
-                    'total_amount': float(transaction.total_amount),
-                    'payment_method': transaction.payment_method
-                },
-                'items': [
-                    {
-                        'product_id': str(item.product_id),
-                        'quantity': item.quantity,
-                        'unit_price': float(item.unit_price),
-                        'line_total': float(item.line_total)
-                    }
-                    for item in items
-                ]
-            })
-        
-        return history
+            yield self._history_entry(transaction)
@@ -0,0 +1,11 @@
+"""
+Shared pytest configuration
+"""
+
+import os
+import sys
+
+# Models are importable without a PostgreSQL server; tests that need one
+# compile against the postgresql dialect instead of executing
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
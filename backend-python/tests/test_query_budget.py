@@ -0,0 +1,66 @@
+"""
+Query budgets for hot read paths
+"""
+
+import uuid
+from decimal import Decimal
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+from sqlalchemy.pool import StaticPool
+from sqlalchemy.schema import CreateTable
+
+from models import Base, Category, Customer, Product, SaleItem, SalesTransaction, Staff
+from models.database import count_queries
+
+sales_service = pytest.importorskip("services.sales_service")
+
+# Tables the receipt lookup touches. Created without indexes: several are
+# PostgreSQL-only (GIN, expression) and the budget doesn't depend on them.
+RECEIPT_TABLES = ("categories", "products", "customers", "staff", "sales_transactions", "sale_items")
+
+@pytest.fixture
+def db():
+    engine = create_engine("sqlite://", poolclass=StaticPool)
+    with engine.begin() as connection:
+        for name in RECEIPT_TABLES:
+            connection.execute(CreateTable(Base.metadata.tables[name]))
+    with Session(engine) as session:
+        yield session
+
+def _receipt(db, item_count: int) -> str:
+    """Store a sale with item_count lines, each for a different product"""
+    category = Category(id=uuid.uuid4(), name="Dairy")
+    customer = Customer(id=uuid.uuid4(), first_name="Ada", last_name="Lovelace")
+    cashier = Staff(id=uuid.uuid4(), first_name="Till", last_name="One")
+    transaction = SalesTransaction(
+        id=1, public_id=uuid.uuid4(), transaction_number="TXN-1",
+        customer=customer, cashier=cashier, subtotal=Decimal("10.00"),
+        total_amount=Decimal("10.00"), payment_method="cash"
+    )
+    for i in range(item_count):
+        product = Product(id=uuid.uuid4(), barcode=f"400000000{i}", name=f"Milk {i}",
+                          category=category, selling_price=Decimal("1.00"))
+        transaction.items.append(SaleItem(
+            id=i + 1, product=product, quantity=1, unit_price=Decimal("1.00")
+        ))
+    db.add(transaction)
+    db.commit()
+    # Start the lookup from an empty identity map, as a fresh request would
+    db.expunge_all()
+    return "TXN-1"
+
+@pytest.mark.parametrize("item_count", [1, 20])
+def test_receipt_lookup_query_budget(db, item_count):
+    """A receipt costs the same two queries however many lines it has"""
+    number = _receipt(db, item_count)
+    
+    with count_queries(db.get_bind()) as statements:
+        transaction = sales_service.SalesService(db).get_transaction_by_number(number)
+        lines = [(item.product.name, item.line_total) for item in transaction.items]
+        names = (transaction.customer.first_name, transaction.cashier.first_name)
+    
+    assert len(lines) == item_count
+    assert names == ("Ada", "Till")
+    assert len(statements) == 2, statements
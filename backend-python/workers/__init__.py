@@ -0,0 +1,9 @@
+"""
+Background workers package
+"""
+
+from .celery_worker import celery_app
+
+__all__ = [
+    "celery_app"
+]
@@ -0,0 +1,92 @@
+"""
+Celery worker for background tasks
+"""
+
+from typing import Any, Dict, List, Optional
+from datetime import datetime
+import os
+import logging
+
+from celery import Celery
+from celery.schedules import crontab
+
+logger = logging.getLogger(__name__)
+
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379")
+
+celery_app = Celery("grocery_workers", broker=REDIS_URL, backend=REDIS_URL)
+celery_app.conf.update(
+    task_serializer="json",
+    result_serializer="json",
+    accept_content=["json"],
+    result_expires=3600,
+    # Sends are slow I/O; don't let one worker hoard a backlog of them
+    worker_prefetch_multiplier=1,
+    task_acks_late=True,
+    # Sales triggers append to daily_sales_deltas; folding them every minute
+    # keeps daily_sales_summary current. The top seller can't be maintained
+    # incrementally, so it is refreshed hourly. The dashboard inventory rollup
+    # is refreshed every five minutes, so sales show up in it within that.
+    beat_schedule={
+        "fold-daily-sales-deltas": {
+            "task": "sales.fold_daily_deltas",
+            "schedule": crontab(),
+        },
+        "refresh-daily-sales-summary": {
+            "task": "sales.refresh_daily_summary",
+            "schedule": crontab(minute=0),
+        },
+        "refresh-inventory-rollup": {
+            "task": "inventory.refresh_rollup",
+            "schedule": crontab(minute="*/5"),
+        },
+    },
+)
+
+@celery_app.task(name="notifications.send_emails")
+def send_emails_task(to_emails: List[str], subject: str, body: str,
+                     is_html: bool = False) -> List[Dict[str, Any]]:
+    """Deliver one batch of emails over a single SMTP connection"""
+    # Imported here: the notification service imports this module to enqueue
+    from services.notification_service import NotificationService
+    
+    # Email delivery doesn't touch the database
+    return NotificationService(db=None).send_emails(to_emails, subject, body, is_html=is_html)
+
+@celery_app.task(name="sales.refresh_daily_summary")
+def refresh_daily_summary_task(date: Optional[str] = None) -> bool:
+    """Refresh the top-selling product for a day (default today)"""
+    from models.database import SessionLocal
+    from services.sales_service import SalesService
+    
+    day = datetime.fromisoformat(date) if date else datetime.now()
+    db = SessionLocal()
+    try:
+        return SalesService(db).refresh_top_selling_product(day)
+    finally:
+        db.close()
+
+@celery_app.task(name="sales.fold_daily_deltas")
+def fold_daily_deltas_task() -> int:
+    """Fold pending sales deltas into daily_sales_summary"""
+    from models.database import fold_daily_sales_deltas
+    
+    return fold_daily_sales_deltas()
+
+@celery_app.task(name="inventory.refresh_rollup")
+def refresh_inventory_rollup_task() -> bool:
+    """Refresh the dashboard inventory rollup"""
+    from models.database import refresh_inventory_rollup
+    
+    return refresh_inventory_rollup()
+
+def main():
+    """Run a Celery worker (grocery-worker entry point)"""
+    celery_app.worker_main(["worker", "--loglevel=info"])
+
+def beat():
+    """Run the Celery beat scheduler (grocery-scheduler entry point)"""
+    celery_app.start(["beat", "--loglevel=info"])
+
+if __name__ == "__main__":
+    main()